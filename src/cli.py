@@ -0,0 +1,86 @@
+import argparse
+import sys
+from core.control_client import ControlClient
+from core.control_server import default_control_address
+from core.settings_manager import SettingsManager
+from utils.live_aggregator import format_snapshot
+
+
+def format_time(time_left, is_work_session):
+    minutes, seconds = divmod(time_left, 60)
+    session = "作業セッション" if is_work_session else "休憩セッション"
+    return f"{minutes:02d}:{seconds:02d} {session}"
+
+
+def format_status(status):
+    if not status['running']:
+        state = "停止中"
+    elif status['paused']:
+        state = "一時停止中"
+    else:
+        state = "実行中"
+    return f"{format_time(status['time_left'], status['is_work_session'])} ({state})"
+
+
+def run_command(client, args):
+    print(format_status(client.request(args.command)))
+
+
+def live(client, args):
+    print(format_snapshot(client.request('snapshot')))
+
+
+def hooks(client, args):
+    stats = client.request('hook_stats')
+    if not stats:
+        print("フックは登録されていません")
+        return
+    for name, s in stats.items():
+        avg = f"{s['avg_ms']:.0f}ms" if s['avg_ms'] is not None else "-"
+        print(f"{name}: 実行 {s['calls']} 回 (平均 {avg}, 最大 {s['max_ms']:.0f}ms), 失敗 {s['failures']}, "
+              f"タイムアウト {s['timeouts']}, 破棄 {s['dropped']}, スキップ {s['skipped']}")
+
+
+def watch(client, args):
+    try:
+        for event in client.subscribe(on_connect=lambda conn, status: print(format_status(status))):
+            if event['event'] == 'tick':
+                if not args.quiet:
+                    print(format_time(event['time_left'], event['is_work_session']))
+            elif event['event'] == 'session_end':
+                print(f"セッションが切り替わりました: {format_status(event)}")
+            else:
+                print(format_status(event))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ポモドーロデーモンの操作")
+    parser.add_argument('--address', default=None, help="デーモンの制御ソケット（名前付きパイプ）")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for command, help_text in (('start', "タイマーを開始する"), ('pause', "一時停止する"),
+                               ('resume', "再開する"), ('toggle', "開始・一時停止・再開を切り替える"),
+                               ('reset', "タイマーをリセットする"), ('status', "現在の状態を表示する"),
+                               ('reload-settings', "設定ファイルを読み直す")):
+        subparsers.add_parser(command, help=help_text).set_defaults(func=run_command)
+
+    subparsers.add_parser('live', help="現在のセッションのアプリ別・ウィンドウ別の合計を表示する").set_defaults(func=live)
+    subparsers.add_parser('hooks', help="セッションフックの実行回数と実行時間を表示する").set_defaults(func=hooks)
+
+    watch_parser = subparsers.add_parser('watch', help="状態の変化を表示し続ける")
+    watch_parser.add_argument('--quiet', action='store_true', help="毎秒の残り時間を表示しない")
+    watch_parser.set_defaults(func=watch)
+
+    args = parser.parse_args()
+    args.command = args.command.replace('-', '_')
+    client = ControlClient(args.address or default_control_address(SettingsManager()))
+    try:
+        args.func(client, args)
+    except (OSError, EOFError) as e:
+        print(f"デーモンに接続できません（{client.address}）: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import logging
+import threading
+from multiprocessing.connection import Client
+from core.control_server import control_family, default_control_address, encode_message, decode_message
+
+
+class ControlClient:
+    # デーモンの ControlServer に JSON のコマンドを送る
+    def __init__(self, address=None):
+        self.address = address or default_control_address()
+        self.family = control_family()
+
+    def connect(self):
+        return Client(self.address, family=self.family)
+
+    def is_available(self):
+        try:
+            self.request('status')
+            return True
+        except (OSError, EOFError):
+            return False
+
+    def request(self, command):
+        conn = self.connect()
+        try:
+            conn.send_bytes(encode_message({'command': command}))
+            response = decode_message(conn.recv_bytes())
+        finally:
+            conn.close()
+        if not response.get('ok'):
+            raise RuntimeError(response.get('error'))
+        return response['result']
+
+    def subscribe(self, on_connect=None):
+        # 最初の応答で現在の状態を受け取り、以降はイベントを1件ずつ返す
+        conn = self.connect()
+        try:
+            conn.send_bytes(encode_message({'command': 'subscribe'}))
+            response = decode_message(conn.recv_bytes())
+            if on_connect is not None:
+                on_connect(conn, response['result'])
+            while True:
+                yield decode_message(conn.recv_bytes())
+        finally:
+            conn.close()
+
+
+class RemotePomodoroService:
+    # PomodoroService と同じ操作をデーモンへの IPC で行う。GUI はどちらでも同じように扱える
+    def __init__(self, client, reconnect_interval=2):
+        self.client = client
+        self.reconnect_interval = reconnect_interval
+        self.state = client.request('status')
+        self.state_lock = threading.Lock()
+        self.listeners = []
+        self.listeners_lock = threading.Lock()
+        self.conn = None
+        self.stop_event = threading.Event()
+        self.logger = logging.getLogger(__name__)
+        self.thread = threading.Thread(target=self._run_subscription, name='control-subscribe', daemon=True)
+        self.thread.start()
+
+    def add_listener(self, listener):
+        with self.listeners_lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.listeners_lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def notify(self, event):
+        with self.listeners_lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                self.logger.error(f"Error in service listener: {e}")
+
+    def status(self):
+        with self.state_lock:
+            return dict(self.state)
+
+    def update_state(self, state):
+        with self.state_lock:
+            self.state.update(state)
+            return dict(self.state)
+
+    def command(self, name):
+        state = self.update_state(self.client.request(name))
+        self.notify({'event': 'state', **state})
+        return state
+
+    def start(self):
+        return self.command('start')
+
+    def pause(self):
+        return self.command('pause')
+
+    def resume(self):
+        return self.command('resume')
+
+    def toggle(self):
+        return self.command('toggle')
+
+    def reset(self):
+        return self.command('reset')
+
+    def reload_settings(self):
+        # 設定ファイルはデーモンと共有しているので、保存後に読み直しを依頼する
+        return self.command('reload_settings')
+
+    def snapshot(self):
+        return self.client.request('snapshot')
+
+    def hook_stats(self):
+        return self.client.request('hook_stats')
+
+    def _on_connect(self, conn, state):
+        self.conn = conn
+        state = self.update_state(state)
+        self.notify({'event': 'state', **state})
+
+    def _run_subscription(self):
+        while not self.stop_event.is_set():
+            try:
+                for event in self.client.subscribe(on_connect=self._on_connect):
+                    fields = {key: value for key, value in event.items() if key != 'event'}
+                    self.notify({'event': event['event'], **self.update_state(fields)})
+            except (OSError, EOFError) as e:
+                if not self.stop_event.is_set():
+                    self.logger.warning(f"Lost connection to pomodoro daemon: {e}")
+            self.conn = None
+            self.stop_event.wait(self.reconnect_interval)
+
+    def shutdown(self):
+        self.stop_event.set()
+        conn = self.conn
+        if conn is not None:
+            conn.close()
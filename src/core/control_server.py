@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from multiprocessing.connection import Listener, Client
+
+# 購読者ごとに溜めておけるイベント数。読み出しが追いつかない購読者の分は古いものから捨てる
+SUBSCRIBER_QUEUE_SIZE = 64
+
+COMMANDS = ('start', 'pause', 'resume', 'toggle', 'reset', 'status', 'reload_settings', 'snapshot', 'hook_stats')
+
+
+def control_family():
+    return 'AF_PIPE' if sys.platform == 'win32' else 'AF_UNIX'
+
+
+def default_control_address(settings_manager=None):
+    # Windows では名前付きパイプ、それ以外では data/ 以下の Unix ドメインソケットを使う
+    if settings_manager is not None and settings_manager.get_setting('control_address'):
+        return settings_manager.get_setting('control_address')
+    if sys.platform == 'win32':
+        return r'\\.\pipe\pomodoro_with_claude'
+    return os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'pomodoro.sock')
+
+
+def encode_message(message):
+    return json.dumps(message, ensure_ascii=False).encode('utf-8')
+
+
+def decode_message(data):
+    return json.loads(data.decode('utf-8'))
+
+
+class ControlServer:
+    # PomodoroService をローカルの IPC から操作できるようにする（1接続1スレッド、1リクエスト1レスポンス）
+    def __init__(self, service, address=None):
+        self.service = service
+        self.address = address or default_control_address()
+        self.family = control_family()
+        self.listener = None
+        self.thread = None
+        self.stopping = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        if self.family == 'AF_UNIX':
+            os.makedirs(os.path.dirname(os.path.abspath(self.address)), exist_ok=True)
+            if os.path.exists(self.address):
+                os.unlink(self.address)  # 前回異常終了したときのソケットファイルを消す
+        self.listener = Listener(self.address, family=self.family)
+        if self.family == 'AF_UNIX':
+            os.chmod(self.address, 0o600)  # 同じユーザーからしか操作できないようにする
+        self.thread = threading.Thread(target=self._accept_loop, name='control-accept', daemon=True)
+        self.thread.start()
+        self.logger.info(f"Control server listening on {self.address}")
+
+    def stop(self):
+        self.stopping.set()
+        if self.listener is None:
+            return
+        try:
+            # accept() で待っているスレッドを起こすため自分自身に接続する
+            Client(self.address, family=self.family).close()
+        except OSError:
+            pass
+        self.thread.join(timeout=1)
+        self.listener.close()
+        self.listener = None
+
+    def _accept_loop(self):
+        while not self.stopping.is_set():
+            try:
+                conn = self.listener.accept()
+            except OSError as e:
+                if not self.stopping.is_set():
+                    self.logger.error(f"Error accepting control connection: {e}")
+                continue
+            if self.stopping.is_set():
+                conn.close()
+                break
+            threading.Thread(target=self._handle, args=(conn,), name='control-conn', daemon=True).start()
+
+    def _handle(self, conn):
+        try:
+            while not self.stopping.is_set():
+                try:
+                    request = decode_message(conn.recv_bytes())
+                except EOFError:
+                    break
+                except ValueError as e:
+                    conn.send_bytes(encode_message({'ok': False, 'error': f"invalid message: {e}"}))
+                    continue
+                command = request.get('command')
+                if command == 'subscribe':
+                    conn.send_bytes(encode_message({'ok': True, 'result': self.service.status()}))
+                    self._stream_events(conn)
+                    break
+                conn.send_bytes(encode_message(self.execute(command)))
+        except OSError as e:
+            self.logger.debug(f"Control connection closed: {e}")
+        finally:
+            conn.close()
+
+    def execute(self, command):
+        if command not in COMMANDS:
+            return {'ok': False, 'error': f"unknown command: {command}"}
+        try:
+            return {'ok': True, 'result': getattr(self.service, command)()}
+        except Exception as e:
+            self.logger.error(f"Error executing control command {command}: {e}")
+            return {'ok': False, 'error': str(e)}
+
+    def _stream_events(self, conn):
+        events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+        def listener(event):
+            # タイマースレッドを止めないよう、溢れたら一番古いイベントを捨てる
+            while True:
+                try:
+                    events.put_nowait(event)
+                    return
+                except queue.Full:
+                    try:
+                        events.get_nowait()
+                    except queue.Empty:
+                        pass
+
+        self.service.add_listener(listener)
+        try:
+            while not self.stopping.is_set():
+                try:
+                    event = events.get(timeout=1)
+                except queue.Empty:
+                    continue
+                conn.send_bytes(encode_message(event))
+        finally:
+            self.service.remove_listener(listener)
@@ -3,12 +3,18 @@ from core.timer import PomodoroTimer
 import sqlite3
 from datetime import datetime
 import time
+from utils.focus_analytics import FocusAnalytics
 
 class EnhancedPomodoroTimer(PomodoroTimer):
-    def __init__(self, work_time, short_break, long_break, on_tick, on_session_end, settings_manager, db_manager):
+    def __init__(self, work_time, short_break, long_break, on_tick, on_session_end, settings_manager, db_manager, window_tracker=None, event_bus=None, write_pool=None):
         super().__init__(work_time, short_break, long_break, on_tick, on_session_end, settings_manager)
         self.db_manager = db_manager
+        self.window_tracker = window_tracker
+        self.event_bus = event_bus
+        # 終了したセッションの記録・突き合わせ・集中度の計算を行うスレッド（None ならその場で行う）
+        self.write_pool = write_pool
         self.current_session_id = None
+        self.focus_analytics = FocusAnalytics(db_manager)
         self.logger = logging.getLogger(__name__)
 
     def start(self):
@@ -27,25 +33,64 @@ class EnhancedPomodoroTimer(PomodoroTimer):
         else:
             self.current_time = self.short_break if self.session_count % 4 != 0 else self.long_break
         self.start_new_session()
-        
-        session_type = "work" if self.is_work_session else "break"
+
+        # タイマーのスレッドではクエリもフックも実行しない（前のセッションの情報は表示する側が読む）
         if self.on_session_end is not None:
-            previous_session_info = self.get_previous_session_info(session_type)
-            self.on_session_end(self.is_work_session, previous_session_info)
+            self.on_session_end(self.is_work_session, None)
         self.logger.debug(f"Switched to {'work' if self.is_work_session else 'break'} session")
 
     def start_new_session(self):
         if not self.current_session_id:
             self.current_session_id = self.db_manager.start_session("work" if self.is_work_session else "break")
             self.logger.debug(f"Started new session: {self.current_session_id}, type: {'work' if self.is_work_session else 'break'}")
+            self.publish('session_start', session_id=self.current_session_id,
+                         session_type="work" if self.is_work_session else "break")
 
     def end_current_session(self):
+        # タイマーのスレッドではセッションを閉じるだけにし、DB への書き込みと集計は write_pool で行う
+        # （次のセッションへの切り替えや tick を待たせない）。戻り値はその処理の Future（write_pool がなければ None）
         if self.current_session_id:
-            self.db_manager.end_session(self.current_session_id)  # セッションをデータベースで終了
-            self.logger.debug(f"Ended session: {self.current_session_id}")
+            session_id = self.current_session_id
+            ended_at = datetime.now()
+            pending, totals = None, []
+            if self.window_tracker:
+                # 計測中のウィンドウを終了前のセッションの分として締め、以降の記録先から外す
+                pending, totals = self.window_tracker.close_session(session_id)
             self.current_session_id = None  # セッションIDをリセット
-        else:
-            self.logger.warning("Attempted to end session, but no current session ID")
+            self.logger.debug(f"Ended session: {session_id}")
+            self.publish('session_end', session_id=session_id,
+                         session_type="work" if self.is_work_session else "break",
+                         tracked_ms=sum(duration_ms for _, _, duration_ms in totals))
+            if self.write_pool is None:
+                return self._finish_session(session_id, ended_at, pending, totals)
+            return self.write_pool.submit(self._finish_session, session_id, ended_at, pending, totals)
+        self.logger.warning("Attempted to end session, but no current session ID")
+
+    def _finish_session(self, session_id, ended_at, pending, totals):
+        try:
+            if pending:
+                self.db_manager.record_activity(*pending)
+            self.db_manager.end_session(session_id, ended_at)  # セッションをデータベースで終了
+            if totals:
+                self.db_manager.store_session_totals(session_id, totals)  # メモリ上の集計を保存
+        except Exception as e:
+            self.logger.error(f"Error ending session {session_id}: {e}")
+            return
+        self.check_reconciliation(session_id)
+        try:
+            self.focus_analytics.record_session(session_id)  # 集中度指標を計算して保存
+        except Exception as e:
+            self.logger.error(f"Error recording focus metrics: {e}")
+
+    def publish(self, event, **data):
+        # フックはイベントバスのワーカーで実行されるので、ここではキューに入れるだけ
+        if self.event_bus is not None:
+            self.event_bus.publish(event, **data)
+
+    def check_reconciliation(self, session_id):
+        for result in self.db_manager.reconcile_sessions(session_id=session_id):
+            if not result['ok']:
+                self.logger.warning(f"Session {session_id} tracked time does not match wall-clock time: {result}")
 
     def get_previous_session_info(self, session_type):
         return self.db_manager.get_previous_session_info(session_type)
@@ -0,0 +1,269 @@
+import json
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+EVENTS = ('session_start', 'session_end', 'pause', 'resume')
+
+# キューが一杯のときに捨てるジョブ。oldest は一番古いもの、newest は今入れようとしたもの
+DROP_POLICIES = ('oldest', 'newest')
+
+
+class SessionHook:
+    # 1つのフック（Python の呼び出し可能オブジェクトか外部コマンド）と、その実行時間の統計
+    def __init__(self, name, target, events=None, timeout=10):
+        self.name = name
+        self.target = target
+        self.events = set(events or EVENTS)
+        self.timeout = timeout
+        self.timed_out_call = None
+        # Python のフックを実行するフック専用のスレッドと、そこへ渡す呼び出し（最初の呼び出しで作る）
+        self.worker = None
+        self.calls = None
+        # このフックの未実行のイベント（古い順）。scheduled は ready に入っているか実行中であること
+        self.jobs = deque()
+        self.scheduled = False
+        self.stats = {'calls': 0, 'failures': 0, 'timeouts': 0, 'dropped': 0, 'skipped': 0,
+                      'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': None}
+
+    @property
+    def stuck(self):
+        # 時間切れになった呼び出しがまだ終わっていない
+        return self.timed_out_call is not None and not self.timed_out_call.is_set()
+
+    def run(self, event):
+        if callable(self.target):
+            return self._run_callable(event)
+        return self._run_command(event)
+
+    def _run_callable(self, event):
+        # フックごとに1本のスレッドで実行する。Python のスレッドは止められないので、時間切れになったら待つのをやめて次へ進む
+        # （その呼び出しが終わるまでは、同じフックへのイベントは実行せずに捨てるので、スレッドは増えない）
+        if self.worker is None:
+            self.calls = queue.SimpleQueue()
+            self.worker = threading.Thread(target=self._call_loop, name=f'hook-{self.name}', daemon=True)
+            self.worker.start()
+        call = {'event': event, 'done': threading.Event()}
+        self.calls.put(call)
+        if not call['done'].wait(self.timeout):
+            self.timed_out_call = call['done']
+            raise subprocess.TimeoutExpired(self.name, self.timeout)
+        if 'error' in call:
+            raise call['error']
+
+    def _call_loop(self):
+        while True:
+            call = self.calls.get()
+            if call is None:
+                return
+            try:
+                self.target(call['event'])
+            except Exception as e:
+                call['error'] = e
+            call['done'].set()
+
+    def close(self):
+        # 実行中の呼び出しが終わったらフックのスレッドを終了させる
+        if self.worker is not None:
+            self.calls.put(None)
+
+    def _run_command(self, event):
+        # イベントは JSON で標準入力に、主な値は環境変数にも渡す。文字列のコマンドはシェルで実行する
+        env = dict(os.environ,
+                   POMODORO_EVENT=event['event'],
+                   POMODORO_SESSION_ID=str(event.get('session_id') or ''),
+                   POMODORO_SESSION_TYPE=event.get('session_type') or '')
+        subprocess.run(self.target, shell=isinstance(self.target, str), input=json.dumps(event, ensure_ascii=False),
+                       text=True, env=env, timeout=self.timeout, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+class SessionEventBus:
+    # セッションの開始・終了・一時停止・再開をフックに配る。
+    # publish はジョブを上限付きのキューに入れるだけで、タイマーのスレッドを待たせない。
+    # フックは workers 本のスレッドで実行する。同じフックのイベントは1つずつ発生順に実行し（終了の後に開始など）、
+    # 別のフックは並行して実行する。フックごとに時間切れ・失敗・実行時間を記録する
+    def __init__(self, workers=2, queue_size=100, drop_policy='oldest'):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy if drop_policy in DROP_POLICIES else 'oldest'
+        self.hooks = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        # 実行待ちのイベントがあり、実行中でないフック
+        self.ready = deque()
+        # 全フックのジョブを古い順に並べたもの（oldest で捨てるものを選ぶ）。実行済みのものは後から取り除く
+        self.backlog = deque()
+        self.pending = 0
+        self.threads = []
+        self.stopping = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_settings(cls, settings_manager):
+        bus = cls(settings_manager.get_setting('hook_workers'),
+                  settings_manager.get_setting('hook_queue_size'),
+                  settings_manager.get_setting('hook_drop_policy'))
+        bus.load_hooks(settings_manager.get_setting('hooks'))
+        return bus
+
+    def register(self, name, target, events=None, timeout=10):
+        unknown = set(events or ()) - set(EVENTS)
+        if unknown:
+            raise ValueError(f"Unknown session events for hook {name}: {sorted(unknown)}")
+        with self.lock:
+            replaced = self.hooks.get(name)
+            self.hooks[name] = SessionHook(name, target, events, timeout)
+        if replaced is not None:
+            replaced.close()
+
+    def unregister(self, name):
+        with self.lock:
+            hook = self.hooks.pop(name, None)
+        if hook is not None:
+            hook.close()
+
+    def load_hooks(self, entries):
+        # config.json の "hooks": [{"name": ..., "command": ..., "events": [...], "timeout": 秒}, ...]
+        # 読み直すときは外部コマンドのフックだけを入れ替え、コードから登録したフックは残す
+        with self.lock:
+            self.hooks = {name: hook for name, hook in self.hooks.items() if callable(hook.target)}
+        for entry in entries or []:
+            try:
+                command = entry['command']
+                self.register(entry.get('name') or str(command), command, entry.get('events'), entry.get('timeout', 10))
+            except (KeyError, TypeError, ValueError) as e:
+                self.logger.error(f"Skipping invalid hook {entry}: {e}")
+
+    def start(self):
+        if self.threads:
+            return
+        self.stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run_worker, name=f'session-hooks-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=5):
+        self.stopping.set()
+        with self.lock:
+            self.wakeup.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self.threads = []
+
+    def publish(self, event, **data):
+        event = {'event': event, 'timestamp': datetime.now().isoformat(), **data}
+        dropped = []
+        with self.lock:
+            for hook in [hook for hook in self.hooks.values() if event['event'] in hook.events]:
+                dropped += self._enqueue(hook, event)
+        for hook, dropped_event in dropped:
+            self.logger.warning(f"Dropped {dropped_event['event']} event for hook {hook.name}: queue is full")
+
+    def _enqueue(self, hook, event):
+        # self.lock を持った状態で呼ぶ。捨てたジョブを返す
+        dropped = []
+        if self.pending >= self.queue_size:
+            if self.drop_policy == 'newest':
+                hook.stats['dropped'] += 1
+                return [(hook, event)]
+            # 一番古いジョブは、そのフックのキューの先頭でもある
+            while self.backlog:
+                job = self.backlog.popleft()
+                if job[2]:
+                    continue
+                old_hook = job[0]
+                old_hook.jobs.popleft()
+                old_hook.stats['dropped'] += 1
+                self.pending -= 1
+                dropped.append((old_hook, job[1]))
+                break
+        # [フック, イベント, 実行に取り出し済みか]
+        job = [hook, event, False]
+        hook.jobs.append(job)
+        self.backlog.append(job)
+        self.pending += 1
+        if not hook.scheduled:
+            hook.scheduled = True
+            self.ready.append(hook)
+            self.wakeup.notify()
+        return dropped
+
+    def _next_job(self):
+        # 実行するフックとイベントを1つ取り出す。止めるときは None
+        with self.lock:
+            while True:
+                if self.stopping.is_set():
+                    return None
+                while self.ready:
+                    hook = self.ready.popleft()
+                    if hook.jobs:
+                        job = hook.jobs.popleft()
+                        job[2] = True
+                        self.pending -= 1
+                        # 取り出し済みのジョブを backlog の先頭から片付ける
+                        while self.backlog and self.backlog[0][2]:
+                            self.backlog.popleft()
+                        return hook, job[1]
+                    # 捨てられて空になったフック
+                    hook.scheduled = False
+                self.wakeup.wait(0.5)
+
+    def _finish_job(self, hook):
+        # 同じフックの次のイベントは、このイベントが終わってから実行する
+        with self.lock:
+            if hook.jobs:
+                self.ready.append(hook)
+                self.wakeup.notify()
+            else:
+                hook.scheduled = False
+
+    def _run_worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            hook, event = job
+            try:
+                self._run_hook(hook, event)
+            finally:
+                self._finish_job(hook)
+
+    def _run_hook(self, hook, event):
+        if hook.stuck:
+            with self.lock:
+                hook.stats['skipped'] += 1
+            return
+        started = time.monotonic()
+        outcome = None
+        try:
+            hook.run(event)
+        except subprocess.TimeoutExpired:
+            outcome = 'timeouts'
+            self.logger.warning(f"Hook {hook.name} timed out after {hook.timeout}s on {event['event']}")
+        except Exception as e:
+            outcome = 'failures'
+            detail = e.stderr.strip() if isinstance(e, subprocess.CalledProcessError) and e.stderr else e
+            self.logger.error(f"Hook {hook.name} failed on {event['event']}: {detail}")
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with self.lock:
+            stats = hook.stats
+            stats['calls'] += 1
+            if outcome:
+                stats[outcome] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['last_ms'] = elapsed_ms
+
+    def stats(self):
+        with self.lock:
+            return {name: {**hook.stats,
+                           'avg_ms': hook.stats['total_ms'] / hook.stats['calls'] if hook.stats['calls'] else None}
+                    for name, hook in self.hooks.items()}
@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from core.enhanced_timer import EnhancedPomodoroTimer
+from core.event_bus import SessionEventBus
+
+
+class PomodoroService:
+    # タイマー・ウィンドウトラッキング・記録をまとめて動かす本体（tkinter には依存しない）
+    # GUI・デーモン・CLI はこのクラスか RemotePomodoroService を通して操作する
+    def __init__(self, settings_manager, db_manager, window_tracker):
+        self.settings_manager = settings_manager
+        self.db_manager = db_manager
+        self.window_tracker = window_tracker
+        self.logger = logging.getLogger(__name__)
+
+        # セッションの開始・終了・一時停止・再開を config.json の hooks などに配る
+        self.event_bus = SessionEventBus.from_settings(self.settings_manager)
+        self.event_bus.start()
+
+        # 一時停止マーカーや終了したセッションの記録などの書き込みは、呼び出し元やタイマーのスレッドを待たせないよう
+        # 単一スレッドで順番に行う
+        self.write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='service-write')
+
+        self.timer = EnhancedPomodoroTimer(
+            self.settings_manager.get_setting('work_time'),
+            self.settings_manager.get_setting('short_break'),
+            self.settings_manager.get_setting('long_break'),
+            self._on_tick,
+            self._on_session_end,
+            self.settings_manager,
+            self.db_manager,
+            self.window_tracker,
+            self.event_bus,
+            self.write_pool
+        )
+
+        self.listeners = []
+        self.listeners_lock = threading.Lock()
+        self.tracking_thread = None
+        self.paused_at = None
+        self.total_duration = self.timer.current_time
+
+    def add_listener(self, listener):
+        with self.listeners_lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.listeners_lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def notify(self, event):
+        with self.listeners_lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                self.logger.error(f"Error in service listener: {e}")
+
+    def status(self):
+        return {
+            'running': self.timer.running,
+            'paused': self.timer.paused,
+            'time_left': self.timer.current_time,
+            'total_duration': self.total_duration,
+            'is_work_session': self.timer.is_work_session,
+            'session_id': self.timer.current_session_id,
+        }
+
+    def snapshot(self):
+        # 現在のセッションのアプリ別・ウィンドウ別合計（DB は読まない）
+        return self.window_tracker.live_snapshot()
+
+    def notify_state(self):
+        self.notify({'event': 'state', **self.status()})
+
+    def start(self):
+        if self.timer.running:
+            return self.status()
+        self.total_duration = self.timer.current_time
+        self.timer.start()
+        self.start_window_tracking()
+        self.notify_state()
+        return self.status()
+
+    def pause(self):
+        if not self.timer.running or self.timer.paused:
+            return self.status()
+        self.timer.pause()
+        # 計測中のウィンドウを記録してから一時停止マーカーを書き込む
+        self.stop_window_tracking()
+        self.paused_at = time.monotonic()
+        self.write_pool.submit(self.db_manager.record_activity, self.timer.current_session_id, "Pause Pomodoro", "", 0)
+        self.event_bus.publish('pause', session_id=self.timer.current_session_id, time_left=self.timer.current_time)
+        self.notify_state()
+        return self.status()
+
+    def resume(self):
+        if not self.timer.running or not self.timer.paused:
+            return self.status()
+        self.timer.resume()
+        paused_ms = None
+        if self.paused_at is not None:
+            paused_ms = (time.monotonic() - self.paused_at) * 1000
+            self.write_pool.submit(self.db_manager.add_session_pause, self.timer.current_session_id, paused_ms)
+            self.paused_at = None
+        self.event_bus.publish('resume', session_id=self.timer.current_session_id, time_left=self.timer.current_time,
+                               paused_ms=paused_ms)
+        self.write_pool.submit(self.db_manager.record_activity, self.timer.current_session_id, "Resume Pomodoro", "", 0)
+        self.start_window_tracking()
+        self.notify_state()
+        return self.status()
+
+    def toggle(self):
+        if not self.timer.running:
+            return self.start()
+        if self.timer.paused:
+            return self.resume()
+        return self.pause()
+
+    def reset(self):
+        self.stop_window_tracking()
+        if self.timer.current_session_id:
+            # 一時停止中にリセットした場合は、終了時の突き合わせが合うよう一時停止時間を先に記録する
+            if self.paused_at is not None:
+                paused_ms = (time.monotonic() - self.paused_at) * 1000
+                self.write_pool.submit(self.db_manager.add_session_pause, self.timer.current_session_id, paused_ms)
+            # 終了の記録は一時停止時間の記録の後に write_pool で行われる
+            self.timer.end_current_session()
+        self.timer.reset()
+        self.total_duration = self.timer.current_time
+        self.paused_at = None
+        self.notify_state()
+        return self.status()
+
+    def reload_settings(self):
+        # 設定ファイルを読み直してタイマーに反映する（別プロセスの設定画面からの変更にも対応する）
+        self.settings_manager.settings = self.settings_manager.load_settings()
+        self.timer.update_settings(
+            self.settings_manager.get_setting('work_time'),
+            self.settings_manager.get_setting('short_break'),
+            self.settings_manager.get_setting('long_break')
+        )
+        self.event_bus.load_hooks(self.settings_manager.get_setting('hooks'))
+        return self.reset()
+
+    def hook_stats(self):
+        return self.event_bus.stats()
+
+    def _on_tick(self, time_left, is_work_session):
+        self.notify({'event': 'tick', 'time_left': time_left, 'is_work_session': is_work_session})
+
+    def _on_session_end(self, is_work_session, previous_session_info):
+        self.logger.debug(f"Session ended. New session: {'work' if is_work_session else 'break'}")
+        self.total_duration = self.timer.current_time
+        self.notify({'event': 'session_end', 'is_work_session': is_work_session, **self.status()})
+        # 監視スレッドを止めて待たずに、記録先を新しいセッションに切り替える
+        if self.tracking_thread is not None and self.tracking_thread.is_alive():
+            self.window_tracker.open_session(self.timer.current_session_id)
+        else:
+            self.start_window_tracking()
+
+    def start_window_tracking(self):
+        if self.tracking_thread is None or not self.tracking_thread.is_alive():
+            self.tracking_thread = threading.Thread(target=self.window_tracker.start_tracking,
+                                                    args=(self.timer.current_session_id, None))
+            self.tracking_thread.start()
+        self.logger.debug(f"Started window tracking for session {self.timer.current_session_id}")
+
+    def stop_window_tracking(self):
+        if self.tracking_thread and self.tracking_thread.is_alive():
+            self.window_tracker.stop_tracking()  # ウィンドウトラッキングを停止
+            self.tracking_thread.join(timeout=1)  # 最大1秒待機
+            if self.tracking_thread.is_alive():
+                self.logger.warning("Window tracking thread did not stop in time")
+            self.tracking_thread = None
+        self.logger.debug(f"Stopped window tracking for session {self.timer.current_session_id}")
+
+    def shutdown(self):
+        if self.timer.running:
+            self.reset()
+        self.write_pool.shutdown(wait=True)
+        self.event_bus.stop()
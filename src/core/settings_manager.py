@@ -8,7 +8,19 @@ class SettingsManager:
             'work_time': 25,
             'short_break': 5,
             'long_break': 15,
-            'auto_start': True
+            'auto_start': True,
+            'sync_server_url': '',
+            'sync_device_id': '',
+            'sync_interval': 60,
+            'control_address': '',
+            'backup_interval_hours': 24,
+            'backup_keep': 7,
+            # セッションの開始・終了などで実行する外部コマンド
+            # [{"name": ..., "command": ..., "events": ["session_end", ...], "timeout": 秒}]
+            'hooks': [],
+            'hook_workers': 2,
+            'hook_queue_size': 100,
+            'hook_drop_policy': 'oldest'
         }
         self.settings = self.load_settings()
 
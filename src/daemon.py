@@ -0,0 +1,68 @@
+import logging
+import signal
+import threading
+from core.settings_manager import SettingsManager
+from core.pomodoro_service import PomodoroService
+from core.control_server import ControlServer, default_control_address
+from utils.database_manager import DatabaseManager
+from utils.window_tracker import WindowTracker
+from utils.sync_client import SyncClient
+from utils.backup_manager import BackupManager
+from utils.archive_manager import MonthArchiver
+
+# GUI を使わずにタイマーとウィンドウトラッキングだけを常駐させる。
+# tkinter や matplotlib は読み込まず、操作は cli.py や GUI から ControlServer 経由で行う
+
+
+def main():
+    logging.basicConfig(filename='pomodoro_daemon.log', level=logging.INFO)
+    logger = logging.getLogger(__name__)
+
+    settings_manager = SettingsManager()
+    db_manager = DatabaseManager()
+    window_tracker = WindowTracker(db_manager)
+    service = PomodoroService(settings_manager, db_manager, window_tracker)
+    server = ControlServer(service, default_control_address(settings_manager))
+    server.start()
+
+    sync_client = None
+    if settings_manager.get_setting('sync_server_url'):
+        sync_client = SyncClient(db_manager,
+                                 settings_manager.get_setting('sync_server_url'),
+                                 settings_manager.get_setting('sync_device_id') or None,
+                                 settings_manager.get_setting('sync_interval'))
+        sync_client.start()
+
+    # 設定した間隔ごとに pomodoro.db のスナップショットを data/backups に取る
+    backup_manager = BackupManager(db_manager,
+                                   keep=settings_manager.get_setting('backup_keep'),
+                                   interval_hours=settings_manager.get_setting('backup_interval_hours'))
+    backup_manager.start()
+
+    # 終わった月を data/archive に移し、本体には今月分だけを残す
+    archiver = MonthArchiver(db_manager)
+    archiver.start()
+
+    stop_event = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, shutting down")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    print(f"ポモドーロデーモンを起動しました: {server.address}")
+    # シグナルを受け取れるよう、タイムアウト付きで待つ
+    while not stop_event.wait(1):
+        pass
+
+    server.stop()
+    service.shutdown()
+    if sync_client:
+        sync_client.stop()
+    backup_manager.stop()
+    archiver.stop()
+
+if __name__ == "__main__":
+    main()
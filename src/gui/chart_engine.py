@@ -0,0 +1,181 @@
+import functools
+import math
+import os
+from datetime import timedelta
+import matplotlib
+from matplotlib import font_manager
+from matplotlib import cm
+
+MEIRYO_PATH = 'C:/Windows/Fonts/meiryo.ttc'
+
+# Meiryo が無い環境で順に試す日本語フォント
+FALLBACK_FONTS = ['Meiryo', 'Yu Gothic', 'MS Gothic', 'Hiragino Sans', 'Noto Sans CJK JP', 'IPAexGothic', 'TakaoGothic']
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_japanese_font():
+    # フォントの解決はプロセス内で一度だけ行う
+    if os.path.exists(MEIRYO_PATH):
+        font_manager.fontManager.addfont(MEIRYO_PATH)
+        return font_manager.FontProperties(fname=MEIRYO_PATH).get_name()
+    available = {font.name for font in font_manager.fontManager.ttflist}
+    for name in FALLBACK_FONTS:
+        if name in available:
+            return name
+    return matplotlib.rcParams['font.family'][0]
+
+
+def apply_japanese_font():
+    matplotlib.rcParams['font.family'] = resolve_japanese_font()
+
+
+class PieChart:
+    # ウェッジとラベルを保持し、件数が変わらない更新では角度と文字だけを書き換えてブリットする
+    def __init__(self, ax, canvas, startangle=90):
+        self.ax = ax
+        self.canvas = canvas
+        self.startangle = startangle
+        self.wedges = []
+        self.texts = []
+        self.autotexts = []
+        self.empty_text = None
+        self.background = None
+        self.title = self.ax.set_title('', fontsize=10)
+        self.title.set_animated(True)
+        self.ax.set_aspect('equal')
+        self.ax.axis('off')
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def animated_artists(self):
+        artists = [*self.wedges, *self.texts, *self.autotexts, self.title]
+        if self.empty_text is not None:
+            artists.append(self.empty_text)
+        return artists
+
+    def update(self, data, title):
+        labels = list(data.keys())
+        values = list(data.values())
+        self.title.set_text(title)
+        total = sum(values)
+
+        if total <= 0:
+            self.clear_wedges()
+            if self.empty_text is None:
+                self.empty_text = self.ax.text(0, 0, 'データがありません', ha='center', va='center', animated=True)
+            self.redraw()
+            return
+        if self.empty_text is not None:
+            self.empty_text.remove()
+            self.empty_text = None
+
+        if len(values) != len(self.wedges):
+            self.rebuild(labels, values)
+            return
+
+        theta = self.startangle
+        for wedge, text, autotext, label, value in zip(self.wedges, self.texts, self.autotexts, labels, values):
+            span = 360 * value / total
+            wedge.set_theta1(theta)
+            wedge.set_theta2(theta + span)
+            mid = math.radians(theta + span / 2)
+            x, y = math.cos(mid), math.sin(mid)
+            text.set_position((1.1 * x, 1.1 * y))
+            text.set_horizontalalignment('left' if x > 0 else 'right')
+            text.set_text(label)
+            autotext.set_position((0.6 * x, 0.6 * y))
+            autotext.set_text(f"{100 * value / total:.1f}%")
+            theta += span
+        self.redraw()
+
+    def rebuild(self, labels, values):
+        self.clear_wedges()
+        colors = cm.Set3(range(len(values)))
+        self.wedges, self.texts, self.autotexts = self.ax.pie(
+            values, labels=labels, autopct='%1.1f%%', startangle=self.startangle, colors=colors,
+            textprops={'size': 8})
+        for artist in self.animated_artists():
+            artist.set_animated(True)
+        self.canvas.draw_idle()
+
+    def clear_wedges(self):
+        for artist in [*self.wedges, *self.texts, *self.autotexts]:
+            artist.remove()
+        self.wedges, self.texts, self.autotexts = [], [], []
+
+    def redraw(self):
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_animated()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+    def draw_animated(self):
+        for artist in self.animated_artists():
+            self.canvas.figure.draw_artist(artist)
+
+    def on_draw(self, event):
+        # 全体描画のたびに背景を保存し、アニメーション対象だけを上に描く
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_animated()
+
+
+class StackedAreaChart:
+    # 日別ロールアップを積み上げ面グラフで表示する。軸は使い回し、面だけを差し替える
+    def __init__(self, ax, canvas):
+        self.ax = ax
+        self.canvas = canvas
+        self.collections = []
+        self.legend = None
+        self.ax.set_ylabel('時間')
+
+    def update(self, rows, start_date, end_date, title, other_label='その他'):
+        days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        index = {str(day): i for i, day in enumerate(days)}
+        series = {}
+        for day, app, duration in rows:
+            values = series.setdefault(app if app is not None else other_label, [0.0] * len(days))
+            values[index[day]] += duration / 3600
+
+        for collection in self.collections:
+            collection.remove()
+        if self.legend is not None:
+            self.legend.remove()
+            self.legend = None
+
+        if series:
+            labels = sorted(series, key=lambda label: (label == other_label, -sum(series[label])))
+            self.collections = self.ax.stackplot(days, *[series[label] for label in labels], labels=labels,
+                                                 colors=cm.Set3(range(len(labels))))
+            self.legend = self.ax.legend(loc='upper left', fontsize=7)
+        else:
+            self.collections = []
+
+        self.ax.set_xlim(days[0], days[-1] if len(days) > 1 else days[0] + timedelta(days=1))
+        self.ax.relim()
+        self.ax.autoscale_view(scalex=False)
+        self.ax.set_title(title, fontsize=10)
+        self.canvas.figure.autofmt_xdate()
+        self.canvas.draw_idle()
+
+
+class HeatmapChart:
+    # 曜日 × 時間帯の行列をヒートマップで表示する。画像とカラーバーは使い回し、値と色の範囲だけを差し替える
+    WEEKDAYS = ['月', '火', '水', '木', '金', '土', '日']
+
+    def __init__(self, ax, canvas):
+        self.ax = ax
+        self.canvas = canvas
+        self.image = self.ax.imshow([[0.0] * 24 for _ in range(7)], aspect='auto', cmap='YlGn', vmin=0, vmax=1)
+        self.colorbar = self.ax.figure.colorbar(self.image, ax=self.ax)
+        self.colorbar.set_label('分')
+        self.ax.set_xticks(range(0, 24, 3))
+        self.ax.set_xticklabels([f'{hour}時' for hour in range(0, 24, 3)], fontsize=8)
+        self.ax.set_yticks(range(7))
+        self.ax.set_yticklabels(self.WEEKDAYS, fontsize=8)
+
+    def update(self, matrix, title):
+        self.image.set_data(matrix)
+        self.image.set_clim(0, max(float(matrix.max()), 1.0))
+        self.ax.set_title(title, fontsize=10)
+        self.canvas.draw_idle()
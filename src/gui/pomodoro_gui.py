@@ -1,24 +1,31 @@
 import tkinter as tk
 from tkinter import ttk
-from core.timer import PomodoroTimer
 from gui.settings_gui import SettingsGUI
-from core.enhanced_timer import EnhancedPomodoroTimer
+from core.pomodoro_service import PomodoroService
 from utils.database_manager import DatabaseManager
 from utils.window_tracker import WindowTracker
 from core.settings_manager import SettingsManager
+from utils.query_executor import QueryExecutor
+from utils.live_aggregator import format_snapshot
 import time
-import threading
+import queue
 import datetime
 from tkinter import font as tkfont
 import logging
 
 class PomodoroGUI:
-    def __init__(self, master, settings_manager, window_tracker, db_manager):
+    # タイマー本体は service（同じプロセスの PomodoroService かデーモンへの RemotePomodoroService）が持ち、
+    # GUI は操作の送信と状態の表示だけを行う
+    def __init__(self, master, settings_manager, service, db_manager, query_executor=None):
         self.master = master
         self.settings_manager = settings_manager
-        self.window_tracker = window_tracker
+        self.service = service
         self.db_manager = db_manager
 
+        # DB へのアクセスはバックグラウンドで行い、結果だけを Tk スレッドで受け取る
+        self.query_executor = query_executor or QueryExecutor(db_manager)
+        self.query_executor.attach(self.master)
+
         self.master.title("シュタインズ・ゲート風ポモドーロタイマー")
         self.master.geometry("600x400")
         self.master.configure(bg='#1e1e1e')
@@ -28,30 +35,25 @@ class PomodoroGUI:
         self.style.configure('TButton', background='#4a4a4a', foreground='white')
         self.style.map('TButton', background=[('active', '#6a6a6a')])
 
-        self.timer = EnhancedPomodoroTimer(
-            self.settings_manager.get_setting('work_time'),
-            self.settings_manager.get_setting('short_break'),
-            self.settings_manager.get_setting('long_break'),
-            self.update_timer_display,
-            self.on_session_end,
-            self.settings_manager,
-            self.db_manager
-        )
-
         self.last_update_time = time.time()
         self.smooth_progress = 0
         self.start_time = 0
         self.total_duration = 0
-
-        self.current_session_id = None
-        self.current_pomodoro_id = None
-        self.tracking_thread = None
+        self.animating = False
 
         self.create_widgets()
 
         logging.basicConfig(filename='pomodoro_gui_debug.log', level=logging.DEBUG)  # ロギングの設定
         self.logger = logging.getLogger(__name__)
 
+        # デーモンがすでに動いていれば、その状態から表示を始める
+        self.state = {'running': False}
+        self.events = queue.Queue()
+        self.service.add_listener(self.on_service_event)
+        self.apply_state(self.service.status())
+        self.poll_service_events()
+        self.master.protocol("WM_DELETE_WINDOW", self.close)
+
     def create_widgets(self):
         initial_time = self.settings_manager.get_setting('work_time')
         self.timer_display = tk.Label(self.master, text=f"{initial_time:02d}:00", font=("Courier", 48), fg='#00ff00', bg='#1e1e1e')
@@ -81,56 +83,76 @@ class PomodoroGUI:
         self.settings_button = ttk.Button(button_frame, text="設定", command=self.open_settings)
         self.settings_button.pack(side=tk.LEFT, padx=5)
 
+        self.live_button = ttk.Button(button_frame, text="現在の記録", command=self.show_live_snapshot)
+        self.live_button.pack(side=tk.LEFT, padx=5)
+
         # セッション情報表示用のテキストウィジェットを追加
         self.session_info = tk.Text(self.master, height=10, width=50)
         self.session_info.pack(pady=10)
 
     def toggle_timer(self):
         self.logger.debug("Toggle timer called")
-        if self.timer.running:
-            if self.timer.paused:
-                self.logger.debug("Resuming timer")
-                self.timer.resume()
-                self.start_pause_button.config(text="一時停止")
-                self.start_time = time.time() - (self.total_duration - self.timer.current_time)
-                self.db_manager.record_activity(self.timer.current_session_id, "Resume Pomodoro", "", 0)
-                self.start_window_tracking()
-            else:
-                self.logger.debug("Pausing timer")
-                self.timer.pause()
-                self.start_pause_button.config(text="再開")
-                self.db_manager.record_activity(self.timer.current_session_id, "Pause Pomodoro", "", 0)
-                self.stop_window_tracking()
+        self.apply_state(self.service.toggle())
+        self.logger.debug(f"Timer state after toggle: running={self.state['running']}, paused={self.state['paused']}")
+
+    def apply_state(self, state):
+        # ボタン操作・CLI からの操作のどちらでも、サービスの状態を受け取ってここで画面に反映する
+        was_running = self.state['running']
+        self.state = state
+        self.total_duration = state['total_duration']
+        self.update_timer_display(state['time_left'], state['is_work_session'])
+        if not state['running']:
+            self.start_pause_button.config(text="エル・プサイ・コングルゥ")
+            self.smooth_progress = 0
+            self.progress_bar['value'] = 0
+            self.start_time = 0
+        elif state['paused']:
+            self.start_pause_button.config(text="再開")
         else:
-            self.logger.debug("Starting new timer")
-            self.timer.start()
             self.start_pause_button.config(text="一時停止")
-            self.start_time = time.time()
-            self.total_duration = self.timer.current_time
-            self.start_window_tracking()
+            self.start_time = time.time() - (self.total_duration - state['time_left'])
+            self.smooth_update_progress()
+        if state['running'] and not was_running:
             # 初回起動時に前回のセッション情報を表示
-            self.show_previous_session_info("work" if self.timer.is_work_session else "break")
+            self.show_previous_session_info("work" if state['is_work_session'] else "break")
         self.update_button_states()
-        self.smooth_update_progress()
-        self.logger.debug(f"Timer state after toggle: running={self.timer.running}, paused={self.timer.paused}")
 
     def reset_timer(self):
-        if self.current_session_id:
-            self.db_manager.end_session(self.current_session_id)
-        if self.current_pomodoro_id:
-            self.db_manager.end_pomodoro(self.current_pomodoro_id, False)
-        self.stop_window_tracking()
-        self.timer.reset()
-        initial_time = self.settings_manager.get_setting('work_time')
-        self.update_timer_display(initial_time * 60, True)
-        self.start_pause_button.config(text="エル・プサイ・コングルゥ")
-        self.update_button_states()
-        self.smooth_progress = 0
-        self.progress_bar['value'] = 0
-        self.start_time = 0
-        self.total_duration = initial_time * 60
-        self.current_session_id = None
-        self.current_pomodoro_id = None
+        # リセットは監視スレッドやタイマースレッドの終了を待つので、Tk スレッドを止めないよう書き込み用のスレッドで行い、
+        # 結果の状態はサービスのイベントと同じく events から Tk スレッドで反映する
+        self.query_executor.cancel('previous_session_info')
+        self.reset_button.state(['disabled'])
+        future = self.query_executor.submit_write(self.service.reset)
+
+        def done(future):
+            error = future.exception()
+            if error is not None:
+                self.logger.error(f"Error resetting timer: {error}")
+                self.events.put({'event': 'state', **self.state})  # ボタンの状態を元に戻す
+            else:
+                self.events.put({'event': 'state', **future.result()})
+
+        future.add_done_callback(done)
+
+    def on_service_event(self, event):
+        # サービスのイベントはタイマースレッドや購読スレッドから届くので、Tk スレッドに渡してから処理する
+        self.events.put(event)
+
+    def poll_service_events(self):
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event.pop('event')
+            if kind == 'tick':
+                self.state.update(time_left=event['time_left'], is_work_session=event['is_work_session'])
+                self.update_timer_display(event['time_left'], event['is_work_session'])
+            elif kind == 'session_end':
+                self.on_session_end(event)
+            else:
+                self.apply_state(event)
+        self.master.after(30, self.poll_service_events)
 
     def update_timer_display(self, time_left, is_work_session):
         minutes, seconds = divmod(time_left, 60)
@@ -139,19 +161,45 @@ class PomodoroGUI:
         self.logger.debug(f"Updated timer display: {minutes:02d}:{seconds:02d}, {'work' if is_work_session else 'break'} session")
 
     def smooth_update_progress(self):
-        if self.timer.running and not self.timer.paused:
-            current_time = time.time()
-            elapsed_time = current_time - self.start_time
-            progress = min(elapsed_time / self.total_duration, 1.0) * 100
+        if self.animating:
+            return
+        self.animating = True
+        self.animate_progress()
+
+    def animate_progress(self):
+        if not self.state['running'] or self.state['paused']:
+            self.animating = False
+            return
+        current_time = time.time()
+        elapsed_time = current_time - self.start_time
+        progress = min(elapsed_time / self.total_duration, 1.0) * 100 if self.total_duration else 0
 
-            self.smooth_progress += (progress - self.smooth_progress) * 0.1
-            self.progress_bar['value'] = self.smooth_progress
+        self.smooth_progress += (progress - self.smooth_progress) * 0.1
+        self.progress_bar['value'] = self.smooth_progress
 
-            self.master.after(16, self.smooth_update_progress)  # 約60FPSで更新
+        self.master.after(16, self.animate_progress)  # 約60FPSで更新
             
     def show_previous_session_info(self, session_type):
         self.logger.debug(f"Showing previous session info for {session_type}")  # セッション情報表示のログ
-        info = self.db_manager.get_previous_session_info(session_type)
+        # 前のリクエストが未完了ならキャンセルし、結果は render_session_info で表示する
+        self.query_executor.run_in_tk(
+            'previous_session_info',
+            self.db_manager.get_previous_session_info,
+            session_type,
+            on_result=lambda info: self.render_session_info(session_type, info),
+            on_error=lambda e: self.render_session_info(session_type, f"セッション情報の取得中にエラーが発生しました: {e}"),
+        )
+
+    def show_live_snapshot(self):
+        # 計測中のセッションの合計はトラッカーがメモリ上に持っているので、DB を読まずに表示できる
+        self.query_executor.cancel('previous_session_info')
+        try:
+            info = format_snapshot(self.service.snapshot())
+        except (OSError, EOFError, RuntimeError) as e:
+            info = f"現在の記録の取得中にエラーが発生しました: {e}"
+        self.render_session_info("現在の", info)
+
+    def render_session_info(self, session_type, info):
         self.session_info.delete(1.0, tk.END)
         
         if not info:
@@ -192,59 +240,43 @@ class PomodoroGUI:
         self.logger.debug(f"Displayed text length: {len(displayed_text)}")  # 表示されたテキストの長さのログ
         self.logger.debug(f"Displayed text: {displayed_text}")  # 表示されたテキストのログ
 
-    def on_session_end(self, is_work_session, previous_session_info):
+    def on_session_end(self, event):
+        is_work_session = event['is_work_session']
         self.logger.debug(f"Session ended. New session: {'work' if is_work_session else 'break'}")
-        self.stop_window_tracking()  # ウィンドウトラッキングを停止
-        
+        self.state = event
+
         if not self.settings_manager.get_setting('auto_start'):
             self.start_pause_button.config(text="スタート")
         self.update_button_states()
         self.smooth_progress = 0
         self.progress_bar['value'] = 0
         self.start_time = time.time()
-        self.total_duration = self.timer.current_time
-        
+        self.total_duration = event['total_duration']
+        self.update_timer_display(event['time_left'], is_work_session)
+
         # 前回のセッション情報を表示
         self.show_previous_session_info("break" if is_work_session else "work")
-        
-        # 新しいセッションのウィンドウトラッキングを開始
-        self.start_window_tracking()
 
     def open_settings(self):
-        if not self.timer.running:
+        if not self.state['running']:
             SettingsGUI(self.master, self.settings_manager, self.apply_settings)
 
     def apply_settings(self):
-        self.timer.update_settings(
-            self.settings_manager.get_setting('work_time'),
-            self.settings_manager.get_setting('short_break'),
-            self.settings_manager.get_setting('long_break')
-        )
-        self.reset_timer()
+        # 設定ファイルに保存済みの値をサービス側（デーモンの場合は別プロセス）に読み直させる
+        self.query_executor.cancel('previous_session_info')
+        self.apply_state(self.service.reload_settings())
 
     def update_button_states(self):
-        if self.timer.running:
+        if self.state['running']:
             self.settings_button.state(['disabled'])
             self.reset_button.state(['!disabled'])
         else:
             self.settings_button.state(['!disabled'])
             self.reset_button.state(['disabled'])
 
-    def start_window_tracking(self):
-        if self.tracking_thread is None or not self.tracking_thread.is_alive():
-            self.tracking_thread = threading.Thread(target=self.window_tracker.start_tracking, 
-                                                    args=(self.timer.current_session_id, self.current_pomodoro_id))
-            self.tracking_thread.start()
-        self.logger.debug(f"Started window tracking for session {self.timer.current_session_id}")
-
-    def stop_window_tracking(self):
-        if self.tracking_thread and self.tracking_thread.is_alive():
-            self.window_tracker.stop_tracking()  # ウィンドウトラッキングを停止
-            self.tracking_thread.join(timeout=1)  # 最大1秒待機
-            if self.tracking_thread.is_alive():
-                self.logger.warning("Window tracking thread did not stop in time")
-            self.tracking_thread = None
-        self.logger.debug(f"Stopped window tracking for session {self.timer.current_session_id}")
+    def close(self):
+        self.service.remove_listener(self.on_service_event)
+        self.master.destroy()
 
     def run(self):
         self.update_button_states()
@@ -255,5 +287,7 @@ if __name__ == "__main__":
     settings_manager = SettingsManager()
     db_manager = DatabaseManager()
     window_tracker = WindowTracker(db_manager)
-    app = PomodoroGUI(root, settings_manager, window_tracker, db_manager)
-    app.run()
\ No newline at end of file
+    service = PomodoroService(settings_manager, db_manager, window_tracker)
+    app = PomodoroGUI(root, settings_manager, service, db_manager)
+    app.run()
+    service.shutdown()
\ No newline at end of file
@@ -0,0 +1,196 @@
+import tkinter as tk
+from tkinter import ttk
+from collections import OrderedDict
+
+
+PLACEHOLDER = '…'
+
+
+class VirtualTable(tk.Frame):
+    # 表示中の行だけを Treeview に作り、データはスクロールに合わせてページ単位で取得する。
+    # 件数とページは query_executor の読み取りスレッドで取得し、届くまでは仮の行を表示する
+    # （count_rows(conn) と fetch_rows(offset, limit, sort_key, descending, conn) は Tk のウィジェットに触れないこと）
+    def __init__(self, master, columns, count_rows, fetch_rows, query_executor, sort_key=None, descending=False,
+                 on_select=None, page_size=200, max_cached_pages=8, **kwargs):
+        super().__init__(master, **kwargs)
+        self.columns = columns
+        self.count_rows = count_rows
+        self.fetch_rows = fetch_rows
+        self.query_executor = query_executor
+        self.sort_key = sort_key
+        self.descending = descending
+        self.on_select = on_select
+        self.page_size = page_size
+        self.max_cached_pages = max_cached_pages
+
+        self.total = 0
+        self.offset = 0
+        self.visible_rows = 1
+        self.pages = OrderedDict()
+        self.pending = set()
+        # refresh・並べ替えのたびに進め、それより前に出したリクエストの結果を捨てる
+        self.generation = 0
+        self.count_key = f'virtual-table-{id(self)}-count'
+        self.page_key = f'virtual-table-{id(self)}-pages'
+        self.items = []
+        self.item_values = {}
+
+        keys = [column[0] for column in columns]
+        self.tree = ttk.Treeview(self, columns=keys, show='headings', selectmode='browse')
+        for key, heading, width, anchor in columns:
+            self.tree.heading(key, text=heading, command=lambda k=key: self.sort_by(k))
+            self.tree.column(key, width=width, anchor=anchor)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind('<Configure>', self.on_resize)
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Button-4>', lambda e: self.scroll_to(self.offset - 3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll_to(self.offset + 3))
+        self.tree.bind('<<TreeviewSelect>>', self.on_tree_select)
+        self.bind('<Destroy>', self.on_destroy)
+
+    def refresh(self):
+        # 件数が届くまでは前の件数のまま仮の行を表示し、表示範囲のページも並行して読む
+        self.reset_pages()
+        self.offset = 0
+        generation = self.generation
+        self.query_executor.run_in_tk(self.count_key, self.count_rows,
+                                      on_result=lambda total: self.on_count(generation, total))
+        self.render()
+
+    def sort_by(self, key):
+        if key == self.sort_key:
+            self.descending = not self.descending
+        else:
+            self.sort_key = key
+            self.descending = False
+        self.reset_pages()
+        self.offset = 0
+        self.render()
+
+    def reset_pages(self):
+        self.generation += 1
+        self.pages.clear()
+        self.pending.clear()
+        self.query_executor.cancel(self.page_key)
+
+    def on_count(self, generation, total):
+        if generation != self.generation:
+            return
+        self.total = total
+        self.offset = max(0, min(self.offset, self.total - self.visible_rows))
+        self.render()
+
+    def load_pages(self, indexes):
+        # 足りないページをまとめて1つのリクエストで読む。スクロールで表示範囲が変われば前のリクエストは取り消される
+        if set(indexes) <= self.pending:
+            return
+        self.pending = set(indexes)
+        generation = self.generation
+        sort_key = self.sort_key
+        descending = self.descending
+        page_size = self.page_size
+        fetch_rows = self.fetch_rows
+
+        def fetch(conn=None):
+            return [(index, fetch_rows(index * page_size, page_size, sort_key, descending, conn=conn))
+                    for index in indexes]
+
+        self.query_executor.run_in_tk(self.page_key, fetch,
+                                      on_result=lambda pages: self.on_pages(generation, pages))
+
+    def on_pages(self, generation, pages):
+        if generation != self.generation:
+            return
+        for index, rows in pages:
+            self.pages[index] = rows
+        while len(self.pages) > self.max_cached_pages:
+            self.pages.popitem(last=False)
+        self.pending.clear()
+        self.render()
+
+    def get_rows(self, offset, count):
+        # 読み込み済みでないページの行は None にし、足りないページの番号も返す
+        rows = []
+        missing = []
+        end = min(offset + count, self.total)
+        position = offset
+        while position < end:
+            index = position // self.page_size
+            start = position % self.page_size
+            length = min(self.page_size - start, end - position)
+            if index in self.pages:
+                self.pages.move_to_end(index)
+                page = self.pages[index]
+                rows.extend(page[start:start + length])
+                if len(page) < self.page_size:
+                    break
+            else:
+                missing.append(index)
+                rows.extend([None] * length)
+            position += length
+        return rows, missing
+
+    def render(self):
+        rows, missing = self.get_rows(self.offset, self.visible_rows)
+        if missing:
+            self.load_pages(missing)
+        placeholder = tuple(PLACEHOLDER for _ in self.columns)
+
+        # 既存の行アイテムを使い回し、必要な数だけ作成・削除する
+        while len(self.items) < len(rows):
+            self.items.append(self.tree.insert('', 'end'))
+        while len(self.items) > len(rows):
+            item = self.items.pop()
+            self.tree.delete(item)
+            self.item_values.pop(item, None)
+        if self.tree.selection():
+            self.tree.selection_remove(self.tree.selection())
+        for item, values in zip(self.items, rows):
+            self.tree.item(item, values=placeholder if values is None else values)
+            self.item_values[item] = values
+
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, min(1.0, (self.offset + self.visible_rows) / self.total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, self.total - self.visible_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+
+    def on_scroll(self, action, value, unit=None):
+        if action == 'moveto':
+            self.scroll_to(int(float(value) * self.total))
+        elif action == 'scroll':
+            step = self.visible_rows if unit == 'pages' else 1
+            self.scroll_to(self.offset + int(value) * step)
+
+    def on_mousewheel(self, event):
+        self.scroll_to(self.offset - int(event.delta / 120) * 3)
+
+    def on_resize(self, event):
+        style = ttk.Style()
+        row_height = int(style.lookup('Treeview', 'rowheight') or 20)
+        heading_height = row_height + 5
+        visible_rows = max(1, (event.height - heading_height) // row_height)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.scroll_to(min(self.offset, max(0, self.total - self.visible_rows)))
+            self.render()
+
+    def on_tree_select(self, event):
+        selection = self.tree.selection()
+        # 読み込み中の仮の行は選択できない
+        if selection and self.on_select and self.item_values.get(selection[0]) is not None:
+            self.on_select(self.item_values[selection[0]])
+
+    def on_destroy(self, event):
+        if event.widget is self:
+            self.query_executor.cancel(self.count_key)
+            self.query_executor.cancel(self.page_key)
@@ -1,18 +1,58 @@
 import tkinter as tk
 from gui.pomodoro_gui import PomodoroGUI
 from core.settings_manager import SettingsManager
+from core.pomodoro_service import PomodoroService
+from core.control_client import ControlClient, RemotePomodoroService
+from core.control_server import default_control_address
 from utils.window_tracker import WindowTracker
 from utils.database_manager import DatabaseManager
+from utils.sync_client import SyncClient
+from utils.backup_manager import BackupManager
+from utils.archive_manager import MonthArchiver
 
 def main():
     root = tk.Tk()
     settings_manager = SettingsManager()
     db_manager = DatabaseManager()
-    window_tracker = WindowTracker(db_manager)
+
+    # デーモン（daemon.py）が動いていれば GUI はその操作画面になり、記録と同期はデーモンに任せる
+    client = ControlClient(default_control_address(settings_manager))
+    if client.is_available():
+        service = RemotePomodoroService(client)
+    else:
+        service = PomodoroService(settings_manager, db_manager, WindowTracker(db_manager))
+
+    # 集計サーバーが設定されていればバックグラウンドで同期する
+    sync_client = None
+    if isinstance(service, PomodoroService) and settings_manager.get_setting('sync_server_url'):
+        sync_client = SyncClient(db_manager,
+                                 settings_manager.get_setting('sync_server_url'),
+                                 settings_manager.get_setting('sync_device_id') or None,
+                                 settings_manager.get_setting('sync_interval'))
+        sync_client.start()
+
+    # デーモンがいなければ、定期バックアップと月ごとのアーカイブもこのプロセスで行う
+    backup_manager = None
+    archiver = None
+    if isinstance(service, PomodoroService):
+        backup_manager = BackupManager(db_manager,
+                                       keep=settings_manager.get_setting('backup_keep'),
+                                       interval_hours=settings_manager.get_setting('backup_interval_hours'))
+        backup_manager.start()
+        archiver = MonthArchiver(db_manager)
+        archiver.start()
     
-    app = PomodoroGUI(root, settings_manager, window_tracker, db_manager)
+    app = PomodoroGUI(root, settings_manager, service, db_manager)
     
     root.mainloop() 
 
+    service.shutdown()
+    if sync_client:
+        sync_client.stop()
+    if backup_manager:
+        backup_manager.stop()
+    if archiver:
+        archiver.stop()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,123 @@
+import argparse
+import os
+from utils.database_manager import DatabaseManager
+from utils.backup_manager import BackupManager
+from utils.archive_manager import MonthArchiver
+from utils.bulk_importer import BulkImporter
+from utils.focus_analytics import FocusAnalytics
+
+
+def reclassify(args):
+    db_manager = DatabaseManager(args.db)
+    count = db_manager.reclassify_all()
+    print(f"{count}件のアクティビティを再分類しました。")
+
+
+def rebuild_fts(args):
+    db_manager = DatabaseManager(args.db)
+    count = db_manager.rebuild_search_index()
+    print(f"{count}件のアクティビティで全文検索インデックスを再構築しました。")
+
+
+def reconcile(args):
+    db_manager = DatabaseManager(args.db)
+    results = db_manager.reconcile_sessions(tolerance_ms=args.tolerance_ms)
+    mismatched = [result for result in results if not result['ok']]
+    for result in mismatched:
+        print(f"セッション {result['session_id']}: 経過 {result['wall_ms']}ms, 記録 {result['tracked_ms']}ms, "
+              f"一時停止 {result['paused_ms']}ms, 差分 {result['difference_ms']}ms")
+    print(f"{len(results)}件中{len(mismatched)}件のセッションで記録時間が経過時間と一致しません。")
+
+
+def backup(args):
+    backup_manager = BackupManager(DatabaseManager(args.db), keep=args.keep)
+    snapshot_file = backup_manager.backup()
+    print(f"バックアップを作成しました: {snapshot_file}")
+
+
+def list_backups(args):
+    snapshots = BackupManager(DatabaseManager(args.db)).list_snapshots()
+    if not snapshots:
+        print("バックアップはありません。")
+    for snapshot_file in snapshots:
+        print(f"{os.path.basename(snapshot_file)}  {os.path.getsize(snapshot_file) / 1024:.0f}KB")
+
+
+def restore(args):
+    backup_manager = BackupManager(DatabaseManager(args.db))
+    snapshot_file = args.snapshot
+    if not os.path.exists(snapshot_file):
+        snapshot_file = os.path.join(backup_manager.backup_dir, args.snapshot)
+    backup_manager.restore(snapshot_file)
+    print(f"{snapshot_file} からデータベースを復元しました（復元前の状態もバックアップしてあります）。")
+
+
+def archive(args):
+    archiver = MonthArchiver(DatabaseManager(args.db))
+    if args.month:
+        archiver.archive_month(args.month)
+        months = [args.month]
+    else:
+        months = archiver.archive_closed_months()
+    print(f"{len(months)}か月分をアーカイブしました: {', '.join(months) or 'なし'}")
+
+
+def import_history(args):
+    importer = BulkImporter(DatabaseManager(args.db), batch_size=args.batch_size,
+                            session_gap=args.session_gap * 60, max_session=args.max_session * 60)
+    for path in args.files:
+        summary = importer.import_file(path, None if args.format == 'auto' else args.format)
+        print(f"{path}: {summary['read']}件を読み込み、{summary['events']}件を{summary['sessions']}セッションとして取り込みました"
+              f"（重複 {summary['duplicates']}件、時間0 {summary['empty']}件、重なり {summary['overlapped']}件、"
+              f"不正 {summary['invalid']}件、{summary['elapsed']:.1f}秒）")
+    # 取り込んだセッションの集中度指標をまとめて計算する
+    count = FocusAnalytics(importer.db_manager).backfill()
+    print(f"{count}件のセッションの集中度指標を計算しました。")
+
+
+def backfill_metrics(args):
+    count = FocusAnalytics(DatabaseManager(args.db)).backfill()
+    print(f"{count}件のセッションの集中度指標を計算しました。")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ポモドーロデータベースのメンテナンス")
+    parser.add_argument('--db', default='pomodoro.db', help="data/ 以下のデータベースファイル名")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('reclassify', help="分類ルールを読み直し、記録済みのウィンドウ名を再分類する").set_defaults(func=reclassify)
+    subparsers.add_parser('rebuild-fts', help="ウィンドウ名の全文検索インデックスを作り直す").set_defaults(func=rebuild_fts)
+
+    reconcile_parser = subparsers.add_parser('reconcile', help="記録時間とセッションの経過時間を突き合わせる")
+    reconcile_parser.add_argument('--tolerance-ms', type=int, default=2000)
+    reconcile_parser.set_defaults(func=reconcile)
+
+    backup_parser = subparsers.add_parser('backup', help="データベースのスナップショットを作成する")
+    backup_parser.add_argument('--keep', type=int, default=7, help="残すスナップショットの数")
+    backup_parser.set_defaults(func=backup)
+
+    subparsers.add_parser('list-backups', help="スナップショットの一覧を新しい順に表示する").set_defaults(func=list_backups)
+
+    restore_parser = subparsers.add_parser('restore', help="スナップショットからデータベースを復元する（アプリを止めてから実行する）")
+    restore_parser.add_argument('snapshot', help="スナップショットのパス、または data/backups 内のファイル名")
+    restore_parser.set_defaults(func=restore)
+
+    archive_parser = subparsers.add_parser('archive', help="終わった月を data/archive/YYYY-MM.db に移す（中断しても続きから再開する）")
+    archive_parser.add_argument('--month', help="移す月 (YYYY-MM)。省略時は今月より前のすべての月")
+    archive_parser.set_defaults(func=archive)
+
+    import_parser = subparsers.add_parser('import', help="ActivityWatch の JSON エクスポートや CSV の時間記録を一括で取り込む（再実行しても重複しない）")
+    import_parser.add_argument('files', nargs='+', help="取り込むファイル (.json / .csv)")
+    import_parser.add_argument('--format', choices=['auto', 'activitywatch', 'csv'], default='auto')
+    import_parser.add_argument('--session-gap', type=int, default=5, help="この分数より長く記録が空いたらセッションを区切る")
+    import_parser.add_argument('--max-session', type=int, default=60, help="1セッションの最大の長さ（分）")
+    import_parser.add_argument('--batch-size', type=int, default=50000, help="1トランザクションで書き込む行数")
+    import_parser.set_defaults(func=import_history)
+
+    subparsers.add_parser('backfill-metrics', help="集中度指標が未計算のセッション（以前の記録や取り込んだ履歴）を計算する").set_defaults(func=backfill_metrics)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
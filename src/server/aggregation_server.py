@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+
+from utils.sync_client import decode_batch
+
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+
+class AggregationStore:
+    def __init__(self, db_file='aggregation.db'):
+        self.db_file = os.path.join(os.path.dirname(__file__), '..', '..', 'data', db_file)
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        # WAL にして、取り込み中でも集計を別の接続から読めるようにする
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.local = threading.local()
+        self.create_tables()
+
+    def read_connection(self):
+        # 集計の読み取りはスレッドごとの接続で行う（書き込み用の self.conn とは別）
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.db_file)
+        return conn
+
+    def create_tables(self):
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS batches (
+                    batch_id TEXT PRIMARY KEY,
+                    device_id TEXT NOT NULL,
+                    record_count INTEGER NOT NULL,
+                    received_at DATETIME NOT NULL
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    device_id TEXT NOT NULL,
+                    session_id INTEGER NOT NULL,
+                    session_type TEXT NOT NULL,
+                    start_time DATETIME NOT NULL,
+                    end_time DATETIME,
+                    PRIMARY KEY (device_id, session_id)
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS app_usage (
+                    device_id TEXT NOT NULL,
+                    session_id INTEGER NOT NULL,
+                    app_name TEXT NOT NULL,
+                    window_name TEXT NOT NULL,
+                    duration INTEGER NOT NULL,
+                    PRIMARY KEY (device_id, session_id, app_name, window_name)
+                )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_start_time ON sessions(start_time)')
+
+    def store_batch(self, batch_id, device_id, records):
+        # 同じバッチIDは一度だけ取り込む（クライアントの再送は無視する）
+        with self.conn:
+            cursor = self.conn.execute('''
+                INSERT OR IGNORE INTO batches (batch_id, device_id, record_count, received_at)
+                VALUES (?, ?, ?, ?)
+            ''', (batch_id, device_id, len(records), datetime.now()))
+            if cursor.rowcount == 0:
+                return False
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO sessions (device_id, session_id, session_type, start_time, end_time)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(device_id, r['session_id'], r['session_type'], r['start_time'], r['end_time'])
+                  for r in records if r.get('type') == 'session'])
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO app_usage (device_id, session_id, app_name, window_name, duration)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(device_id, r['session_id'], r['app_name'], r['window_name'], r['duration'])
+                  for r in records if r.get('type') == 'app_usage'])
+            return True
+
+    def get_team_summary(self, start_date=None, end_date=None):
+        conditions = []
+        params = []
+        if start_date:
+            conditions.append('s.start_time >= ?')
+            params.append(start_date)
+        if end_date:
+            conditions.append('s.start_time < DATE(?, \'+1 day\')')
+            params.append(end_date)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        conn = self.read_connection()
+        devices = conn.execute(f'''
+            SELECT s.device_id,
+                   COUNT(*) as session_count,
+                   SUM(s.session_type = 'work') as work_sessions,
+                   COALESCE(SUM((SELECT SUM(a.duration) FROM app_usage a
+                                  WHERE a.device_id = s.device_id AND a.session_id = s.session_id)), 0) as total_duration
+            FROM sessions s
+            {where}
+            GROUP BY s.device_id
+            ORDER BY total_duration DESC
+        ''', params).fetchall()
+        apps = conn.execute(f'''
+            SELECT a.app_name, SUM(a.duration) as total_duration, COUNT(DISTINCT a.device_id) as device_count
+            FROM app_usage a
+            JOIN sessions s ON s.device_id = a.device_id AND s.session_id = a.session_id
+            {where}
+            GROUP BY a.app_name
+            ORDER BY total_duration DESC
+        ''', params).fetchall()
+        return {
+            'devices': [
+                {'device_id': d, 'session_count': count, 'work_sessions': work or 0, 'total_duration': total}
+                for d, count, work, total in devices
+            ],
+            'apps': [
+                {'app_name': app, 'total_duration': total, 'device_count': device_count}
+                for app, total, device_count in apps
+            ],
+            'total_duration': sum(d[3] for d in devices),
+        }
+
+
+class AggregationServer:
+    def __init__(self, store, host='127.0.0.1', port=8765):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.server = None
+        # SQLite の処理はイベントループの外で行い、遅いアップロードや集計が他の接続を止めないようにする
+        # 書き込みは1本のスレッドで順番に、集計は読み取り用のスレッドで並行して行う
+        self.write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='aggregation-write')
+        self.read_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='aggregation-read')
+        self.logger = logging.getLogger(__name__)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.logger.info(f"Aggregation server listening on {self.host}:{self.port}")
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, value = line.decode('latin-1').split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_SIZE:
+                    await self.send_json(writer, 413, {'error': 'payload too large'}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self.dispatch(method, target, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self.send_json(writer, status, payload, close=not keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            self.logger.debug(f"Connection closed: {e}")
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        loop = asyncio.get_running_loop()
+        try:
+            if method == 'POST' and url.path == '/batches':
+                return await loop.run_in_executor(self.write_pool, self.handle_batch, headers, body)
+            if method == 'GET' and url.path == '/summary':
+                query = parse_qs(url.query)
+                summary = await loop.run_in_executor(self.read_pool, self.store.get_team_summary,
+                                                     query.get('start', [None])[0], query.get('end', [None])[0])
+                return 200, summary
+            return 404, {'error': 'not found'}
+        except Exception as e:
+            self.logger.error(f"Error handling {method} {url.path}: {e}")
+            return 500, {'error': str(e)}
+
+    def handle_batch(self, headers, body):
+        batch_id = headers.get('x-batch-id')
+        device_id = headers.get('x-device-id')
+        if not batch_id or not device_id:
+            return 400, {'error': 'X-Batch-Id and X-Device-Id headers are required'}
+        if headers.get('content-encoding') != 'gzip':
+            return 415, {'error': 'payload must be gzip encoded NDJSON'}
+        try:
+            records = decode_batch(body)
+        except (OSError, EOFError, ValueError) as e:
+            return 400, {'error': f'invalid payload: {e}'}
+        try:
+            stored = self.store.store_batch(batch_id, device_id, records)
+        except (KeyError, TypeError, AttributeError) as e:
+            return 400, {'error': f'invalid record: {e!r}'}
+        self.logger.debug(f"Batch {batch_id} from {device_id}: {'stored' if stored else 'duplicate'}")
+        return 200, {'status': 'stored' if stored else 'duplicate', 'records': len(records)}
+
+    async def send_json(self, writer, status, payload, close=False):
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+                   415: 'Unsupported Media Type', 500: 'Internal Server Error'}
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {reasons.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+# 使用例: src ディレクトリで `python -m server.aggregation_server --port 8765`
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ポモドーロ集計サーバー")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--db', default='aggregation.db')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = AggregationServer(AggregationStore(args.db), args.host, args.port)
+    asyncio.run(server.serve_forever())
@@ -1,25 +1,36 @@
 import tkinter as tk
 from tkinter import ttk
 from tkcalendar import DateEntry
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import random
-from matplotlib import font_manager
-from datetime import datetime, timedelta
+from datetime import datetime
+from gui.virtual_table import VirtualTable
+from gui.chart_engine import PieChart, StackedAreaChart, HeatmapChart, apply_japanese_font
+from utils.database_manager import DatabaseManager
+from utils.query_executor import QueryExecutor
+from utils.usage_heatmap import UsageHeatmap
+
+ALL_CATEGORIES = 'すべて'
+
+def format_hours(seconds):
+    return f"{seconds / 3600:.2f}時間"
 
 class AppUsageVisualization:
-    def __init__(self, master):
+    def __init__(self, master, db_manager, query_executor=None):
         self.master = master
+        self.db_manager = db_manager
+        self.query_executor = query_executor or QueryExecutor(db_manager)
+        self.query_executor.attach(self.master)
+        # 曜日 × 時間帯の集計（終わった週の行列はウィンドウを開いている間キャッシュする）
+        self.heatmap = UsageHeatmap(db_manager)
         self.master.title("アプリケーション使用状況")
         self.master.geometry("800x400")  # ウィンドウサイズを大きくしました
 
         self.frame = tk.Frame(self.master)
         self.frame.pack(fill=tk.BOTH, expand=True)
 
-        # 日本語フォントの設定
-        font_path = 'C:/Windows/Fonts/meiryo.ttc'
-        font_prop = font_manager.FontProperties(fname=font_path)
-        plt.rcParams['font.family'] = font_prop.get_name()
+        # 日本語フォントの設定（解決結果はプロセス内でキャッシュされる）
+        apply_japanese_font()
 
         self.create_widgets()
 
@@ -47,27 +58,81 @@ class AppUsageVisualization:
         self.start_date.set_date(today)
         self.end_date.set_date(today)
 
+        # 分類での絞り込み
+        category_frame = tk.Frame(right_frame)
+        category_frame.pack(pady=5)
+        tk.Label(category_frame, text="分類:").pack(side=tk.LEFT)
+        self.category_var = tk.StringVar(value=ALL_CATEGORIES)
+        category_box = ttk.Combobox(category_frame, textvariable=self.category_var, state='readonly', width=18,
+                                    values=[ALL_CATEGORIES] + self.db_manager.classifier.categories())
+        category_box.pack(side=tk.LEFT, padx=5)
+        category_box.bind('<<ComboboxSelected>>', lambda e: self.update_visualization())
+
         # 更新ボタン
         update_button = ttk.Button(right_frame, text="更新", command=self.update_visualization)
         update_button.pack(pady=5)
 
+        # ウィンドウ名の検索
+        search_frame = tk.Frame(right_frame)
+        search_frame.pack(pady=5)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=24)
+        search_entry.pack(side=tk.LEFT, padx=5)
+        search_entry.bind('<Return>', lambda e: self.show_search_results())
+        ttk.Button(search_frame, text="検索", command=self.show_search_results).pack(side=tk.LEFT)
+
         # ランキングのラベル
         self.ranking_label = tk.Label(right_frame, text="使用時間", font=("Meiryo", 12))
         self.ranking_label.pack(pady=5)
 
-        # スクロール可能なテキストウィジェット
-        self.text_widget = tk.Text(right_frame, wrap=tk.WORD, width=30, height=15)
-        self.text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        # 表示範囲だけを取得するランキング表（クリックで詳細を表示）
+        self.ranking_table = VirtualTable(
+            right_frame,
+            columns=[('rank', '順位', 50, 'center'), ('app', 'アプリ', 150, 'w'), ('duration', '使用時間', 90, 'e')],
+            count_rows=self.count_ranking_rows,
+            fetch_rows=self.fetch_ranking_rows,
+            query_executor=self.query_executor,
+            sort_key='duration',
+            descending=True,
+            on_select=lambda values: self.show_app_details(values[1]),
+        )
+        self.ranking_table.pack(fill=tk.BOTH, expand=True)
 
-        # スクロールバーの追加
-        scrollbar = ttk.Scrollbar(right_frame, orient="vertical", command=self.text_widget.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.text_widget.configure(yscrollcommand=scrollbar.set)
+        # グラフ用のキャンバス（円グラフと日別推移をタブで切り替える）
+        notebook = ttk.Notebook(left_frame)
+        notebook.pack(fill=tk.BOTH, expand=True)
 
-        # グラフ用のキャンバス
-        self.fig, self.ax = plt.subplots(figsize=(5, 4), dpi=100)
-        self.canvas = FigureCanvasTkAgg(self.fig, master=left_frame)
+        pie_frame = tk.Frame(notebook)
+        notebook.add(pie_frame, text="円グラフ")
+        self.fig = Figure(figsize=(5, 4), dpi=100)
+        self.ax = self.fig.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.fig, master=pie_frame)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.pie_chart = PieChart(self.ax, self.canvas)
+
+        timeline_frame = tk.Frame(notebook)
+        notebook.add(timeline_frame, text="日別推移")
+        self.timeline_fig = Figure(figsize=(5, 4), dpi=100)
+        self.timeline_ax = self.timeline_fig.add_subplot()
+        self.timeline_canvas = FigureCanvasTkAgg(self.timeline_fig, master=timeline_frame)
+        self.timeline_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.timeline_chart = StackedAreaChart(self.timeline_ax, self.timeline_canvas)
+
+        heatmap_frame = tk.Frame(notebook)
+        notebook.add(heatmap_frame, text="時間帯")
+        # アプリ名での絞り込み（空欄ならすべて。分類は右側の選択を使う）
+        heatmap_filter = tk.Frame(heatmap_frame)
+        heatmap_filter.pack(fill=tk.X, pady=2)
+        tk.Label(heatmap_filter, text="アプリ:").pack(side=tk.LEFT)
+        self.heatmap_app_var = tk.StringVar()
+        heatmap_app_entry = ttk.Entry(heatmap_filter, textvariable=self.heatmap_app_var, width=20)
+        heatmap_app_entry.pack(side=tk.LEFT, padx=5)
+        heatmap_app_entry.bind('<Return>', lambda e: self.update_heatmap())
+        self.heatmap_fig = Figure(figsize=(5, 4), dpi=100)
+        self.heatmap_ax = self.heatmap_fig.add_subplot()
+        self.heatmap_canvas = FigureCanvasTkAgg(self.heatmap_fig, master=heatmap_frame)
+        self.heatmap_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.heatmap_chart = HeatmapChart(self.heatmap_ax, self.heatmap_canvas)
 
         self.update_visualization()
 
@@ -75,48 +140,64 @@ class AppUsageVisualization:
         start_date = self.start_date.get_date()
         end_date = self.end_date.get_date()
 
-        # データの取得（ここでは仮のデータを生成）
-        app_usage = self.generate_sample_data(start_date, end_date)
+        # グラフ用の集計はバックグラウンドで実行し、日付範囲を素早く変えた場合は古い集計を破棄する
+        self.query_executor.run_in_tk(
+            'pie_chart', self.fetch_pie_data, start_date, end_date, self.selected_category(),
+            on_result=lambda data: self.create_pie_chart(*data, start_date, end_date))
+        category = self.selected_category()
+        self.query_executor.run_in_tk(
+            'timeline_chart', self.db_manager.get_daily_app_totals, start_date, end_date, category=category,
+            on_result=lambda rows: self.create_timeline_chart(rows, start_date, end_date, category))
+        self.update_heatmap()
+        # ランキングは読み取りスレッドで取得するので、条件はここで（Tk スレッドで）確定させておく
+        self.ranking_filter = (start_date, end_date, self.selected_category())
+        self.ranking_table.refresh()
 
-        self.create_pie_chart(app_usage, start_date, end_date)
-        self.create_ranking(app_usage)
+    def update_heatmap(self):
+        start_date = self.start_date.get_date()
+        end_date = self.end_date.get_date()
+        app_name = self.heatmap_app_var.get().strip() or None
+        category = self.selected_category()
+        self.query_executor.run_in_tk(
+            'heatmap', self.heatmap.matrix, start_date, end_date, app_name, category,
+            on_result=lambda matrix: self.create_heatmap(matrix, start_date, end_date, app_name, category))
 
-    def create_pie_chart(self, app_usage, start_date, end_date):
-        self.ax.clear()
-        top_5 = dict(sorted(app_usage.items(), key=lambda x: x[1], reverse=True)[:5])
-        other = sum(app_usage.values()) - sum(top_5.values())
-        if other > 0:
-            top_5['その他'] = other
+    def create_heatmap(self, matrix, start_date, end_date, app_name, category):
+        target = ' / '.join(name for name in (app_name, category) if name)
+        title = f"曜日・時間帯別の作業時間{f' ({target})' if target else ''}\n({start_date} ~ {end_date})"
+        self.heatmap_chart.update(matrix, title)
 
-        colors = plt.cm.Set3(range(len(top_5)))
-        wedges, texts, autotexts = self.ax.pie(top_5.values(), labels=top_5.keys(), autopct='%1.1f%%', 
-                                               startangle=90, colors=colors)
-        self.ax.axis('equal')
-        self.ax.set_title(f"トップ5アプリケーション使用状況\n({start_date} ~ {end_date})", fontsize=10)
+    def selected_category(self):
+        category = self.category_var.get()
+        return None if category == ALL_CATEGORIES else category
 
-        plt.setp(texts, size=8)
-        plt.setp(autotexts, size=8)
+    def fetch_pie_data(self, start_date, end_date, category, conn=None):
+        # 円グラフは上位5件と合計だけを取得する
+        ranking = self.db_manager.get_app_ranking(start_date, end_date, limit=5, category=category, conn=conn)
+        top_5 = {app: duration / 3600 for _, app, duration in ranking}
+        total = self.db_manager.get_total_usage(start_date, end_date, category=category, conn=conn) / 3600
+        return top_5, total
 
-        self.canvas.draw()
+    def create_pie_chart(self, top_5, total, start_date, end_date):
+        other = total - sum(top_5.values())
+        if other > 0:
+            top_5['その他'] = other
 
-    def create_ranking(self, app_usage):
-        self.text_widget.config(state=tk.NORMAL)
-        self.text_widget.delete(1.0, tk.END)
+        self.pie_chart.update(top_5, f"トップ5アプリケーション使用状況\n({start_date} ~ {end_date})")
 
-        sorted_usage = sorted(app_usage.items(), key=lambda x: x[1], reverse=True)
-        for i, (app, usage) in enumerate(sorted_usage, 1):
-            self.text_widget.insert(tk.END, f"{i}. {app}: {usage:.2f}時間\n")
-            self.text_widget.tag_add(app, f"{i}.3", f"{i}.{3+len(app)}")
-            self.text_widget.tag_bind(app, "<Button-1>", lambda e, a=app: self.show_app_details(a))
+    def create_timeline_chart(self, daily_totals, start_date, end_date, category):
+        title = f"日別使用時間{f' ({category})' if category else ''} ({start_date} ~ {end_date})"
+        self.timeline_chart.update(daily_totals, start_date, end_date, title)
 
-        self.text_widget.config(state=tk.DISABLED)
+    def count_ranking_rows(self, conn=None):
+        start_date, end_date, category = self.ranking_filter
+        return self.db_manager.count_app_ranking(start_date, end_date, category=category, conn=conn)
 
-    def generate_sample_data(self, start_date, end_date):
-        apps = ['VS Code', 'Chrome', 'Notepad', 'PowerPoint', 'Skype', 'Firefox', 'Word', 'Zoom', 
-                'Outlook', 'Illustrator', 'Photoshop', 'Slack', 'Excel', 'Teams', 'Terminal']
-        
-        days = (end_date - start_date).days + 1
-        return {app: random.uniform(0.5 * days, 8 * days) for app in apps}
+    def fetch_ranking_rows(self, offset, limit, sort_key, descending, conn=None):
+        start_date, end_date, category = self.ranking_filter
+        rows = self.db_manager.get_app_ranking(start_date, end_date, offset, limit, sort_key, descending,
+                                               category=category, conn=conn)
+        return [(f"{rank}.", app, format_hours(duration)) for rank, app, duration in rows]
 
     def show_app_details(self, app_name):
         details_window = tk.Toplevel(self.master)
@@ -127,40 +208,55 @@ class AppUsageVisualization:
         end_date = self.end_date.get_date()
         tk.Label(details_window, text=f"{app_name} の詳細な使用履歴 ({start_date} ~ {end_date})", font=("Meiryo", 14)).pack(pady=10)
 
-        tree = ttk.Treeview(details_window, columns=('日付', '時間', 'ウィンドウ'), show='headings')
-        tree.heading('日付', text='日付')
-        tree.heading('時間', text='使用時間')
-        tree.heading('ウィンドウ', text='ウィンドウ名')
-        tree.column('日付', width=100, anchor='center')
-        tree.column('時間', width=100, anchor='center')
-        tree.column('ウィンドウ', width=350, anchor='w')
-        tree.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
-
-        scrollbar = ttk.Scrollbar(details_window, orient="vertical", command=tree.yview)
-        scrollbar.pack(side='right', fill='y')
-        tree.configure(yscrollcommand=scrollbar.set)
-
-        current_date = start_date
-        while current_date <= end_date:
-            usage = random.uniform(0.1, 2)
-            window_name = self.generate_sample_window_name(app_name)
-            tree.insert('', 'end', values=(current_date.strftime('%Y-%m-%d'), f"{usage:.2f}時間", window_name))
-            current_date += timedelta(days=1)
-
-    def generate_sample_window_name(self, app_name):
-        if app_name == 'Chrome':
-            websites = ['Google - Chrome', 'YouTube - Chrome', 'GitHub - Chrome', 'Stack Overflow - Chrome']
-            return random.choice(websites)
-        elif app_name == 'VS Code':
-            files = ['main.py - Visual Studio Code', 'index.html - Visual Studio Code', 'styles.css - Visual Studio Code']
-            return random.choice(files)
-        elif app_name == 'Word':
-            documents = ['レポート.docx - Word', '議事録.docx - Word', 'プレゼン資料.docx - Word']
-            return random.choice(documents)
-        else:
-            return f"{app_name} - ランダムなドキュメント"
+        # 1年分でも表示中の行だけを作成し、スクロールに合わせて取得する
+        def fetch_detail_rows(offset, limit, sort_key, descending, conn=None):
+            rows = self.db_manager.get_app_details(app_name, start_date, end_date, offset, limit, sort_key, descending,
+                                                   conn=conn)
+            return [(day, format_hours(duration), window) for day, window, duration in rows]
+
+        table = VirtualTable(
+            details_window,
+            columns=[('date', '日付', 100, 'center'), ('duration', '使用時間', 100, 'center'), ('window', 'ウィンドウ名', 350, 'w')],
+            count_rows=lambda conn=None: self.db_manager.count_app_details(app_name, start_date, end_date, conn=conn),
+            fetch_rows=fetch_detail_rows,
+            query_executor=self.query_executor,
+            sort_key='date',
+        )
+        table.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+        table.refresh()
+
+    def show_search_results(self):
+        query = self.search_var.get().strip()
+        if not query:
+            return
+        start_date = self.start_date.get_date()
+        end_date = self.end_date.get_date()
+
+        results_window = tk.Toplevel(self.master)
+        results_window.title(f"「{query}」の検索結果")
+        results_window.geometry("700x400")
+        tk.Label(results_window, text=f"「{query}」を含むセッション ({start_date} ~ {end_date})", font=("Meiryo", 14)).pack(pady=10)
+
+        def fetch_result_rows(offset, limit, sort_key, descending, conn=None):
+            rows = self.db_manager.search_activity(query, start_date, end_date, offset, limit, sort_key, descending,
+                                                   conn=conn)
+            return [(str(start_time)[:16], session_type, format_hours(duration), windows)
+                    for _, session_type, start_time, _, duration, windows in rows]
+
+        table = VirtualTable(
+            results_window,
+            columns=[('start', '開始', 130, 'center'), ('type', '種類', 60, 'center'),
+                     ('duration', '使用時間', 90, 'center'), ('windows', 'ウィンドウ名', 380, 'w')],
+            count_rows=lambda conn=None: self.db_manager.count_search_results(query, start_date, end_date, conn=conn),
+            fetch_rows=fetch_result_rows,
+            query_executor=self.query_executor,
+            sort_key='start',
+            descending=True,
+        )
+        table.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+        table.refresh()
 
 if __name__ == "__main__":
     root = tk.Tk()
-    app = AppUsageVisualization(root)
+    app = AppUsageVisualization(root, DatabaseManager())
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,162 @@
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date
+from utils.database_manager import ARCHIVED_TABLES, INDEXES, month_bounds, partition_condition, partition_params
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class MonthArchiver:
+    # 終わった月のセッションを data/archive/YYYY-MM.db に移し、本体には今月分だけを残す。
+    # コピーはアーカイブ側の最大 id から、削除は id の範囲ごとに続きから再開できるので、途中で止まっても壊れない
+    def __init__(self, db_manager, batch_size=200, pause=0.05, check_interval=3600):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+        self.pause = pause
+        self.check_interval = check_interval
+        self.running = False
+        self.archive_thread = None
+        self.stop_event = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    def archive_closed_months(self, today=None):
+        # 途中で止まった月を先に片付けてから、今月より前の月を古い順に移す
+        month_start = (today or date.today()).replace(day=1)
+        months = [month for month, _, _, state in self.db_manager.get_archive_partitions() if state != 'removed']
+        months += self.db_manager.get_reopened_months()
+        months += self.db_manager.get_unarchived_months(month_start)
+        for month in months:
+            if self.stop_event.is_set():
+                break
+            self.archive_month(month)
+        return months
+
+    def archive_month(self, month):
+        partitions = {row[0]: row for row in self.db_manager.get_archive_partitions()}
+        if month in partitions:
+            _, first_id, last_id, state = partitions[month]
+        else:
+            first_id, last_id = self.db_manager.get_session_id_range(*month_bounds(month))
+            if first_id is None:
+                return
+            state = 'copying'
+            self.db_manager.set_archive_partition(month, first_id, last_id, state)
+
+        if state == 'copying':
+            self._copy(month, first_id, last_id)
+            # ここからはアーカイブ側が正になる（本体の行はクエリから除外される）
+            state = 'archived'
+            self.db_manager.set_archive_partition(month, first_id, last_id, state)
+            self.logger.info(f"Copied sessions {first_id}-{last_id} to archive {month}")
+
+        if state == 'removed':
+            # アーカイブ済みの月に後から入ったセッション（id は既存の範囲より後ろ）だけを追加で移し、範囲を広げる
+            _, last_new = self.db_manager.get_session_id_range(*month_bounds(month))
+            if last_new is None or last_new <= last_id:
+                return
+            self._copy(month, last_id + 1, last_new)
+            last_id = last_new
+            state = 'archived'
+            self.db_manager.set_archive_partition(month, first_id, last_id, state)
+            self.logger.info(f"Appended sessions up to {last_id} to archive {month}")
+
+        if state == 'archived':
+            self._remove(month, first_id, last_id)
+            self.db_manager.set_archive_partition(month, first_id, last_id, 'removed')
+            self.logger.info(f"Removed archived sessions {first_id}-{last_id} ({month}) from the active database")
+
+    def _copy(self, month, first_id, last_id):
+        os.makedirs(self.db_manager.archive_dir, exist_ok=True)
+        # 本体は読むだけ。DatabaseManager の共有接続・ロックは使わない
+        conn = sqlite3.connect(self.db_manager.db_file)
+        try:
+            conn.execute('ATTACH DATABASE ? AS archive', (self.db_manager.archive_path(month),))
+            self._create_schema(conn)
+            copied = conn.execute('SELECT COALESCE(MAX(id), ?) FROM archive.sessions', (first_id - 1,)).fetchone()[0]
+            while copied < last_id:
+                upper = min(copied + self.batch_size, last_id)
+                # 1バッチ分の全テーブルを1トランザクションで書くので、sessions の最大 id が進み具合になる
+                with conn:
+                    for table, column in ARCHIVED_TABLES.items():
+                        conn.execute(f'''
+                            INSERT OR IGNORE INTO archive.{table}
+                            SELECT * FROM main.{table} WHERE {partition_condition(table, column)}
+                        ''', partition_params(month, copied + 1, upper))
+                copied = upper
+                if self.stop_event.wait(self.pause):
+                    raise ArchiveError(f"Archiving {month} was interrupted")
+            self._verify(conn, month, first_id, last_id)
+            self._create_search_index(conn)
+        finally:
+            conn.close()
+
+    def _create_schema(self, conn):
+        # 本体と同じ列構成（ALTER TABLE で追加した列も含む）のテーブルを作る
+        for table in ARCHIVED_TABLES:
+            sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+            conn.execute(sql.replace(f'CREATE TABLE {table}', f'CREATE TABLE IF NOT EXISTS archive.{table}', 1))
+        for name, definition in INDEXES.items():
+            conn.execute(f'CREATE INDEX IF NOT EXISTS archive.{name} ON {definition}')
+        conn.commit()
+
+    def _verify(self, conn, month, first_id, last_id):
+        for table, column in ARCHIVED_TABLES.items():
+            expected = conn.execute(f'SELECT COUNT(*) FROM main.{table} WHERE {partition_condition(table, column)}',
+                                    partition_params(month, first_id, last_id)).fetchone()[0]
+            copied = conn.execute(f'SELECT COUNT(*) FROM archive.{table} WHERE {column} BETWEEN ? AND ?',
+                                  (first_id, last_id)).fetchone()[0]
+            if expected != copied:
+                raise ArchiveError(f"Archive {month} has {copied} rows in {table}, expected {expected}")
+
+    def _create_search_index(self, conn):
+        # 検索でもアーカイブを ATTACH して使えるよう、本体と同じ設定の FTS テーブルを作る
+        tokenizer = self.db_manager.fts_tokenizer
+        if tokenizer is None:
+            return
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS archive.app_usage_fts USING fts5(
+                window_name, content='app_usage', content_rowid='id', tokenize='{tokenizer}'
+            )
+        ''')
+        conn.execute("INSERT INTO archive.app_usage_fts (app_usage_fts) VALUES ('rebuild')")
+        conn.commit()
+
+    def _remove(self, month, first_id, last_id):
+        # 記録を止めないよう、少しずつロックを取って削除する。
+        # 追加で移した月は id の範囲が広く間が空いているので、本体に残っているその月の次のセッションまで飛ばす
+        while True:
+            lower, _ = self.db_manager.get_session_id_range(*month_bounds(month))
+            if lower is None or lower > last_id:
+                break
+            lower = max(lower, first_id)
+            self.db_manager.delete_sessions(month, lower, min(lower + self.batch_size - 1, last_id))
+            if self.stop_event.wait(self.pause):
+                raise ArchiveError("Removing archived sessions was interrupted")
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.stop_event.clear()
+            self.archive_thread = threading.Thread(target=self._run_archive, daemon=True)
+            self.archive_thread.start()
+
+    def stop(self):
+        self.running = False
+        self.stop_event.set()
+        if self.archive_thread:
+            self.archive_thread.join(timeout=5)
+            self.archive_thread = None
+
+    def _run_archive(self):
+        while self.running:
+            try:
+                self.archive_closed_months()
+            except ArchiveError as e:
+                self.logger.warning(f"{e}; will resume later")
+            except Exception as e:
+                self.logger.error(f"Error in archive loop: {e}")
+            self.stop_event.wait(self.check_interval)
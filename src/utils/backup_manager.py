@@ -0,0 +1,237 @@
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from urllib.request import pathname2url
+
+SNAPSHOT_PREFIX = 'pomodoro-'
+SNAPSHOT_SUFFIX = '.db.gz'
+# 月のアーカイブ (data/archive/YYYY-MM.db) のコピーを置くサブディレクトリ。世代管理はせず、月ごとに1つだけ持つ
+ARCHIVE_BACKUP_DIR = 'archive'
+
+
+class BackupError(Exception):
+    pass
+
+
+class BackupManager:
+    # sqlite3 のバックアップ API で pomodoro.db のスナップショットを取り、gzip で圧縮して世代管理する。
+    # DatabaseManager の共有接続・ロックは使わず専用の接続で少しずつコピーするので、記録は止まらない。
+    # 月のアーカイブは閉じた後ほとんど変わらないので、新しいか変更されたものだけを backups/archive にコピーする
+    def __init__(self, db_manager, backup_dir=None, keep=7, interval_hours=24,
+                 pages=64, pause=0.01, check_interval=60):
+        self.db_manager = db_manager
+        self.backup_dir = backup_dir or os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'backups')
+        self.keep = keep
+        self.interval = interval_hours * 3600
+        self.pages = pages
+        self.pause = pause
+        self.check_interval = check_interval
+        self.running = False
+        self.backup_thread = None
+        self.stop_event = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    def list_snapshots(self):
+        # 新しい順に並べたスナップショットのパス
+        if not os.path.isdir(self.backup_dir):
+            return []
+        names = [name for name in os.listdir(self.backup_dir)
+                 if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)]
+        return [os.path.join(self.backup_dir, name) for name in sorted(names, reverse=True)]
+
+    def _copy_progress(self, status, remaining, total):
+        # ページのまとまりをコピーするたびに少し待ち、書き込み側にディスクを譲る
+        time.sleep(self.pause)
+
+    def _copy(self, source, target_file):
+        target = sqlite3.connect(target_file)
+        try:
+            source.backup(target, pages=self.pages, progress=self._copy_progress)
+            result = target.execute('PRAGMA quick_check').fetchone()[0]
+            if result != 'ok':
+                raise BackupError(f"quick_check failed for {target_file}: {result}")
+        finally:
+            target.close()
+
+    def backup(self, rotate=True):
+        os.makedirs(self.backup_dir, exist_ok=True)
+        name = f"{SNAPSHOT_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        temp_file = os.path.join(self.backup_dir, name + '.db.tmp')
+        snapshot_file = os.path.join(self.backup_dir, name + SNAPSHOT_SUFFIX)
+
+        started = time.monotonic()
+        uri = f"file:{pathname2url(os.path.abspath(self.db_manager.db_file))}?mode=ro"
+        source = sqlite3.connect(uri, uri=True)
+        try:
+            # 読み取りトランザクションを開いたままコピーする。WAL なので、途中で記録が書き込まれても
+            # このスナップショットは変わらず、バックアップが最初からやり直しにならない
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            self._copy(source, temp_file)
+        except Exception:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        finally:
+            source.close()
+
+        with open(temp_file, 'rb') as src, gzip.open(snapshot_file + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(snapshot_file + '.tmp', snapshot_file)
+        os.remove(temp_file)
+        self.logger.info(f"Created backup {snapshot_file} in {time.monotonic() - started:.1f}s")
+        self.backup_archives()
+        if rotate:
+            self.rotate()
+        return snapshot_file
+
+    def archive_backup_path(self, month):
+        return os.path.join(self.backup_dir, ARCHIVE_BACKUP_DIR, f'{month}{SNAPSHOT_SUFFIX}')
+
+    def backup_archives(self):
+        # 本体から削除し終えた月のアーカイブを、コピーがないか、コピーより後に変更されていればコピーする
+        copied = []
+        for month, _, _, state in self.db_manager.get_archive_partitions():
+            archive_file = self.db_manager.archive_path(month)
+            backup_file = self.archive_backup_path(month)
+            if state != 'removed' or not os.path.exists(archive_file):
+                continue
+            if os.path.exists(backup_file) and os.path.getmtime(backup_file) >= os.path.getmtime(archive_file):
+                continue
+            try:
+                self._backup_archive(archive_file, backup_file)
+            except (sqlite3.DatabaseError, BackupError) as e:
+                # 壊れたアーカイブでコピーを上書きしない（本体のバックアップは続ける）
+                self.logger.error(f"Could not back up archive {month}: {e}")
+                continue
+            copied.append(month)
+            self.logger.info(f"Backed up archive {month}")
+        return copied
+
+    def rotate(self):
+        removed = []
+        for snapshot_file in self.list_snapshots()[self.keep:]:
+            os.remove(snapshot_file)
+            removed.append(snapshot_file)
+        return removed
+
+    def is_due(self):
+        snapshots = self.list_snapshots()
+        if not snapshots:
+            return True
+        return time.time() - os.path.getmtime(snapshots[0]) >= self.interval
+
+    def verify(self, snapshot_file):
+        # スナップショットを展開して quick_check をかけ、展開したファイルのパスを返す（呼び出し側で削除する）
+        temp_file = snapshot_file[:-len('.gz')] + '.verify'
+        with gzip.open(snapshot_file, 'rb') as src, open(temp_file, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        conn = sqlite3.connect(temp_file)
+        try:
+            result = conn.execute('PRAGMA quick_check').fetchone()[0]
+        finally:
+            conn.close()
+        if result != 'ok':
+            os.remove(temp_file)
+            raise BackupError(f"quick_check failed for {snapshot_file}: {result}")
+        return temp_file
+
+    def _backup_archive(self, archive_file, backup_file):
+        os.makedirs(os.path.dirname(backup_file), exist_ok=True)
+        temp_file = backup_file[:-len('.gz')] + '.tmp'
+        source = sqlite3.connect(f"file:{pathname2url(os.path.abspath(archive_file))}?mode=ro", uri=True)
+        try:
+            self._copy(source, temp_file)
+        except Exception:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        finally:
+            source.close()
+        with open(temp_file, 'rb') as src, gzip.open(backup_file + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(backup_file + '.tmp', backup_file)
+        os.remove(temp_file)
+
+    def restore(self, snapshot_file):
+        # 復元前に現在のデータベースもスナップショットに残し（世代数の整理はしない）、バックアップ API で上書きする
+        # （ファイルを直接差し替えないので、WAL や他の接続があっても壊れない）
+        restore_file = self.verify(snapshot_file)
+        try:
+            self.backup(rotate=False)
+            source = sqlite3.connect(restore_file)
+            try:
+                with self.db_manager.lock:
+                    target = self.db_manager.get_connection()
+                    source.backup(target, pages=self.pages)
+            finally:
+                source.close()
+            self.restore_archives(restore_file)
+        finally:
+            os.remove(restore_file)
+        self.logger.info(f"Restored database from {snapshot_file}")
+
+    def restore_archives(self, restored_file):
+        # 復元したデータベースが参照するアーカイブのうち、無いか壊れているものをコピーから戻す
+        # （残っているアーカイブのほうがコピーより新しいことがあるので、正常なものは上書きしない）
+        conn = sqlite3.connect(restored_file)
+        try:
+            months = [row[0] for row in conn.execute(
+                "SELECT month FROM archive_partitions WHERE state != 'copying' ORDER BY month")]
+        except sqlite3.OperationalError:
+            months = []
+        finally:
+            conn.close()
+
+        restored = []
+        for month in months:
+            archive_file = self.db_manager.archive_path(month)
+            if os.path.exists(archive_file) and self._is_intact(archive_file):
+                continue
+            backup_file = self.archive_backup_path(month)
+            if not os.path.exists(backup_file):
+                self.logger.warning(f"Archive {month} is missing or damaged and has no backup")
+                continue
+            temp_file = self.verify(backup_file)
+            os.makedirs(os.path.dirname(archive_file), exist_ok=True)
+            shutil.move(temp_file, archive_file)
+            restored.append(month)
+            self.logger.info(f"Restored archive {month} from {backup_file}")
+        return restored
+
+    def _is_intact(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute('PRAGMA quick_check').fetchone()[0] == 'ok'
+        except sqlite3.DatabaseError:
+            return False
+        finally:
+            conn.close()
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.stop_event.clear()
+            self.backup_thread = threading.Thread(target=self._run_backup, daemon=True)
+            self.backup_thread.start()
+
+    def stop(self):
+        self.running = False
+        self.stop_event.set()
+        if self.backup_thread:
+            self.backup_thread.join(timeout=self.check_interval)
+            self.backup_thread = None
+
+    def _run_backup(self):
+        while self.running:
+            try:
+                if self.is_due():
+                    self.backup()
+            except Exception as e:
+                self.logger.error(f"Error in backup loop: {e}")
+            self.stop_event.wait(self.check_interval)
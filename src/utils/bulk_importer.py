@@ -0,0 +1,419 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+
+# 取り込んだセッションの種類。GUI の「前回のセッション」には work / break だけが使われる
+IMPORTED_SESSION_TYPE = 'imported'
+
+# ActivityWatch のエクスポートでイベントの配列が始まる位置
+EVENTS_KEY = re.compile(r'"events"\s*:\s*\[')
+
+# CSV の列名として受け付ける名前（小文字で比較する）
+CSV_COLUMNS = {
+    'start': ('start', 'start_time', 'timestamp'),
+    'end': ('end', 'end_time'),
+    'duration': ('duration', 'duration_seconds'),
+    'app': ('app', 'app_name', 'application'),
+    'title': ('title', 'window', 'window_name'),
+}
+
+
+class BulkImportError(Exception):
+    pass
+
+
+def parse_timestamp(value):
+    # タイムゾーン付きの時刻（ActivityWatch は UTC）はローカル時刻に直し、sessions と同じくタイムゾーンなしで扱う
+    value = value.strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+
+def to_ms(timestamp):
+    return (timestamp - EPOCH) // timedelta(milliseconds=1)
+
+
+def from_ms(ms):
+    return EPOCH + timedelta(milliseconds=ms)
+
+
+def normalize_app(app_name):
+    # WindowTracker と同じく、実行ファイル名の拡張子を除く
+    if app_name.lower().endswith('.exe'):
+        return app_name.split('.')[0]
+    return app_name
+
+
+def event_key(start_ms, duration_ms, app_name, window_name):
+    key = f'{start_ms}\x1f{duration_ms}\x1f{app_name}\x1f{window_name}'.encode('utf-8')
+    return hashlib.blake2b(key, digest_size=16).digest()
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.json':
+        return 'activitywatch'
+    if extension in ('.csv', '.tsv'):
+        return 'csv'
+    raise BulkImportError(f"Cannot detect the format of {path}; specify activitywatch or csv")
+
+
+def iter_json_events(f, chunk_size=1 << 20):
+    # json.load でファイル全体を読み込まず、"events" の配列の要素を1つずつ raw_decode する。
+    # バケットのエクスポート ({"buckets": {...: {"events": [...]}}}) とイベントの配列の両方を読める
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size)
+    eof = not buffer
+    position = len(buffer) - len(buffer.lstrip())
+    in_events = buffer[position:position + 1] == '['
+    if in_events:
+        position += 1
+
+    while True:
+        if not in_events:
+            match = EVENTS_KEY.search(buffer, position)
+            if match is None:
+                if eof:
+                    return
+                # キーがチャンクの境目で切れている場合に備えて末尾を残しておく
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[max(position, len(buffer) - 64):] + chunk
+                position = 0
+                continue
+            position = match.end()
+            in_events = True
+
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            position += 1
+            in_events = False
+            continue
+        try:
+            if position >= len(buffer):
+                raise ValueError("need more data")
+            event, position = decoder.raw_decode(buffer, position)
+        except ValueError as e:
+            if eof:
+                raise BulkImportError(f"Malformed JSON near offset {position}: {e}")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield event
+        if position > chunk_size:
+            buffer = buffer[position:]
+            position = 0
+
+
+def activitywatch_records(f):
+    for event in iter_json_events(f):
+        data = event.get('data') or {}
+        if 'app' not in data:
+            continue  # AFK やブラウザ拡張のイベントはウィンドウの記録ではない
+        yield parse_timestamp(event['timestamp']), float(event.get('duration') or 0), data['app'], data.get('title') or ''
+
+
+def csv_records(f):
+    sample = f.read(4096)
+    f.seek(0)
+    dialect = csv.Sniffer().sniff(sample, delimiters=',\t;') if sample else csv.excel
+    reader = csv.DictReader(f, dialect=dialect)
+    names = {name.strip().lower(): name for name in reader.fieldnames or []}
+    columns = {field: next((names[alias] for alias in aliases if alias in names), None)
+               for field, aliases in CSV_COLUMNS.items()}
+    missing = [field for field in ('start', 'app') if columns[field] is None]
+    if missing or (columns['duration'] is None and columns['end'] is None):
+        raise BulkImportError(f"CSV needs start, app and duration or end columns; found {reader.fieldnames}")
+
+    for row in reader:
+        start = parse_timestamp(row[columns['start']])
+        if columns['duration'] is not None and row[columns['duration']]:
+            duration = float(row[columns['duration']])
+        else:
+            duration = (parse_timestamp(row[columns['end']]) - start).total_seconds()
+        title = row[columns['title']] if columns['title'] is not None else ''
+        yield start, duration, row[columns['app']], title or ''
+
+
+class BulkImporter:
+    # 他のトラッカーの記録（ActivityWatch の JSON エクスポート、CSV の時間記録）を一括で取り込む。
+    # record_activity のように1行ずつロックを取って書くのではなく、
+    #   1. ファイルを少しずつ読んで temp テーブルに入れ（同じイベントはキーで1つにまとめる）
+    #   2. 取り込み済みのキーを除いて開始時刻順に並べ、間が空いたところでセッションに区切り
+    #   3. batch_size 行ごとに sessions / app_usage を1トランザクションで executemany する
+    #   4. 最後に日別集計を一度だけ足す
+    # 新しい行が defer_threshold 以上あるときは、インデックスと FTS のトリガーを外して最後に作り直す
+    def __init__(self, db_manager, batch_size=50000, session_gap=300, max_session=3600, defer_threshold=100000):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+        self.session_gap_ms = session_gap * 1000
+        self.max_session_ms = max_session * 1000
+        self.defer_threshold = defer_threshold
+        self.logger = logging.getLogger(__name__)
+
+    def import_file(self, path, fmt=None):
+        fmt = fmt or detect_format(path)
+        if fmt == 'activitywatch':
+            with open(path, 'r', encoding='utf-8') as f:
+                return self.import_records(activitywatch_records(f), path)
+        if fmt == 'csv':
+            with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+                return self.import_records(csv_records(f), path)
+        raise BulkImportError(f"Unknown import format: {fmt}")
+
+    def import_records(self, records, source):
+        started = time.monotonic()
+        # 共有接続・ロックは使わず専用の接続で書く。バッチごとにコミットするので記録は長く止まらない
+        conn = sqlite3.connect(self.db_manager.db_file, timeout=30)
+        try:
+            self.finish_interrupted(conn)
+            summary = self._stage(conn, records)
+            new_events = self._select_new(conn)
+            summary['duplicates'] += summary['staged'] - new_events
+            deferred = new_events >= self.defer_threshold
+
+            cursor = conn.cursor()
+            cursor.execute('INSERT INTO import_runs (source, started_at, deferred) VALUES (?, ?, ?)',
+                           (os.path.abspath(source), datetime.now(), deferred))
+            run_id = cursor.lastrowid
+            if deferred:
+                self.db_manager.drop_indexes(cursor)
+                self.db_manager.drop_search_triggers(cursor)
+            conn.commit()
+
+            summary.update(self._write(conn, run_id))
+            self._finish(conn, [run_id], deferred)
+            conn.execute('DROP TABLE temp.import_events')
+        finally:
+            conn.close()
+        summary['deferred'] = deferred
+        summary['elapsed'] = time.monotonic() - started
+        self.logger.info(f"Imported {summary['events']} events in {summary['sessions']} sessions "
+                         f"from {source} in {summary['elapsed']:.1f}s")
+        return summary
+
+    def finish_interrupted(self, conn):
+        # 前回の取り込みがインデックスを外したまま止まっていたら、ここで作り直す
+        # （書き込み済みのバッチはキーも一緒にコミットしてあるので、続きは再実行で入る）
+        rows = conn.execute('SELECT id, deferred FROM import_runs WHERE finished_at IS NULL').fetchall()
+        if rows:
+            self.logger.warning(f"Finishing {len(rows)} interrupted import run(s)")
+            self._finish(conn, [run_id for run_id, _ in rows], any(deferred for _, deferred in rows))
+
+    def _stage(self, conn, records):
+        conn.execute('DROP TABLE IF EXISTS temp.import_staging')
+        conn.execute('''
+            CREATE TEMP TABLE import_staging (
+                event_key BLOB PRIMARY KEY,
+                start_ms INTEGER NOT NULL,
+                duration_ms INTEGER NOT NULL,
+                app_name TEXT NOT NULL,
+                window_name TEXT NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        summary = {'read': 0, 'invalid': 0, 'empty': 0, 'duplicates': 0, 'staged': 0}
+        rows = []
+        records = iter(records)
+        while True:
+            try:
+                start, duration, app_name, window_name = next(records)
+            except StopIteration:
+                break
+            except (KeyError, TypeError, ValueError) as e:
+                # 1行の不正な値で取り込み全体を止めない（ファイル自体が壊れている場合は BulkImportError）
+                summary['invalid'] += 1
+                self.logger.debug(f"Skipping invalid record: {e}")
+                continue
+            summary['read'] += 1
+            duration_ms = int(round(duration * 1000))
+            if duration_ms <= 0:
+                summary['empty'] += 1
+                continue
+            start_ms = to_ms(start)
+            app_name = normalize_app(app_name)
+            rows.append((event_key(start_ms, duration_ms, app_name, window_name),
+                         start_ms, duration_ms, app_name, window_name))
+            if len(rows) >= self.batch_size:
+                self._insert_staging(conn, rows)
+                rows = []
+        self._insert_staging(conn, rows)
+        summary['staged'] = conn.execute('SELECT COUNT(*) FROM temp.import_staging').fetchone()[0]
+        summary['duplicates'] = summary['read'] - summary['empty'] - summary['staged']
+        return summary
+
+    def _insert_staging(self, conn, rows):
+        conn.executemany('INSERT OR IGNORE INTO temp.import_staging VALUES (?, ?, ?, ?, ?)', rows)
+        conn.commit()
+
+    def _select_new(self, conn):
+        # 取り込み済みのイベントを除き、開始時刻順に連番を振る（連番の順に読めば並べ替え済みになる）
+        conn.execute('DROP TABLE IF EXISTS temp.import_events')
+        conn.execute('''
+            CREATE TEMP TABLE import_events (
+                seq INTEGER PRIMARY KEY,
+                event_key BLOB NOT NULL,
+                start_ms INTEGER NOT NULL,
+                duration_ms INTEGER NOT NULL,
+                app_name TEXT NOT NULL,
+                window_name TEXT NOT NULL
+            )
+        ''')
+        cursor = conn.execute('''
+            INSERT INTO temp.import_events (event_key, start_ms, duration_ms, app_name, window_name)
+            SELECT s.event_key, s.start_ms, s.duration_ms, s.app_name, s.window_name
+            FROM temp.import_staging s
+            WHERE NOT EXISTS (SELECT 1 FROM main.imported_events e WHERE e.event_key = s.event_key)
+            ORDER BY s.start_ms, s.event_key
+        ''')
+        conn.execute('DROP TABLE temp.import_staging')
+        conn.commit()
+        return cursor.rowcount
+
+    def _write(self, conn, run_id):
+        classify = self.db_manager.classifier.classify
+        batch = {'sessions': [], 'usage': [], 'keys': []}
+        totals = {'events': 0, 'sessions': 0, 'overlapped': 0}
+        last_end = None
+        session = None
+        seq = 0
+
+        while True:
+            rows = conn.execute('''
+                SELECT seq, event_key, start_ms, duration_ms, app_name, window_name
+                FROM temp.import_events WHERE seq > ? ORDER BY seq LIMIT ?
+            ''', (seq, self.batch_size)).fetchall()
+            if not rows:
+                break
+            for seq, key, start_ms, duration_ms, app_name, window_name in rows:
+                # 前のイベントと重なる部分は除く（ActivityWatch のイベントは少し重なることがある）
+                if last_end is not None and start_ms < last_end:
+                    duration_ms -= last_end - start_ms
+                    start_ms = last_end
+                    if duration_ms <= 0:
+                        batch['keys'].append((key,))
+                        totals['overlapped'] += 1
+                        continue
+                if (session is None or start_ms - session[1] > self.session_gap_ms
+                        or start_ms - session[0] >= self.max_session_ms):
+                    # セッションの区切り。バッチが埋まっていれば、ここまでの完結したセッションを書き込む
+                    if len(batch['usage']) >= self.batch_size:
+                        self._flush(conn, run_id, batch, totals)
+                    session = [start_ms, start_ms, 0]
+                    batch['sessions'].append(session)
+                # セッション内の記録のない時間は一時停止として扱い、reconcile の突き合わせが合うようにする
+                session[2] += start_ms - session[1]
+                session[1] = start_ms + duration_ms
+                last_end = session[1]
+                batch['keys'].append((key,))
+                batch['usage'].append((len(batch['sessions']) - 1, app_name, window_name, duration_ms,
+                                       classify(app_name, window_name), start_ms))
+        self._flush(conn, run_id, batch, totals)
+        return totals
+
+    def _flush(self, conn, run_id, batch, totals):
+        if not batch['keys']:
+            return
+        cursor = conn.cursor()
+        # 他のプロセス（記録中のアプリ）とセッションの id がぶつからないよう、書き込みロックを取ってから採番する
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('''
+                SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'sessions'), 0),
+                           COALESCE((SELECT MAX(id) FROM sessions), 0)) + 1
+            ''')
+            first_id = cursor.fetchone()[0]
+            cursor.executemany('''
+                INSERT INTO sessions (id, session_type, start_time, end_time, paused_ms)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(first_id + index, IMPORTED_SESSION_TYPE, from_ms(start_ms), from_ms(end_ms), paused_ms)
+                  for index, (start_ms, end_ms, paused_ms) in enumerate(batch['sessions'])])
+            cursor.executemany('''
+                INSERT INTO app_usage (session_id, app_name, window_name, duration, duration_ms, category, started_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(first_id + index, app_name, window_name, duration_ms // 1000, duration_ms, category, start_ms)
+                  for index, app_name, window_name, duration_ms, category, start_ms in batch['usage']])
+            # キーは行と同じトランザクションで書くので、途中で止まっても再実行で続きから入る
+            cursor.executemany('INSERT INTO imported_events (event_key) VALUES (?)', batch['keys'])
+            cursor.execute('''
+                UPDATE import_runs
+                SET events = events + ?, sessions = sessions + ?,
+                    first_session_id = COALESCE(first_session_id, ?), last_session_id = ?
+                WHERE id = ?
+            ''', (len(batch['usage']), len(batch['sessions']), first_id, first_id + len(batch['sessions']) - 1, run_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        totals['events'] += len(batch['usage'])
+        totals['sessions'] += len(batch['sessions'])
+        self.logger.info(f"Imported {totals['events']} events in {totals['sessions']} sessions")
+        for rows in batch.values():
+            rows.clear()
+
+    def _finish(self, conn, run_ids, deferred):
+        cursor = conn.cursor()
+        if deferred:
+            started = time.monotonic()
+            # トリガーを外している間に記録中のアプリやアーカイブが書き換えた行も含め、FTS は app_usage から作り直す。
+            # 書き込みロックを取ってから行い、作り直しとトリガーの再作成の間に他の書き込みが入らないようにする
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                self.db_manager.create_indexes(cursor)
+                self.db_manager.create_search_index(cursor)
+                if self.db_manager.fts_tokenizer is not None:
+                    cursor.execute("INSERT INTO app_usage_fts (app_usage_fts) VALUES ('rebuild')")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            self.logger.info(f"Rebuilt indexes after import in {time.monotonic() - started:.1f}s")
+        rollup = self._daily_rollup(cursor, run_ids)
+        # 日別集計と完了の記録は同じトランザクションで書き、再実行で二重に足さないようにする
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.executemany('''
+                INSERT INTO daily_app_usage (day, app_name, duration_ms) VALUES (?, ?, ?)
+                ON CONFLICT (day, app_name) DO UPDATE SET duration_ms = duration_ms + excluded.duration_ms
+            ''', rollup)
+            cursor.executemany('UPDATE import_runs SET finished_at = ? WHERE id = ?',
+                               [(datetime.now(), run_id) for run_id in run_ids])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _daily_rollup(self, cursor, run_ids):
+        # 取り込んだセッションの日・アプリごとの合計。取り込み中にアーカイブへ移ったセッションも含めるため range_* ビューから読む
+        placeholders = ','.join('?' * len(run_ids))
+        cursor.execute(f'''
+            SELECT first_session_id, last_session_id FROM import_runs
+            WHERE id IN ({placeholders}) AND first_session_id IS NOT NULL
+        ''', run_ids)
+        rollup = []
+        for first_id, last_id in cursor.fetchall():
+            rollup += self.db_manager.merge_range(cursor, None, None, ('''
+                SELECT DATE(a.start_time) as day, a.app_name, SUM(a.duration_ms) as duration_ms
+                FROM range_activity a
+                WHERE a.session_id BETWEEN ? AND ? AND a.session_type = ?
+                GROUP BY day, a.app_name
+            ''', (first_id, last_id, IMPORTED_SESSION_TYPE)), '''
+                SELECT a.day, a.app_name, SUM(a.duration_ms)
+                FROM {partial} a
+                GROUP BY a.day, a.app_name
+            ''')
+        return rollup
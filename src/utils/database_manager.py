@@ -1,23 +1,277 @@
 import sqlite3
 import os
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import threading
 import logging
+from contextlib import contextmanager
+from urllib.request import pathname2url
+from utils.focus_analytics import compute_session_metrics, format_metrics
+from utils.title_classifier import TitleClassifier
+
+# ORDER BY に埋め込めるのはここに定義した列だけ
+RANKING_ORDER_COLUMNS = {
+    'rank': 'rank',
+    'app': 'a.app_name',
+    'duration': 'total_duration',
+}
+
+DETAIL_ORDER_COLUMNS = {
+    'date': 'day',
+    'duration': 'total_duration',
+    'window': 'a.window_name',
+}
+
+SEARCH_ORDER_COLUMNS = {
+    'start': 'a.start_time',
+    'type': 'a.session_type',
+    'duration': 'total_duration',
+    'windows': 'windows',
+}
+
+# 期間指定の集計用インデックス。一括取り込みで大量の行を入れるときは外しておき、最後に作り直す
+INDEXES = {
+    'idx_sessions_start_time': 'sessions(start_time)',
+    'idx_app_usage_session': 'app_usage(session_id)',
+    'idx_app_usage_app': 'app_usage(app_name, session_id)',
+    'idx_app_usage_category': 'app_usage(category, session_id)',
+}
+
+# 月ごとのアーカイブを一度に ATTACH できる数（SQLite の既定の上限。setlimit では上げられない）。
+# 超える期間はこの数ずつ ATTACH して同じクエリを実行し、部分集計をまとめる
+MAX_ATTACHED_PARTITIONS = 10
+
+# アーカイブに移すテーブルと、sessions の id の範囲で切り出すときに使う列
+ARCHIVED_TABLES = {
+    'sessions': 'id',
+    'app_usage': 'session_id',
+    'pomodoros': 'session_id',
+    'session_metrics': 'session_id',
+    'session_app_totals': 'session_id',
+}
+
+def date_range_params(start_date, end_date):
+    # start_time は文字列で保存されているため、日付の半開区間で比較してインデックスを使う
+    return str(start_date), str(end_date + timedelta(days=1))
+
+def search_conditions(start_date, end_date, alias='a'):
+    conditions = []
+    params = []
+    if start_date is not None:
+        conditions.append(f'AND {alias}.start_time >= ?')
+        params.append(str(start_date))
+    if end_date is not None:
+        conditions.append(f'AND {alias}.start_time < ?')
+        params.append(str(end_date + timedelta(days=1)))
+    return ' '.join(conditions), params
+
+def local_epoch_ms(timestamp):
+    # タイムゾーンなしのローカル時刻を、そのままエポックからのミリ秒にする（app_usage.started_at の形式）
+    return (timestamp - datetime(1970, 1, 1)) // timedelta(milliseconds=1)
+
+
+def month_bounds(month):
+    # 'YYYY-MM' をその月の初日と翌月の初日にする
+    first = datetime.strptime(month, '%Y-%m').date()
+    return first, (first + timedelta(days=32)).replace(day=1)
+
+def as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)[:10]).date()
+
+def partition_schema(month):
+    return f"archive_{month.replace('-', '_')}"
+
+def activity_arm(sessions_table, usage_table, where=''):
+    # 1つのパーティションの app_usage と sessions を結合した行。期間の条件は各 arm に押し下げられてインデックスが使われる
+    return f'''
+        SELECT a.id, a.session_id, a.app_name, a.window_name, a.duration_ms, a.category,
+               s.session_type, s.start_time, s.end_time
+        FROM {usage_table} a
+        JOIN {sessions_table} s ON a.session_id = s.id {where}
+    '''
+
+def session_arm(sessions_table, usage_table, where=''):
+    return f'''
+        SELECT s.id, s.session_type, s.start_time, s.end_time, s.paused_ms,
+               (SELECT COALESCE(SUM(u.duration_ms), 0) FROM {usage_table} u WHERE u.session_id = s.id) as tracked_ms
+        FROM {sessions_table} s {where}
+    '''
+
+def partition_condition(table, column, schema='main'):
+    # パーティションの行は id の範囲と開始日時の両方で切り出す。
+    # 取り込んだ過去のセッションは id が時系列順に並ばないため、id の範囲だけだと別の月の行が混ざる
+    if table == 'sessions':
+        return f'{column} BETWEEN ? AND ? AND start_time >= ? AND start_time < ?'
+    return f'''{column} IN (
+        SELECT id FROM {schema}.sessions WHERE id BETWEEN ? AND ? AND start_time >= ? AND start_time < ?
+    )'''
+
+def partition_params(month, first_session_id, last_session_id):
+    month_start, month_end = month_bounds(month)
+    return first_session_id, last_session_id, str(month_start), str(month_end)
+
+def fts_query(query):
+    # 入力をそのまま MATCH 構文として解釈させず、語ごとにフレーズとして AND 検索する
+    terms = query.split()
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def category_filter(category):
+    # 分類で絞り込む場合は idx_app_usage_category を使える等価条件にする
+    if category is None:
+        return '', ()
+    return 'AND a.category = ?', (category,)
 
 class DatabaseManager:
     def __init__(self, db_file='pomodoro.db'):
         self.db_file = os.path.join(os.path.dirname(__file__), '..', '..', 'data', db_file)
+        self.archive_dir = os.path.join(os.path.dirname(self.db_file), 'archive')
         self.conn = None
         self.lock = threading.Lock()
-        self.create_tables()
+        self.classifier = TitleClassifier()
+        self.fts_tokenizer = None
         logging.basicConfig(filename='pomodoro_debug.log', level=logging.DEBUG)
         self.logger = logging.getLogger(__name__)
+        self.create_tables()
 
     def get_connection(self):
         if self.conn is None:
             self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            # WAL にして、書き込み中でも別接続から読めるようにする
+            self.conn.execute('PRAGMA journal_mode=WAL')
         return self.conn
 
+    @contextmanager
+    def reading(self, conn=None):
+        # 読み取り専用接続が渡された場合は共有接続のロックを取らずにその接続で読む
+        if conn is not None:
+            yield conn.cursor()
+            return
+        with self.lock:
+            with self.get_connection() as conn:
+                yield conn.cursor()
+
+    def open_read_connection(self):
+        uri = f"file:{pathname2url(os.path.abspath(self.db_file))}?mode=ro"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def archive_path(self, month):
+        return os.path.join(self.archive_dir, f'{month}.db')
+
+    def attach_range(self, cursor, start_date=None, end_date=None, chunk=0):
+        # 期間に重なる月のアーカイブを ATTACH し、temp の UNION ALL ビュー
+        # (range_activity / range_sessions / range_session_metrics) から読めるようにする。
+        # ATTACH の上限を超える期間は MAX_ATTACHED_PARTITIONS 個ずつのチャンクに分け、chunk 番目だけを ATTACH する
+        # （本体は最初のチャンクに含める）。チャンクの数は戻り値の 'chunks' に入る。
+        # ビューは接続ごとに作って残しておき、対象のアーカイブが変わったときだけ作り直す
+        cursor.execute("SELECT month, first_session_id, last_session_id, state FROM archive_partitions WHERE state != 'copying'")
+        partitions = sorted(cursor.fetchall())
+        start_date = as_date(start_date) if start_date is not None else None
+        end_date = as_date(end_date) if end_date is not None else None
+        overlapping = []
+        for month, _, _, _ in partitions:
+            month_start, month_end = month_bounds(month)
+            if start_date is not None and month_end <= start_date:
+                continue
+            if end_date is not None and month_start > end_date:
+                continue
+            if os.path.exists(self.archive_path(month)):
+                overlapping.append(month)
+        chunks = [overlapping[i:i + MAX_ATTACHED_PARTITIONS]
+                  for i in range(0, len(overlapping), MAX_ATTACHED_PARTITIONS)] or [[]]
+        months = chunks[chunk]
+        schemas = [partition_schema(month) for month in months]
+        tables = [(f'{schema}.sessions', f'{schema}.app_usage', f'{schema}.session_metrics', '') for schema in schemas]
+        fts_schemas = list(schemas)
+        excluded = []
+        if chunk == 0:
+            # コピー済みで本体からの削除が終わっていない月は、本体側の行を除外して二重に数えないようにする
+            excluded = [(month, int(first_id), int(last_id)) for month, first_id, last_id, state in partitions if state == 'archived']
+            main_condition = ' AND '.join(
+                "NOT (s.id BETWEEN {} AND {} AND s.start_time >= '{}' AND s.start_time < '{}')".format(
+                    *partition_params(month, first_id, last_id))
+                for month, first_id, last_id in excluded)
+            # ビューを通さずパーティションごとに直接読むクエリ向けの (sessions, app_usage, session_metrics, 本体の行の除外条件)
+            tables.insert(0, ('main.sessions', 'main.app_usage', 'main.session_metrics', main_condition))
+            fts_schemas.insert(0, 'main')
+        partition_info = {
+            'fts_schemas': fts_schemas,
+            'tables': tables,
+            'chunks': len(chunks),
+        }
+        signature = repr((chunk, months, excluded))
+
+        try:
+            cursor.execute('SELECT signature FROM temp.range_state')
+            row = cursor.fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        if row is not None and row[0] == signature:
+            return partition_info
+
+        for view in ('range_activity', 'range_sessions', 'range_session_metrics'):
+            cursor.execute(f'DROP VIEW IF EXISTS temp.{view}')
+        cursor.execute('PRAGMA database_list')
+        for _, name, _ in cursor.fetchall():
+            if name.startswith('archive_'):
+                cursor.execute(f'DETACH DATABASE {name}')
+
+        for month, schema in zip(months, schemas):
+            cursor.execute(f'ATTACH DATABASE ? AS {schema}', (self.archive_path(month),))
+        activity_arms = []
+        session_arms = []
+        metrics_arms = []
+        for sessions_table, usage_table, metrics_table, condition in tables:
+            where = f'WHERE {condition}' if condition else ''
+            activity_arms.append(activity_arm(sessions_table, usage_table, where))
+            session_arms.append(session_arm(sessions_table, usage_table, where))
+            metrics_arms.append(f'SELECT session_id FROM {metrics_table}')
+
+        cursor.execute(f"CREATE TEMP VIEW range_activity AS {' UNION ALL '.join(activity_arms)}")
+        cursor.execute(f"CREATE TEMP VIEW range_sessions AS {' UNION ALL '.join(session_arms)}")
+        cursor.execute(f"CREATE TEMP VIEW range_session_metrics AS {' UNION ALL '.join(metrics_arms)}")
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS range_state (signature TEXT)')
+        cursor.execute('DELETE FROM temp.range_state')
+        cursor.execute('INSERT INTO temp.range_state (signature) VALUES (?)', (signature,))
+        cursor.connection.commit()
+        return partition_info
+
+    def range_chunks(self, cursor, start_date=None, end_date=None):
+        # 期間のチャンクを順に ATTACH し、それぞれの partition_info を返す。行をそのまま返すクエリはチャンクごとの結果をつなぐ
+        chunk = 0
+        while True:
+            partition_info = self.attach_range(cursor, start_date, end_date, chunk)
+            yield partition_info
+            chunk += 1
+            if chunk >= partition_info['chunks']:
+                return
+
+    def merge_range(self, cursor, start_date, end_date, partial, final, final_params=()):
+        # range_* ビューを読む部分集計 partial（(sql, params) か、partition_info からそれを作る関数）を
+        # final の {partial} として読む。final 自身のパラメータはすべて {partial} より後に置く。
+        # チャンクが複数ある場合は、チャンクごとの部分集計だけを temp テーブルに集めてから final を実行する
+        build = partial if callable(partial) else lambda partition_info: partial
+        chunks = self.range_chunks(cursor, start_date, end_date)
+        partition_info = next(chunks)
+        sql, params = build(partition_info)
+        if partition_info['chunks'] == 1:
+            cursor.execute(final.format(partial=f'({sql})'), (*params, *final_params))
+            return cursor.fetchall()
+        cursor.execute('DROP TABLE IF EXISTS temp.range_partial')
+        cursor.execute(f'CREATE TEMP TABLE range_partial AS {sql}', params)
+        # ATTACH はトランザクション中にできないので、チャンクごとに確定する
+        cursor.connection.commit()
+        for partition_info in chunks:
+            sql, params = build(partition_info)
+            cursor.execute(f'INSERT INTO temp.range_partial {sql}', params)
+            cursor.connection.commit()
+        cursor.execute(final.format(partial='temp.range_partial'), final_params)
+        rows = cursor.fetchall()
+        cursor.execute('DROP TABLE temp.range_partial')
+        return rows
+
     def create_tables(self):
         with self.get_connection() as conn:
             cursor = conn.cursor()
@@ -28,7 +282,8 @@ class DatabaseManager:
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     session_type TEXT NOT NULL,
                     start_time DATETIME NOT NULL,
-                    end_time DATETIME
+                    end_time DATETIME,
+                    paused_ms INTEGER NOT NULL DEFAULT 0
                 )
             ''')
             
@@ -40,6 +295,9 @@ class DatabaseManager:
                     app_name TEXT NOT NULL,
                     window_name TEXT NOT NULL,
                     duration INTEGER NOT NULL,
+                    category TEXT,
+                    duration_ms INTEGER,
+                    started_at INTEGER,
                     FOREIGN KEY (session_id) REFERENCES sessions(id)
                 )
             ''')
@@ -55,9 +313,287 @@ class DatabaseManager:
                     FOREIGN KEY (session_id) REFERENCES sessions(id)
                 )
             ''')
-            
+
+            # ウィンドウ名の分類結果。既存のデータベースには列を追加して一括分類する
+            cursor.execute('PRAGMA table_info(app_usage)')
+            app_usage_columns = [column[1] for column in cursor.fetchall()]
+            if 'category' not in app_usage_columns:
+                cursor.execute('ALTER TABLE app_usage ADD COLUMN category TEXT')
+                self._reclassify(cursor)
+
+            # ミリ秒単位の使用時間。秒単位しかない既存の行は秒を換算して埋める
+            if 'duration_ms' not in app_usage_columns:
+                cursor.execute('ALTER TABLE app_usage ADD COLUMN duration_ms INTEGER')
+                cursor.execute('UPDATE app_usage SET duration_ms = duration * 1000')
+
+            # 行の開始時刻（タイムゾーンなしのローカル時刻のエポックミリ秒）。既存の行は空のままにし、
+            # 読む側がセッションの開始時刻とそれより前の行の合計から求める
+            if 'started_at' not in app_usage_columns:
+                cursor.execute('ALTER TABLE app_usage ADD COLUMN started_at INTEGER')
+
+            # 一時停止していた時間（セッションの経過時間との突き合わせに使う）
+            cursor.execute('PRAGMA table_info(sessions)')
+            if 'paused_ms' not in [column[1] for column in cursor.fetchall()]:
+                cursor.execute('ALTER TABLE sessions ADD COLUMN paused_ms INTEGER NOT NULL DEFAULT 0')
+
+            # 日別・アプリ別の集計（ロールアップ）テーブル。record_activity で逐次更新する
+            # 秒単位だった旧形式のロールアップは作り直す
+            cursor.execute('PRAGMA table_info(daily_app_usage)')
+            if 'duration' in [column[1] for column in cursor.fetchall()]:
+                cursor.execute('DROP TABLE daily_app_usage')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS daily_app_usage (
+                    day TEXT NOT NULL,
+                    app_name TEXT NOT NULL,
+                    duration_ms INTEGER NOT NULL,
+                    PRIMARY KEY (day, app_name)
+                )
+            ''')
+            cursor.execute('SELECT EXISTS (SELECT 1 FROM daily_app_usage), EXISTS (SELECT 1 FROM app_usage)')
+            rollup_exists, usage_exists = cursor.fetchone()
+            if usage_exists and not rollup_exists:
+                self._rebuild_daily_rollup(cursor)
+
+            # セッションごとの集中度指標（セッション終了時に一度だけ計算して保存する）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS session_metrics (
+                    session_id INTEGER PRIMARY KEY,
+                    total_duration REAL NOT NULL,
+                    context_switches INTEGER NOT NULL,
+                    switches_per_hour REAL NOT NULL,
+                    longest_stretch REAL NOT NULL,
+                    deep_work_ratio REAL NOT NULL,
+                    computed_at DATETIME NOT NULL,
+                    FOREIGN KEY (session_id) REFERENCES sessions(id)
+                )
+            ''')
+
+            # セッション終了時にトラッカーのメモリ上の集計から書き込む、ウィンドウ別の合計
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS session_app_totals (
+                    session_id INTEGER NOT NULL,
+                    app_name TEXT NOT NULL,
+                    window_name TEXT NOT NULL,
+                    duration_ms INTEGER NOT NULL,
+                    PRIMARY KEY (session_id, app_name, window_name),
+                    FOREIGN KEY (session_id) REFERENCES sessions(id)
+                )
+            ''')
+
+            # ウィンドウ名の全文検索インデックス（app_usage を外部コンテンツとしてトリガーで同期する）
+            self.create_search_index(cursor)
+
+            # 期間指定の集計用インデックス
+            self.create_indexes(cursor)
+
+            # 月ごとのアーカイブ (data/archive/YYYY-MM.db) の状態。copying → archived（コピー済み・本体から削除中） → removed
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS archive_partitions (
+                    month TEXT PRIMARY KEY,
+                    first_session_id INTEGER NOT NULL,
+                    last_session_id INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    updated_at DATETIME NOT NULL
+                )
+            ''')
+
+            self._upgrade_archives()
+
+            # 他のトラッカーから一括で取り込んだイベントのキー（再実行しても同じイベントを二重に入れない）。
+            # アーカイブには移さず、本体に残し続ける
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS imported_events (
+                    event_key BLOB PRIMARY KEY
+                ) WITHOUT ROWID
+            ''')
+
+            # 一括取り込みの実行記録。finished_at が空のまま残っていれば、インデックスの作り直しと日別集計が済んでいない。
+            # first_session_id / last_session_id は取り込んだセッションの id の範囲（最後に日別集計を足すのに使う）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS import_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    source TEXT NOT NULL,
+                    started_at DATETIME NOT NULL,
+                    finished_at DATETIME,
+                    deferred BOOLEAN NOT NULL DEFAULT 0,
+                    events INTEGER NOT NULL DEFAULT 0,
+                    sessions INTEGER NOT NULL DEFAULT 0,
+                    first_session_id INTEGER,
+                    last_session_id INTEGER
+                )
+            ''')
+            cursor.execute('PRAGMA table_info(import_runs)')
+            if 'first_session_id' not in [column[1] for column in cursor.fetchall()]:
+                cursor.execute('ALTER TABLE import_runs ADD COLUMN first_session_id INTEGER')
+                cursor.execute('ALTER TABLE import_runs ADD COLUMN last_session_id INTEGER')
+
+            # sync_outbox テーブルの作成（集計サーバーへ未送信のバッチ）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sync_outbox (
+                    batch_id TEXT PRIMARY KEY,
+                    last_session_id INTEGER NOT NULL,
+                    payload BLOB NOT NULL,
+                    created_at DATETIME NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    sent_at DATETIME
+                )
+            ''')
+
+            # sync_failed テーブルの作成（集計サーバーに拒否され、再送しないバッチ）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sync_failed (
+                    batch_id TEXT PRIMARY KEY,
+                    last_session_id INTEGER NOT NULL,
+                    payload BLOB NOT NULL,
+                    created_at DATETIME NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    error TEXT,
+                    failed_at DATETIME NOT NULL
+                )
+            ''')
+
         print("データベーステーブルが正常に作成されました。")
 
+    def _upgrade_archives(self):
+        # 本体に後から追加した列をアーカイブにも足し、パーティションをまたいで同じ列で読めるようにする
+        if not os.path.isdir(self.archive_dir):
+            return
+        for name in sorted(os.listdir(self.archive_dir)):
+            if not name.endswith('.db'):
+                continue
+            conn = sqlite3.connect(os.path.join(self.archive_dir, name))
+            try:
+                columns = [column[1] for column in conn.execute('PRAGMA table_info(app_usage)')]
+                if columns and 'started_at' not in columns:
+                    conn.execute('ALTER TABLE app_usage ADD COLUMN started_at INTEGER')
+                    conn.commit()
+            finally:
+                conn.close()
+
+    def create_indexes(self, cursor):
+        for name, definition in INDEXES.items():
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+
+    def drop_indexes(self, cursor):
+        for name in INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+    def drop_search_triggers(self, cursor):
+        # 一括取り込みの間は FTS を行ごとに更新せず、最後に 'rebuild' でまとめて作る
+        for trigger in ('app_usage_fts_insert', 'app_usage_fts_delete', 'app_usage_fts_update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+    def create_search_index(self, cursor):
+        cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'app_usage_fts'")
+        row = cursor.fetchone()
+        if row is not None:
+            self.fts_tokenizer = 'trigram' if 'trigram' in row[0] else 'unicode61'
+        else:
+            # 日本語や部分一致 (invoice-2024.xlsx など) を扱えるよう trigram を優先する
+            for tokenizer in ('trigram', 'unicode61'):
+                try:
+                    cursor.execute(f'''
+                        CREATE VIRTUAL TABLE app_usage_fts USING fts5(
+                            window_name, content='app_usage', content_rowid='id', tokenize='{tokenizer}'
+                        )
+                    ''')
+                    self.fts_tokenizer = tokenizer
+                    break
+                except sqlite3.OperationalError as e:
+                    self.logger.warning(f"FTS5 tokenizer {tokenizer} is not available: {e}")
+            if self.fts_tokenizer is None:
+                return
+            cursor.execute("INSERT INTO app_usage_fts (app_usage_fts) VALUES ('rebuild')")
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS app_usage_fts_insert AFTER INSERT ON app_usage BEGIN
+                INSERT INTO app_usage_fts (rowid, window_name) VALUES (new.id, new.window_name);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS app_usage_fts_delete AFTER DELETE ON app_usage BEGIN
+                INSERT INTO app_usage_fts (app_usage_fts, rowid, window_name) VALUES ('delete', old.id, old.window_name);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS app_usage_fts_update AFTER UPDATE OF window_name ON app_usage BEGIN
+                INSERT INTO app_usage_fts (app_usage_fts, rowid, window_name) VALUES ('delete', old.id, old.window_name);
+                INSERT INTO app_usage_fts (rowid, window_name) VALUES (new.id, new.window_name);
+            END
+        ''')
+
+    def rebuild_search_index(self):
+        # 既存のデータベース向けに、全文検索インデックスを app_usage から作り直す
+        with self.lock:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                if self.fts_tokenizer is None:
+                    self.create_search_index(cursor)
+                if self.fts_tokenizer is not None:
+                    cursor.execute("INSERT INTO app_usage_fts (app_usage_fts) VALUES ('rebuild')")
+                cursor.execute('SELECT COUNT(*) FROM app_usage')
+                return cursor.fetchone()[0]
+
+    def search_match_clause(self, query, fts_schemas=('main',)):
+        # trigram は3文字未満の語を検索できないため、短い語や FTS5 が無い環境では LIKE で探す。
+        # アーカイブを ATTACH している場合は、パーティションごとの FTS テーブルの結果をまとめる
+        terms = query.split()
+        if self.fts_tokenizer is not None and fts_schemas and all(len(term) >= 3 for term in terms):
+            subqueries = ' UNION ALL '.join(f'SELECT rowid FROM {schema}.app_usage_fts WHERE app_usage_fts MATCH ?'
+                                            for schema in fts_schemas)
+            return f'a.id IN ({subqueries})', [fts_query(query)] * len(fts_schemas)
+        return ' AND '.join(["a.window_name LIKE ? ESCAPE '\\'"] * len(terms)), [
+            '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%' for term in terms
+        ]
+
+    def count_search_results(self, query, start_date=None, end_date=None, conn=None):
+        if not query.split():
+            return 0
+        range_conditions, range_params = search_conditions(start_date, end_date)
+
+        def partial(partition_info):
+            match_clause, match_params = self.search_match_clause(query, partition_info['fts_schemas'])
+            return f'''
+                SELECT COUNT(DISTINCT a.session_id) as sessions
+                FROM range_activity a
+                WHERE {match_clause} {range_conditions}
+            ''', (*match_params, *range_params)
+
+        with self.reading(conn) as cursor:
+            # セッションは1つのパーティションにしかないので、チャンクごとの件数を足せばよい
+            return self.merge_range(cursor, start_date, end_date, partial,
+                                    'SELECT COALESCE(SUM(sessions), 0) FROM {partial}')[0][0]
+
+    def search_activity(self, query, start_date=None, end_date=None, offset=0, limit=100,
+                        order_by='start', descending=True, conn=None):
+        # ウィンドウ名が一致したセッションと、その中で一致したウィンドウの合計時間を返す
+        if not query.split():
+            return []
+        range_conditions, range_params = search_conditions(start_date, end_date)
+        order_column = SEARCH_ORDER_COLUMNS[order_by]
+        direction = 'DESC' if descending else 'ASC'
+
+        def partial(partition_info):
+            match_clause, match_params = self.search_match_clause(query, partition_info['fts_schemas'])
+            return f'''
+                SELECT a.session_id, a.session_type, a.start_time, a.end_time,
+                       SUM(a.duration_ms) as duration_ms,
+                       GROUP_CONCAT(DISTINCT a.window_name) as windows
+                FROM range_activity a
+                WHERE {match_clause} {range_conditions}
+                GROUP BY a.session_id
+            ''', (*match_params, *range_params)
+
+        with self.reading(conn) as cursor:
+            return self.merge_range(cursor, start_date, end_date, partial, f'''
+                SELECT a.session_id, a.session_type, a.start_time, a.end_time,
+                       a.duration_ms / 1000.0 as total_duration, a.windows
+                FROM {{partial}} a
+                ORDER BY {order_column} {direction}, a.session_id
+                LIMIT ? OFFSET ?
+            ''', (limit, offset))
+
     def start_session(self, session_type):
         with self.lock:
             with self.get_connection() as conn:
@@ -71,11 +607,11 @@ class DatabaseManager:
                 self.logger.debug(f"Started session: {session_id}, type: {session_type}, start time: {start_time}")
                 return session_id
 
-    def end_session(self, session_id):
+    def end_session(self, session_id, end_time=None):
         with self.lock:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                end_time = datetime.now()
+                end_time = end_time or datetime.now()
                 cursor.execute('''
                     UPDATE sessions
                     SET end_time = ?
@@ -83,6 +619,49 @@ class DatabaseManager:
                 ''', (end_time, session_id))
                 self.logger.debug(f"Ended session: {session_id}, end time: {end_time}")
 
+    def add_session_pause(self, session_id, paused_ms):
+        with self.lock:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE sessions
+                    SET paused_ms = paused_ms + ?
+                    WHERE id = ?
+                ''', (int(paused_ms), session_id))
+
+    def reconcile_sessions(self, start_date=None, end_date=None, session_id=None, tolerance_ms=2000, conn=None):
+        # 記録された使用時間 + 一時停止時間が、セッションの開始から終了までの時間と一致するかを確認する
+        conditions, params = search_conditions(start_date, end_date, alias='s')
+        sql = '''
+            SELECT s.id, s.start_time, s.end_time, s.paused_ms, s.tracked_ms
+            FROM {source} s
+            WHERE s.end_time IS NOT NULL {conditions}
+        '''
+        with self.reading(conn) as cursor:
+            if session_id is not None:
+                # 終了直後のセッションの確認は本体だけを見る（アーカイブは ATTACH しない）
+                source = f"({session_arm('main.sessions', 'main.app_usage', 'WHERE s.id = ?')})"
+                cursor.execute(sql.format(source=source, conditions=conditions), (session_id, *params))
+                rows = cursor.fetchall()
+            else:
+                rows = []
+                for _ in self.range_chunks(cursor, start_date, end_date):
+                    cursor.execute(sql.format(source='range_sessions', conditions=conditions), params)
+                    rows += cursor.fetchall()
+            results = []
+            for sid, start_time, end_time, paused_ms, tracked_ms in sorted(rows):
+                wall_ms = int((datetime.fromisoformat(str(end_time)) - datetime.fromisoformat(str(start_time))).total_seconds() * 1000)
+                difference_ms = wall_ms - tracked_ms - paused_ms
+                results.append({
+                    'session_id': sid,
+                    'wall_ms': wall_ms,
+                    'tracked_ms': tracked_ms,
+                    'paused_ms': paused_ms,
+                    'difference_ms': difference_ms,
+                    'ok': abs(difference_ms) <= tolerance_ms,
+                })
+            return results
+
     def start_pomodoro(self, session_id):
         with self.lock:
             with self.get_connection() as conn:
@@ -103,117 +682,610 @@ class DatabaseManager:
                     WHERE id = ?
                 ''', (datetime.now(), completed, pomodoro_id))
 
-    def record_activity(self, session_id, app_name, window_name, duration):
+    def record_activity(self, session_id, app_name, window_name, duration, started_at=None):
         with self.lock:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                # duration が整数型であることを確認
-                duration = int(duration)
+                # duration は秒（小数可）。集計にはミリ秒の duration_ms を使い、duration は互換のため整数秒で残す
+                duration_ms = int(round(duration * 1000))
+                # started_at を省略した場合は、今終わった区間として記録する
+                started_at = started_at or datetime.now() - timedelta(milliseconds=duration_ms)
+                category = self.classifier.classify(app_name, window_name)
                 cursor.execute('''
-                    INSERT INTO app_usage (session_id, app_name, window_name, duration)
+                    INSERT INTO app_usage (session_id, app_name, window_name, duration, duration_ms, category, started_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (session_id, app_name, window_name, duration_ms // 1000, duration_ms, category,
+                      local_epoch_ms(started_at)))
+                cursor.execute('''
+                    INSERT INTO daily_app_usage (day, app_name, duration_ms)
+                    SELECT DATE(start_time), ?, ? FROM sessions WHERE id = ?
+                    ON CONFLICT (day, app_name) DO UPDATE SET duration_ms = duration_ms + excluded.duration_ms
+                ''', (app_name, duration_ms, session_id))
+
+    def reclassify_all(self):
+        # ルールを変更した後に、保存済みの分類をすべて付け直す
+        self.classifier.reload()
+        with self.lock:
+            with self.get_connection() as conn:
+                return self._reclassify(conn.cursor())
+
+    def _reclassify(self, cursor):
+        # メモ化した分類器を SQL 関数として登録し、1回の UPDATE で全行を分類する
+        # （組み合わせごとの UPDATE はインデックスがないと全件走査を繰り返す）
+        cursor.connection.create_function('classify', 2, self.classifier.classify, deterministic=True)
+        cursor.execute('UPDATE app_usage SET category = classify(app_name, window_name)')
+        return cursor.rowcount
+
+    def rebuild_daily_rollup(self):
+        with self.lock:
+            with self.get_connection() as conn:
+                self._rebuild_daily_rollup(conn.cursor())
+
+    def _rebuild_daily_rollup(self, cursor):
+        # アーカイブに移した月の集計はそのまま残し、本体にある日だけを作り直す
+        cursor.execute('DELETE FROM daily_app_usage WHERE day IN (SELECT DISTINCT DATE(start_time) FROM sessions)')
+        cursor.execute('''
+            INSERT INTO daily_app_usage (day, app_name, duration_ms)
+            SELECT DATE(s.start_time), a.app_name, SUM(a.duration_ms)
+            FROM app_usage a
+            JOIN sessions s ON a.session_id = s.id
+            GROUP BY DATE(s.start_time), a.app_name
+        ''')
+
+    def get_daily_summary(self, date, conn=None):
+        with self.reading(conn) as cursor:
+            return self.merge_range(cursor, date, date, ('''
+                SELECT a.app_name, SUM(a.duration_ms) as duration_ms
+                FROM range_activity a
+                WHERE a.start_time >= ? AND a.start_time < ?
+                GROUP BY a.app_name
+            ''', date_range_params(as_date(date), as_date(date))), '''
+                SELECT a.app_name, SUM(a.duration_ms) / 1000.0 as total_duration
+                FROM {partial} a
+                GROUP BY a.app_name
+                ORDER BY total_duration DESC
+            ''')
+
+    def get_recent_activities(self, limit=10, conn=None):
+        with self.reading(conn) as cursor:
+            cursor.execute('''
+                SELECT a.app_name, a.window_name, s.session_type, s.start_time
+                FROM app_usage a
+                JOIN sessions s ON a.session_id = s.id
+                ORDER BY s.start_time DESC
+                LIMIT ?
+            ''', (limit,))
+            return cursor.fetchall()
+
+    def get_session_summary(self, session_id, conn=None):
+        with self.reading(conn) as cursor:
+            cursor.execute('''
+                SELECT s.start_time, s.end_time, s.session_type,
+                       COUNT(DISTINCT a.id) as activity_count,
+                       GROUP_CONCAT(DISTINCT a.app_name) as used_apps
+                FROM sessions s
+                LEFT JOIN app_usage a ON s.id = a.session_id
+                WHERE s.id = ?
+                GROUP BY s.id
+            ''', (session_id,))
+            return cursor.fetchone()
+
+    def get_previous_session_info(self, session_type, conn=None):
+        self.logger.debug(f"Fetching previous session info for {session_type}")
+        with self.reading(conn) as cursor:
+            try:
+                info = self._describe_previous_session(cursor, session_type)
+                if info is None:
+                    # 月初めは前のセッションがアーカイブに移っていることがあるので、新しい月のアーカイブから探す
+                    info = self._describe_archived_session(cursor, session_type)
+                if info is None:
+                    self.logger.debug(f"No previous {session_type} session found")
+                    return f"前回の{session_type}セッションのデータがありません。"
+                return info
+            except Exception as e:
+                self.logger.error(f"Error in get_previous_session_info: {e}")
+                return f"セッション情報の取得中にエラーが発生しました: {e}"
+
+    def _describe_archived_session(self, cursor, session_type):
+        cursor.execute("SELECT month FROM archive_partitions WHERE state != 'copying' ORDER BY month DESC")
+        for (month,) in cursor.fetchall():
+            path = self.archive_path(month)
+            if not os.path.exists(path):
+                continue
+            archive = sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=ro", uri=True)
+            try:
+                info = self._describe_previous_session(archive.cursor(), session_type)
+            finally:
+                archive.close()
+            if info is not None:
+                return info
+        return None
+
+    def _describe_previous_session(self, cursor, session_type):
+        # cursor の接続（本体またはアーカイブ）で、最後に終了した session_type のセッションの説明を作る
+        cursor.execute('''
+            SELECT id, start_time, end_time
+            FROM sessions
+            WHERE session_type = ? AND end_time IS NOT NULL
+            ORDER BY end_time DESC
+            LIMIT 1
+        ''', (session_type,))
+        session = cursor.fetchone()
+        if session is None:
+            return None
+
+        session_id, start_time, end_time = session
+        self.logger.debug(f"Found session: {session_id}, {start_time}, {end_time}")
+
+        # 日時形式を整える
+        start_time = datetime.fromisoformat(start_time).strftime("%Y-%m-%d %H:%M:%S")
+        end_time = datetime.fromisoformat(end_time).strftime("%Y-%m-%d %H:%M:%S")
+
+        # ウィンドウ別の合計から、アプリ別の合計と上位3件のウィンドウを組み立てる
+        app_totals = {}
+        app_windows = {}
+        for app, window, duration_ms in self.get_session_totals(session_id, conn=cursor.connection):
+            app_totals[app] = app_totals.get(app, 0) + duration_ms
+            if duration_ms >= 1000:
+                app_windows.setdefault(app, []).append((window, duration_ms))
+        app_usage = sorted(((app, total) for app, total in app_totals.items() if total >= 1000),
+                           key=lambda item: item[1], reverse=True)
+        self.logger.debug(f"App usage: {app_usage}")
+
+        info = f"前回の{session_type}セッション (開始: {start_time}, 終了: {end_time}):\n\n"
+        for app, duration_ms in app_usage:
+            minutes, seconds = divmod(duration_ms // 1000, 60)
+            info += f"{app}: {minutes}分{seconds:02d}秒\n"
+            top_windows = sorted(app_windows.get(app, []), key=lambda item: item[1], reverse=True)[:3]
+            for window, window_ms in top_windows:
+                w_minutes, w_seconds = divmod(window_ms // 1000, 60)
+                info += f"  - {window}: {w_minutes}分{w_seconds:02d}秒\n"
+            info += "\n"  # アプリケーションごとに空行を追加
+
+        metrics = self.get_session_metrics(session_id, conn=cursor.connection)
+        if metrics is None:
+            metrics = compute_session_metrics(self.get_session_activity(session_id, conn=cursor.connection))
+        info += f"集中度: {format_metrics(metrics)}\n"
+        self.logger.debug(f"Generated info: {info}")
+        return info.strip()  # 最後の余分な改行を削除
+
+    def count_app_ranking(self, start_date, end_date, category=None, conn=None):
+        category_condition, category_params = category_filter(category)
+        with self.reading(conn) as cursor:
+            return self.merge_range(cursor, start_date, end_date, (f'''
+                SELECT DISTINCT a.app_name
+                FROM range_activity a
+                WHERE a.start_time >= ? AND a.start_time < ? {category_condition}
+            ''', (*date_range_params(start_date, end_date), *category_params)),
+                'SELECT COUNT(DISTINCT a.app_name) FROM {partial} a')[0][0]
+
+    def get_app_ranking(self, start_date, end_date, offset=0, limit=100, order_by='duration', descending=True,
+                        category=None, conn=None):
+        # 並び替えはSQL側で行い、表示する範囲だけを取得する
+        order_column = RANKING_ORDER_COLUMNS[order_by]
+        direction = 'DESC' if descending else 'ASC'
+        category_condition, category_params = category_filter(category)
+        with self.reading(conn) as cursor:
+            return self.merge_range(cursor, start_date, end_date, (f'''
+                SELECT a.app_name, SUM(a.duration_ms) as duration_ms
+                FROM range_activity a
+                WHERE a.start_time >= ? AND a.start_time < ? {category_condition}
+                GROUP BY a.app_name
+            ''', (*date_range_params(start_date, end_date), *category_params)), f'''
+                SELECT RANK() OVER (ORDER BY SUM(a.duration_ms) DESC) as rank,
+                       a.app_name, SUM(a.duration_ms) / 1000.0 as total_duration
+                FROM {{partial}} a
+                GROUP BY a.app_name
+                ORDER BY {order_column} {direction}, a.app_name
+                LIMIT ? OFFSET ?
+            ''', (limit, offset))
+
+    def get_total_usage(self, start_date, end_date, category=None, conn=None):
+        category_condition, category_params = category_filter(category)
+        with self.reading(conn) as cursor:
+            return self.merge_range(cursor, start_date, end_date, (f'''
+                SELECT SUM(a.duration_ms) as duration_ms
+                FROM range_activity a
+                WHERE a.start_time >= ? AND a.start_time < ? {category_condition}
+            ''', (*date_range_params(start_date, end_date), *category_params)),
+                'SELECT COALESCE(SUM(a.duration_ms), 0) / 1000.0 FROM {partial} a')[0][0]
+
+    def get_category_summary(self, start_date, end_date, conn=None):
+        with self.reading(conn) as cursor:
+            return self.merge_range(cursor, start_date, end_date, ('''
+                SELECT a.category, SUM(a.duration_ms) as duration_ms
+                FROM range_activity a
+                WHERE a.start_time >= ? AND a.start_time < ?
+                GROUP BY a.category
+            ''', date_range_params(start_date, end_date)), '''
+                SELECT a.category, SUM(a.duration_ms) / 1000.0 as total_duration
+                FROM {partial} a
+                GROUP BY a.category
+                ORDER BY total_duration DESC
+            ''')
+
+    def count_app_details(self, app_name, start_date, end_date, conn=None):
+        with self.reading(conn) as cursor:
+            return self.merge_range(cursor, start_date, end_date, ('''
+                SELECT DATE(a.start_time) as day, a.window_name
+                FROM range_activity a
+                WHERE a.app_name = ? AND a.start_time >= ? AND a.start_time < ?
+                GROUP BY day, a.window_name
+            ''', (app_name, *date_range_params(start_date, end_date))), '''
+                SELECT COUNT(*) FROM (
+                    SELECT 1
+                    FROM {partial} a
+                    GROUP BY a.day, a.window_name
+                )
+            ''')[0][0]
+
+    def get_app_details(self, app_name, start_date, end_date, offset=0, limit=100, order_by='date', descending=False, conn=None):
+        order_column = DETAIL_ORDER_COLUMNS[order_by]
+        direction = 'DESC' if descending else 'ASC'
+        with self.reading(conn) as cursor:
+            return self.merge_range(cursor, start_date, end_date, ('''
+                SELECT DATE(a.start_time) as day, a.window_name, SUM(a.duration_ms) as duration_ms
+                FROM range_activity a
+                WHERE a.app_name = ? AND a.start_time >= ? AND a.start_time < ?
+                GROUP BY day, a.window_name
+            ''', (app_name, *date_range_params(start_date, end_date))), f'''
+                SELECT a.day as day, a.window_name, SUM(a.duration_ms) / 1000.0 as total_duration
+                FROM {{partial}} a
+                GROUP BY day, a.window_name
+                ORDER BY {order_column} {direction}, day, a.window_name
+                LIMIT ? OFFSET ?
+            ''', (limit, offset))
+
+    def get_daily_app_totals(self, start_date, end_date, top_n=5, category=None, conn=None):
+        # ロールアップから日別の使用時間を取得する。上位 top_n 以外のアプリは None にまとめる。
+        # ロールアップには分類がないので、分類で絞り込む場合は円グラフ・ランキングと同じく range_activity から集計する
+        if category is not None:
+            return self._daily_app_totals_by_category(start_date, end_date, top_n, category, conn)
+        with self.reading(conn) as cursor:
+            cursor.execute('''
+                WITH top_apps AS (
+                    SELECT app_name
+                    FROM daily_app_usage
+                    WHERE day BETWEEN ? AND ?
+                    GROUP BY app_name
+                    ORDER BY SUM(duration_ms) DESC
+                    LIMIT ?
+                )
+                SELECT d.day,
+                       CASE WHEN d.app_name IN (SELECT app_name FROM top_apps) THEN d.app_name END as app,
+                       SUM(d.duration_ms) / 1000.0
+                FROM daily_app_usage d
+                WHERE d.day BETWEEN ? AND ?
+                GROUP BY d.day, app
+                ORDER BY d.day
+            ''', (str(start_date), str(end_date), top_n, str(start_date), str(end_date)))
+            return cursor.fetchall()
+
+    def _daily_app_totals_by_category(self, start_date, end_date, top_n, category, conn=None):
+        category_condition, category_params = category_filter(category)
+        with self.reading(conn) as cursor:
+            return self.merge_range(cursor, start_date, end_date, (f'''
+                SELECT DATE(a.start_time) as day, a.app_name, SUM(a.duration_ms) as duration_ms
+                FROM range_activity a
+                WHERE a.start_time >= ? AND a.start_time < ? {category_condition}
+                GROUP BY day, a.app_name
+            ''', (*date_range_params(start_date, end_date), *category_params)), '''
+                WITH d AS (SELECT * FROM {partial}),
+                top_apps AS (
+                    SELECT app_name
+                    FROM d
+                    GROUP BY app_name
+                    ORDER BY SUM(duration_ms) DESC
+                    LIMIT ?
+                )
+                SELECT d.day,
+                       CASE WHEN d.app_name IN (SELECT app_name FROM top_apps) THEN d.app_name END as app,
+                       SUM(d.duration_ms) / 1000.0
+                FROM d
+                GROUP BY d.day, app
+                ORDER BY d.day
+            ''', (top_n,))
+
+    def store_session_totals(self, session_id, totals):
+        # totals は LiveAggregator.close() が返す (app_name, window_name, duration_ms) のリスト
+        with self.lock:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO session_app_totals (session_id, app_name, window_name, duration_ms)
                     VALUES (?, ?, ?, ?)
-                ''', (session_id, app_name, window_name, duration))
+                ''', [(session_id, app_name, window_name, duration_ms) for app_name, window_name, duration_ms in totals])
 
-    def get_daily_summary(self, date):
+    def get_session_totals(self, session_id, conn=None):
+        # 終了時に保存した合計があればそれを使い、なければ（以前のセッション）app_usage から集計する
+        with self.reading(conn) as cursor:
+            cursor.execute('''
+                SELECT app_name, window_name, duration_ms
+                FROM session_app_totals
+                WHERE session_id = ?
+            ''', (session_id,))
+            totals = cursor.fetchall()
+            if totals:
+                return totals
+            cursor.execute('''
+                SELECT app_name, window_name, SUM(duration_ms)
+                FROM app_usage
+                WHERE session_id = ?
+                GROUP BY app_name, window_name
+            ''', (session_id,))
+            return cursor.fetchall()
+
+    def get_session_activity(self, session_id, conn=None):
+        with self.reading(conn) as cursor:
+            cursor.execute('''
+                SELECT app_name, duration_ms / 1000.0
+                FROM app_usage
+                WHERE session_id = ?
+                ORDER BY id
+            ''', (session_id,))
+            return cursor.fetchall()
+
+    def get_activity_for_range(self, start_date, end_date, missing_metrics_only=False, conn=None):
+        condition = 'AND NOT EXISTS (SELECT 1 FROM range_session_metrics m WHERE m.session_id = a.session_id)' if missing_metrics_only else ''
+        rows = []
+        with self.reading(conn) as cursor:
+            for _ in self.range_chunks(cursor, start_date, end_date):
+                cursor.execute(f'''
+                    SELECT a.session_id, a.app_name, a.duration_ms / 1000.0
+                    FROM range_activity a
+                    WHERE a.start_time >= ? AND a.start_time < ? AND a.end_time IS NOT NULL {condition}
+                    ORDER BY a.session_id, a.id
+                ''', date_range_params(start_date, end_date))
+                rows += cursor.fetchall()
+        # セッションは1つのパーティションにしかないので、セッション順に並べ直せば記録順も保たれる
+        return sorted(rows, key=lambda row: row[0])
+
+    def get_session_timelines(self, start_date, end_date, app_name=None, category=None, conn=None):
+        # 休憩以外のセッションごとに、開始時刻（タイムゾーンなしのローカル時刻のエポックミリ秒）と、
+        # 記録順の各行を「started_at（ない行は -1）,duration_ms * 2 + (条件に合えば 1)」にしてカンマでつないだ文字列を返す。
+        # started_at のない古い行の位置（開始時刻 + それより前の行の合計）の計算は呼び出し側が NumPy でまとめて行う。
+        # 窓関数で並べ替えるよりも、セッションごとにインデックス順で読むほうが速いので、パーティションを直接読む
+        conditions = []
+        params = []
+        if app_name is not None:
+            conditions.append('u.app_name = ?')
+            params.append(app_name)
+        if category is not None:
+            conditions.append('u.category = ?')
+            params.append(category)
+        matched = ' AND '.join(conditions) or '1'
+        rows = []
+        with self.reading(conn) as cursor:
+            for partition_info in self.range_chunks(cursor, start_date, end_date):
+                rows += self._read_session_timelines(cursor, partition_info, matched, params, start_date, end_date)
+        return rows
+
+    def _read_session_timelines(self, cursor, partition_info, matched, params, start_date, end_date):
+        arms = []
+        arm_params = []
+        for sessions_table, usage_table, _, condition in partition_info['tables']:
+            arms.append(f'''
+                SELECT CAST(ROUND((julianday(s.start_time) - 2440587.5) * 86400000) AS INTEGER),
+                       (SELECT group_concat(packed) FROM (
+                            SELECT COALESCE(u.started_at, -1) || ',' ||
+                                   (u.duration_ms * 2 + (CASE WHEN {matched} THEN 1 ELSE 0 END)) as packed
+                            FROM {usage_table} u
+                            WHERE u.session_id = s.id
+                            ORDER BY u.id
+                       ))
+                FROM {sessions_table} s
+                WHERE s.start_time >= ? AND s.start_time < ? AND s.session_type != 'break'
+                      {'AND ' + condition if condition else ''}
+            ''')
+            arm_params += params + list(date_range_params(start_date, end_date))
+        cursor.execute(' UNION ALL '.join(arms), arm_params)
+        return cursor.fetchall()
+
+    def store_session_metrics(self, metrics_by_session, month=None):
+        # month を渡した場合は、その月のアーカイブ（セッションがある側）に保存する
+        rows = [(session_id, m['total_duration'], m['context_switches'], m['switches_per_hour'],
+                 m['longest_stretch'], m['deep_work_ratio'], datetime.now())
+                for session_id, m in metrics_by_session.items()]
+        sql = '''
+            INSERT OR REPLACE INTO session_metrics
+                (session_id, total_duration, context_switches, switches_per_hour,
+                 longest_stretch, deep_work_ratio, computed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        '''
+        if month is not None:
+            conn = sqlite3.connect(self.archive_path(month))
+            try:
+                with conn:
+                    conn.executemany(sql, rows)
+            finally:
+                conn.close()
+            return
+        with self.lock:
+            with self.get_connection() as conn:
+                conn.executemany(sql, rows)
+
+    def get_session_months(self):
+        # セッションがある月 ('YYYY-MM') と、その月がアーカイブに移っているか
+        with self.reading() as cursor:
+            cursor.execute("SELECT month FROM archive_partitions WHERE state != 'copying'")
+            archived = {row[0] for row in cursor.fetchall()}
+            cursor.execute("SELECT DISTINCT strftime('%Y-%m', start_time) FROM sessions")
+            months = archived | {row[0] for row in cursor.fetchall() if row[0]}
+        return [(month, month in archived) for month in sorted(months)]
+
+    def get_session_metrics(self, session_id, conn=None):
+        with self.reading(conn) as cursor:
+            cursor.execute('''
+                SELECT total_duration, context_switches, switches_per_hour, longest_stretch, deep_work_ratio
+                FROM session_metrics
+                WHERE session_id = ?
+            ''', (session_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            keys = ('total_duration', 'context_switches', 'switches_per_hour', 'longest_stretch', 'deep_work_ratio')
+            return dict(zip(keys, row))
+
+    # session_id より後に終了したセッションと、ウィンドウ単位に集約した使用時間を返す。
+    # 同期を有効にする前や一括取り込みの後にアーカイブへ移ったセッションも送れるよう、アーカイブも含めて読む
+    def get_closed_sessions_after(self, session_id, limit=100):
+        with self.reading() as cursor:
+            sessions = self.merge_range(cursor, None, None, ('''
+                SELECT s.id, s.session_type, s.start_time, s.end_time
+                FROM range_sessions s
+                WHERE s.id > ? AND s.end_time IS NOT NULL
+                ORDER BY s.id
+                LIMIT ?
+            ''', (session_id, limit)), '''
+                SELECT s.id, s.session_type, s.start_time, s.end_time
+                FROM {partial} s
+                ORDER BY s.id
+                LIMIT ?
+            ''', (limit,))
+            if not sessions:
+                return [], []
+            app_usage = self.merge_range(cursor, None, None, ('''
+                SELECT a.session_id, a.app_name, a.window_name, SUM(a.duration_ms) as duration_ms
+                FROM range_activity a
+                WHERE a.session_id BETWEEN ? AND ?
+                GROUP BY a.session_id, a.app_name, a.window_name
+            ''', (sessions[0][0], sessions[-1][0])), '''
+                SELECT a.session_id, a.app_name, a.window_name, SUM(a.duration_ms) / 1000.0 as total_duration
+                FROM {partial} a
+                GROUP BY a.session_id, a.app_name, a.window_name
+            ''')
+            session_ids = {row[0] for row in sessions}
+            return sessions, [row for row in app_usage if row[0] in session_ids]
+
+    def get_last_enqueued_session_id(self):
         with self.lock:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                # 拒否されて sync_failed に移したバッチのセッションも、もう一度キューに積まない
                 cursor.execute('''
-                    SELECT app_name, SUM(duration) as total_duration
-                    FROM app_usage
-                    JOIN sessions ON app_usage.session_id = sessions.id
-                    WHERE DATE(sessions.start_time) = DATE(?)
-                    GROUP BY app_name
-                    ORDER BY total_duration DESC
-                ''', (date,))
-                return cursor.fetchall()
+                    SELECT MAX(last_session_id) FROM (
+                        SELECT last_session_id FROM sync_outbox
+                        UNION ALL
+                        SELECT last_session_id FROM sync_failed
+                    )
+                ''')
+                return cursor.fetchone()[0] or 0
+
+    def enqueue_sync_batch(self, batch_id, last_session_id, payload):
+        with self.lock:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR IGNORE INTO sync_outbox (batch_id, last_session_id, payload, created_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (batch_id, last_session_id, sqlite3.Binary(payload), datetime.now()))
+                self.logger.debug(f"Enqueued sync batch: {batch_id}, last session: {last_session_id}")
 
-    def get_recent_activities(self, limit=10):
+    def get_pending_sync_batches(self, now, limit=10):
         with self.lock:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT a.app_name, a.window_name, s.session_type, s.start_time
-                    FROM app_usage a
-                    JOIN sessions s ON a.session_id = s.id
-                    ORDER BY s.start_time DESC
+                    SELECT batch_id, payload, attempts
+                    FROM sync_outbox
+                    WHERE sent_at IS NULL AND next_attempt_at <= ?
+                    ORDER BY last_session_id
                     LIMIT ?
-                ''', (limit,))
+                ''', (now, limit))
                 return cursor.fetchall()
 
-    def get_session_summary(self, session_id):
+    def mark_sync_batch_sent(self, batch_id):
         with self.lock:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT s.start_time, s.end_time, s.session_type,
-                           COUNT(DISTINCT a.id) as activity_count,
-                           GROUP_CONCAT(DISTINCT a.app_name) as used_apps
-                    FROM sessions s
-                    LEFT JOIN app_usage a ON s.id = a.session_id
-                    WHERE s.id = ?
-                    GROUP BY s.id
-                ''', (session_id,))
-                return cursor.fetchone()
-
-    def get_previous_session_info(self, session_type):
-        self.logger.debug(f"Fetching previous session info for {session_type}")
+                    UPDATE sync_outbox
+                    SET sent_at = ?, payload = X''
+                    WHERE batch_id = ?
+                ''', (datetime.now(), batch_id))
+
+    def mark_sync_batch_failed(self, batch_id, next_attempt_at):
         with self.lock:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                try:
-                    cursor.execute('''
-                        SELECT id, start_time, end_time
-                        FROM sessions
-                        WHERE session_type = ? AND end_time IS NOT NULL
-                        ORDER BY end_time DESC
-                        LIMIT 1
-                    ''', (session_type,))
-                    session = cursor.fetchone()
-
-                    if session:
-                        session_id, start_time, end_time = session
-                        self.logger.debug(f"Found session: {session_id}, {start_time}, {end_time}")
-                        
-                        # 日時形式を整える
-                        start_time = datetime.fromisoformat(start_time).strftime("%Y-%m-%d %H:%M:%S")
-                        end_time = datetime.fromisoformat(end_time).strftime("%Y-%m-%d %H:%M:%S")
-
-                        cursor.execute('''
-                            SELECT app_name, SUM(duration) as total_duration
-                            FROM app_usage
-                            WHERE session_id = ?
-                            GROUP BY app_name
-                            HAVING total_duration >= 1
-                            ORDER BY total_duration DESC
-                        ''', (session_id,))
-                        app_usage = cursor.fetchall()
-                        self.logger.debug(f"App usage: {app_usage}")
-
-                        info = f"前回の{session_type}セッション (開始: {start_time}, 終了: {end_time}):\n\n"
-                        for app, duration in app_usage:
-                            minutes, seconds = divmod(duration, 60)
-                            info += f"{app}: {minutes}分{seconds:02d}秒\n"
-                            cursor.execute('''
-                                SELECT window_name, duration
-                                FROM app_usage
-                                WHERE session_id = ? AND app_name = ? AND duration >= 1
-                                ORDER BY duration DESC
-                                LIMIT 3
-                            ''', (session_id, app))
-                            top_windows = cursor.fetchall()
-                            for window, window_duration in top_windows:
-                                w_minutes, w_seconds = divmod(window_duration, 60)
-                                info += f"  - {window}: {w_minutes}分{w_seconds:02d}秒\n"
-                            info += "\n"  # アプリケーションごとに空行を追加
-                        self.logger.debug(f"Generated info: {info}")
-                        return info.strip()  # 最後の余分な改行を削除
-                    else:
-                        self.logger.debug(f"No previous {session_type} session found")
-                        return f"前回の{session_type}セッションのデータがありません。"
-                except Exception as e:
-                    self.logger.error(f"Error in get_previous_session_info: {e}")
-                    return f"セッション情報の取得中にエラーが発生しました: {e}"
+                cursor.execute('''
+                    UPDATE sync_outbox
+                    SET attempts = attempts + 1, next_attempt_at = ?
+                    WHERE batch_id = ?
+                ''', (next_attempt_at, batch_id))
+
+    def mark_sync_batch_rejected(self, batch_id, error):
+        # 送信待ちキューから sync_failed に移す（中身は調査用に残す）
+        with self.lock:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO sync_failed
+                        (batch_id, last_session_id, payload, created_at, attempts, error, failed_at)
+                    SELECT batch_id, last_session_id, payload, created_at, attempts + 1, ?, ?
+                    FROM sync_outbox
+                    WHERE batch_id = ?
+                ''', (error, datetime.now(), batch_id))
+                cursor.execute('DELETE FROM sync_outbox WHERE batch_id = ?', (batch_id,))
+
+    # 月ごとのアーカイブ（MonthArchiver から使う）
+    def get_archive_partitions(self):
+        with self.reading() as cursor:
+            cursor.execute('SELECT month, first_session_id, last_session_id, state FROM archive_partitions ORDER BY month')
+            return cursor.fetchall()
+
+    def get_unarchived_months(self, before):
+        # before より前に始まったセッションがあり、まだアーカイブしていない月
+        with self.reading() as cursor:
+            cursor.execute('''
+                SELECT DISTINCT SUBSTR(start_time, 1, 7) as month
+                FROM sessions
+                WHERE start_time < ?
+                  AND SUBSTR(start_time, 1, 7) NOT IN (SELECT month FROM archive_partitions)
+                ORDER BY month
+            ''', (str(before),))
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_reopened_months(self):
+        # アーカイブし終えた月なのに、後から（一括取り込みなどで）本体にその月のセッションが入ったもの
+        with self.reading() as cursor:
+            cursor.execute('''
+                SELECT p.month FROM archive_partitions p
+                WHERE p.state = 'removed' AND EXISTS (
+                    SELECT 1 FROM sessions s
+                    WHERE s.start_time >= p.month || '-01' AND s.start_time < date(p.month || '-01', '+1 month')
+                      AND s.id > p.last_session_id
+                )
+                ORDER BY p.month
+            ''')
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_session_id_range(self, start_date, end_date):
+        with self.reading() as cursor:
+            cursor.execute('''
+                SELECT MIN(id), MAX(id) FROM sessions WHERE start_time >= ? AND start_time < ?
+            ''', (str(start_date), str(end_date)))
+            return cursor.fetchone()
+
+    def set_archive_partition(self, month, first_session_id, last_session_id, state):
+        with self.lock:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO archive_partitions (month, first_session_id, last_session_id, state, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (month) DO UPDATE SET first_session_id = excluded.first_session_id,
+                        last_session_id = excluded.last_session_id, state = excluded.state, updated_at = excluded.updated_at
+                ''', (month, first_session_id, last_session_id, state, datetime.now()))
+
+    def delete_sessions(self, month, first_session_id, last_session_id):
+        # アーカイブへのコピーが済んだセッションを本体から削除する（FTS はトリガーで追従する）
+        with self.lock:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                for table, column in reversed(list(ARCHIVED_TABLES.items())):
+                    cursor.execute(f'DELETE FROM {table} WHERE {partition_condition(table, column)}',
+                                   partition_params(month, first_session_id, last_session_id))
 
 # デバッグ用の使用例
 if __name__ == "__main__":
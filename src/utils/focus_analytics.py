@@ -0,0 +1,134 @@
+import logging
+from datetime import timedelta
+
+# GUI が一時停止・再開時に記録するマーカー。作業時間としては数えず、連続作業の区切りとして扱う
+MARKER_APPS = ('Pause Pomodoro', 'Resume Pomodoro')
+
+# この長さ以上同じアプリを使い続けた時間をディープワークとみなす（秒）
+DEEP_WORK_MIN_STRETCH = 10 * 60
+
+
+def make_metrics(total, switches, longest, deep):
+    hours = total / 3600
+    return {
+        'total_duration': total,
+        'context_switches': switches,
+        'switches_per_hour': switches / hours if hours else 0.0,
+        'longest_stretch': longest,
+        'deep_work_ratio': deep / total if total else 0.0,
+    }
+
+
+def compute_session_metrics(rows, min_stretch=DEEP_WORK_MIN_STRETCH):
+    # rows は (app_name, duration) を記録順に並べたもの。1回の走査で全指標を求める
+    total = switches = longest = deep = 0
+    current_app = None
+    stretch = 0
+    for app_name, duration in rows:
+        if app_name in MARKER_APPS:
+            if stretch >= min_stretch:
+                deep += stretch
+            longest = max(longest, stretch)
+            stretch = 0
+            continue
+        total += duration
+        if app_name == current_app:
+            stretch += duration
+            continue
+        if current_app is not None:
+            switches += 1
+        if stretch >= min_stretch:
+            deep += stretch
+        longest = max(longest, stretch)
+        current_app = app_name
+        stretch = duration
+    if stretch >= min_stretch:
+        deep += stretch
+    longest = max(longest, stretch)
+    return make_metrics(total, switches, longest, deep)
+
+
+def compute_range_metrics(rows, min_stretch=DEEP_WORK_MIN_STRETCH):
+    # rows は (session_id, app_name, duration) をセッション・記録順に並べたもの。
+    # 数か月分をまとめて計算するため、行ごとのループを使わず NumPy で集計する
+    import numpy as np
+
+    if not rows:
+        return {}
+    session_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    apps = np.array([row[1] for row in rows], dtype=object)
+    durations = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+
+    # マーカーを除いた行のうち、直前の行との間にマーカーがあるものは新しい連続区間の始まりとして扱う
+    is_marker = np.isin(apps, MARKER_APPS)
+    keep = ~is_marker
+    marker_count = np.cumsum(is_marker)[keep]
+    session_ids = session_ids[keep]
+    durations = durations[keep]
+    if not len(session_ids):
+        return {}
+    marker_between = np.zeros(len(session_ids), dtype=bool)
+    marker_between[1:] = marker_count[1:] != marker_count[:-1]
+    _, app_codes = np.unique(apps[keep].astype(str), return_inverse=True)
+
+    same_session = np.zeros(len(session_ids), dtype=bool)
+    same_session[1:] = session_ids[1:] == session_ids[:-1]
+    app_changed = np.ones(len(session_ids), dtype=bool)
+    app_changed[1:] = app_codes[1:] != app_codes[:-1]
+
+    switch = same_session & app_changed
+    new_stretch = ~same_session | app_changed | marker_between
+
+    unique_sessions, session_index = np.unique(session_ids, return_inverse=True)
+    totals = np.bincount(session_index, weights=durations)
+    switches = np.bincount(session_index, weights=switch)
+
+    stretch_id = np.cumsum(new_stretch) - 1
+    stretch_durations = np.bincount(stretch_id, weights=durations)
+    stretch_sessions = session_index[new_stretch]
+    longest = np.zeros(len(unique_sessions))
+    np.maximum.at(longest, stretch_sessions, stretch_durations)
+    deep = np.bincount(stretch_sessions, weights=np.where(stretch_durations >= min_stretch, stretch_durations, 0),
+                       minlength=len(unique_sessions))
+
+    return {
+        int(session_id): make_metrics(float(totals[i]), int(switches[i]), float(longest[i]), float(deep[i]))
+        for i, session_id in enumerate(unique_sessions)
+    }
+
+
+def format_metrics(metrics):
+    minutes, seconds = divmod(int(metrics['longest_stretch']), 60)
+    return (f"切り替え {metrics['switches_per_hour']:.1f}回/時間 / "
+            f"最長連続 {minutes}分{seconds:02d}秒 / "
+            f"ディープワーク {metrics['deep_work_ratio'] * 100:.0f}%")
+
+
+class FocusAnalytics:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.logger = logging.getLogger(__name__)
+
+    def record_session(self, session_id):
+        # セッション終了時に一度だけ計算し、session_metrics テーブルに保存する
+        metrics = compute_session_metrics(self.db_manager.get_session_activity(session_id))
+        self.db_manager.store_session_metrics({session_id: metrics})
+        self.logger.debug(f"Stored focus metrics for session {session_id}: {metrics}")
+        return metrics
+
+    def backfill(self):
+        # 指標が未計算のセッション（この機能より前の記録や一括取り込みしたもの）を月ごとにまとめて計算し、
+        # その月のセッションがあるデータベース（本体またはアーカイブ）に保存する
+        from utils.database_manager import month_bounds
+
+        count = 0
+        for month, archived in self.db_manager.get_session_months():
+            first_day, next_month = month_bounds(month)
+            rows = self.db_manager.get_activity_for_range(first_day, next_month - timedelta(days=1),
+                                                          missing_metrics_only=True)
+            metrics = compute_range_metrics(rows)
+            if metrics:
+                self.db_manager.store_session_metrics(metrics, month if archived else None)
+                count += len(metrics)
+                self.logger.info(f"Computed focus metrics for {len(metrics)} sessions in {month}")
+        return count
@@ -0,0 +1,131 @@
+import sys
+import threading
+from array import array
+
+
+def format_duration(duration_ms):
+    minutes, seconds = divmod(int(duration_ms // 1000), 60)
+    return f"{minutes}分{seconds:02d}秒"
+
+
+def format_snapshot(snapshot, top_windows=3):
+    # get_previous_session_info と同じ形式で表示できる文字列にする
+    if not snapshot['apps']:
+        return "現在のセッションの記録はまだありません。"
+    info = f"現在のセッション (合計: {format_duration(snapshot['total_ms'])}):\n\n"
+    for app_name, duration_ms in snapshot['apps']:
+        info += f"{app_name}: {format_duration(duration_ms)}\n"
+        windows = [window for window in snapshot['windows'] if window[0] == app_name][:top_windows]
+        for _, window_name, window_ms in windows:
+            info += f"  - {window_name}: {format_duration(window_ms)}\n"
+        info += "\n"
+    return info.strip()
+
+
+class LiveAggregator:
+    # 計測中のセッションのアプリ別・ウィンドウ別の合計時間をメモリ上で保持する。
+    # 名前は一度だけ登録して番号で引き、時間は番号ごとの array に積み上げる
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._clear(None)
+
+    def reset(self, session_id):
+        with self.lock:
+            self._clear(session_id)
+
+    def _clear(self, session_id):
+        self.session_id = session_id
+        self.app_index = {}
+        self.app_names = []
+        self.app_ms = array('q')
+        self.window_index = {}
+        self.window_names = []
+        self.window_app = array('l')
+        self.window_ms = array('q')
+
+    def open(self, session_id):
+        # 一時停止から再開したときは同じセッションなので、それまでの合計を残す
+        with self.lock:
+            if self.session_id != session_id:
+                self._clear(session_id)
+
+    def _intern_app(self, app_name):
+        index = self.app_index.get(app_name)
+        if index is None:
+            index = len(self.app_names)
+            app_name = sys.intern(app_name)
+            self.app_index[app_name] = index
+            self.app_names.append(app_name)
+            self.app_ms.append(0)
+        return index
+
+    def _intern_window(self, app, window_name):
+        key = (app, window_name)
+        index = self.window_index.get(key)
+        if index is None:
+            index = len(self.window_names)
+            self.window_index[key] = index
+            self.window_names.append(window_name)
+            self.window_app.append(app)
+            self.window_ms.append(0)
+        return index
+
+    def add(self, session_id, app_name, window_name, duration_ms):
+        with self.lock:
+            if session_id != self.session_id:
+                return
+            app = self._intern_app(app_name)
+            window = self._intern_window(app, window_name)
+            self.app_ms[app] += duration_ms
+            self.window_ms[window] += duration_ms
+
+    def snapshot(self, pending=None):
+        # ロック中は配列のコピーだけを取り、並べ替えはロックの外で行う。
+        # pending は計測中でまだ記録していないウィンドウ (app_name, window_name, duration_ms)
+        with self.lock:
+            session_id = self.session_id
+            app_names = self.app_names[:]
+            app_ms = array('q', self.app_ms)
+            window_names = self.window_names[:]
+            window_app = array('l', self.window_app)
+            window_ms = array('q', self.window_ms)
+            pending_app = pending_window = None
+            if pending is not None and session_id is not None:
+                pending_app = self.app_index.get(pending[0])
+                if pending_app is not None:
+                    pending_window = self.window_index.get((pending_app, pending[1]))
+
+        if pending is not None and session_id is not None:
+            app_name, window_name, duration_ms = pending
+            if pending_app is None:
+                pending_app = len(app_names)
+                app_names.append(app_name)
+                app_ms.append(0)
+            if pending_window is None:
+                pending_window = len(window_names)
+                window_names.append(window_name)
+                window_app.append(pending_app)
+                window_ms.append(0)
+            app_ms[pending_app] += duration_ms
+            window_ms[pending_window] += duration_ms
+
+        apps = sorted(zip(app_names, app_ms), key=lambda item: item[1], reverse=True)
+        windows = sorted(((app_names[app], window_name, duration_ms)
+                          for app, window_name, duration_ms in zip(window_app, window_names, window_ms)),
+                         key=lambda item: item[2], reverse=True)
+        return {
+            'session_id': session_id,
+            'total_ms': sum(app_ms),
+            'apps': apps,
+            'windows': windows,
+        }
+
+    def close(self, session_id):
+        # セッション終了時に、ウィンドウ別の合計を (app_name, window_name, duration_ms) のリストで渡して空にする
+        with self.lock:
+            if session_id != self.session_id:
+                return []
+            totals = [(self.app_names[app], window_name, duration_ms)
+                      for app, window_name, duration_ms in zip(self.window_app, self.window_names, self.window_ms)]
+            self._clear(None)
+        return totals
@@ -0,0 +1,151 @@
+import logging
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+
+class QueryRequest:
+    def __init__(self, key):
+        self.key = key
+        self.future = None
+        self.conn = None
+        self.cancelled = False
+        # conn はこのリクエストがワーカーの接続を使っている間だけ入っている。
+        # 中断と接続の受け渡しはこのロックの中で行い、ワーカーが次のリクエストに移った後の接続を中断しないようにする
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.conn is not None:
+                self.conn.interrupt()  # 実行中のクエリは SQLite 側で中断させる
+        if self.future is not None:
+            self.future.cancel()
+
+    def acquire(self, conn):
+        # 取り消されていなければ接続をこのリクエストに割り当てる
+        with self.lock:
+            if self.cancelled:
+                return False
+            self.conn = conn
+            return True
+
+    def release(self):
+        with self.lock:
+            self.conn = None
+
+
+class QueryExecutor:
+    # 読み取りは専用スレッドの読み取り専用接続で、書き込みは単一スレッドで順番に実行する
+    def __init__(self, db_manager, max_workers=2, poll_interval=30):
+        self.db_manager = db_manager
+        self.read_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db-read')
+        self.write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-write')
+        self.local = threading.local()
+        self.connections = []
+        self.latest = {}
+        self.lock = threading.Lock()
+        self.results = queue.Queue()
+        self.poll_interval = poll_interval
+        self.master = None
+        self.logger = logging.getLogger(__name__)
+
+    def read_connection(self):
+        # 呼び出し元スレッド専用の読み取り接続（共有接続のロックを待たない）
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.db_manager.open_read_connection()
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def submit_read(self, query, *args, key=None, **kwargs):
+        # query は conn 引数を受け取る DatabaseManager の読み取りメソッド
+        request = QueryRequest(key)
+        if key is not None:
+            with self.lock:
+                previous = self.latest.get(key)
+                self.latest[key] = request
+            if previous is not None:
+                previous.cancel()
+        request.future = self.read_pool.submit(self._run_read, request, query, args, kwargs)
+        return request
+
+    def _run_read(self, request, query, args, kwargs):
+        conn = self.read_connection()
+        if not request.acquire(conn):
+            raise CancelledError()
+        try:
+            return query(*args, conn=conn, **kwargs)
+        except sqlite3.OperationalError:
+            if request.cancelled:
+                raise CancelledError()
+            raise
+        finally:
+            request.release()
+
+    def submit_write(self, func, *args, **kwargs):
+        return self.write_pool.submit(func, *args, **kwargs)
+
+    def cancel(self, key):
+        with self.lock:
+            request = self.latest.pop(key, None)
+        if request is not None:
+            request.cancel()
+
+    def is_latest(self, request):
+        return request.key is None or self.latest.get(request.key) is request
+
+    def attach(self, master):
+        # 結果は after() でポーリングして Tk のメインスレッドで受け渡す
+        self.master = master
+        self._poll_results()
+
+    def _poll_results(self):
+        while True:
+            try:
+                callback, args = self.results.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                self.logger.error(f"Error in query callback: {e}")
+        self.master.after(self.poll_interval, self._poll_results)
+
+    def run_in_tk(self, key, query, *args, on_result, on_error=None, **kwargs):
+        request = self.submit_read(query, *args, key=key, **kwargs)
+
+        def deliver(callback, value):
+            # 受け渡しの時点で新しいリクエストに置き換わっていれば捨てる
+            if not request.cancelled and self.is_latest(request):
+                callback(value)
+
+        def done(future):
+            if future.cancelled() or request.cancelled:
+                return
+            error = future.exception()
+            if error is None:
+                self.results.put((deliver, (on_result, future.result())))
+            elif isinstance(error, CancelledError):
+                return
+            elif on_error is not None:
+                self.results.put((deliver, (on_error, error)))
+            else:
+                self.logger.error(f"Query {key} failed: {error}")
+
+        request.future.add_done_callback(done)
+        return request
+
+    def shutdown(self):
+        with self.lock:
+            requests = list(self.latest.values())
+            self.latest.clear()
+        for request in requests:
+            request.cancel()
+        self.read_pool.shutdown(wait=True)
+        self.write_pool.shutdown(wait=True)
+        for conn in self.connections:
+            conn.close()
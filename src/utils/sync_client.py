@@ -0,0 +1,152 @@
+import gzip
+import json
+import logging
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+# 同じデバイス・同じセッション範囲からは常に同じバッチIDが生成されるようにする
+BATCH_NAMESPACE = uuid.UUID('6f1c2a4e-8d0b-4c5e-9a7f-3b2d1e0c9f84')
+
+# 4xx のうち、時間をおけば受け付けられる可能性があるもの（それ以外の 4xx は再送しない）
+RETRYABLE_STATUSES = (408, 429)
+
+
+def encode_batch(records):
+    lines = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) for record in records)
+    return gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'))
+
+
+def decode_batch(payload):
+    text = gzip.decompress(payload).decode('utf-8')
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class SyncClient:
+    def __init__(self, db_manager, server_url, device_id=None, interval=60,
+                 batch_size=100, base_backoff=5, max_backoff=3600, timeout=10):
+        self.db_manager = db_manager
+        self.server_url = server_url.rstrip('/')
+        self.device_id = device_id or socket.gethostname()
+        self.interval = interval
+        self.batch_size = batch_size
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.running = False
+        self.sync_thread = None
+        self.stop_event = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    def collect(self):
+        # 終了済みセッションをバッチにまとめて送信待ちキュー（pomodoro.db）に積む
+        enqueued = 0
+        last_session_id = self.db_manager.get_last_enqueued_session_id()
+        while True:
+            sessions, app_usage = self.db_manager.get_closed_sessions_after(last_session_id, self.batch_size)
+            if not sessions:
+                break
+            first_session_id = sessions[0][0]
+            last_session_id = sessions[-1][0]
+            records = []
+            for session_id, session_type, start_time, end_time in sessions:
+                records.append({
+                    'type': 'session',
+                    'session_id': session_id,
+                    'session_type': session_type,
+                    'start_time': str(start_time),
+                    'end_time': str(end_time),
+                })
+            for session_id, app_name, window_name, duration in app_usage:
+                records.append({
+                    'type': 'app_usage',
+                    'session_id': session_id,
+                    'app_name': app_name,
+                    'window_name': window_name,
+                    'duration': duration,
+                })
+            batch_id = str(uuid.uuid5(BATCH_NAMESPACE, f"{self.device_id}:{first_session_id}-{last_session_id}"))
+            self.db_manager.enqueue_sync_batch(batch_id, last_session_id, encode_batch(records))
+            enqueued += 1
+        return enqueued
+
+    def flush(self):
+        # 送信待ちのバッチを古い順に送る。失敗したバッチは指数バックオフで再送を遅らせる
+        sent = 0
+        for batch_id, payload, attempts in self.db_manager.get_pending_sync_batches(time.time()):
+            try:
+                self.push_batch(batch_id, bytes(payload))
+            except urllib.error.HTTPError as e:
+                if 400 <= e.code < 500 and e.code not in RETRYABLE_STATUSES:
+                    # サーバーが受け付けないバッチは何度送っても同じなので、失敗したバッチとして取り除き後続を送る
+                    self.db_manager.mark_sync_batch_rejected(batch_id, f"HTTP {e.code}: {self._error_detail(e)}")
+                    self.logger.error(f"Sync batch {batch_id} was rejected with HTTP {e.code}, moved to failed batches")
+                    continue
+                self._schedule_retry(batch_id, attempts, e)
+                break
+            except (urllib.error.URLError, OSError) as e:
+                self._schedule_retry(batch_id, attempts, e)
+                break  # サーバーに届かない間は残りのバッチも送らない
+            self.db_manager.mark_sync_batch_sent(batch_id)
+            sent += 1
+        return sent
+
+    def _schedule_retry(self, batch_id, attempts, error):
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempts))
+        delay *= random.uniform(0.5, 1.0)
+        self.db_manager.mark_sync_batch_failed(batch_id, time.time() + delay)
+        self.logger.warning(f"Failed to push sync batch {batch_id} (attempt {attempts + 1}): {error}, retry in {delay:.0f}s")
+
+    @staticmethod
+    def _error_detail(error):
+        try:
+            return json.loads(error.read().decode('utf-8')).get('error') or error.reason
+        except (OSError, ValueError, AttributeError):
+            return error.reason
+
+    def push_batch(self, batch_id, payload):
+        request = urllib.request.Request(
+            f"{self.server_url}/batches",
+            data=payload,
+            method='POST',
+            headers={
+                'Content-Type': 'application/x-ndjson',
+                'Content-Encoding': 'gzip',
+                'X-Batch-Id': batch_id,
+                'X-Device-Id': self.device_id,
+            },
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            result = json.loads(response.read().decode('utf-8'))
+        self.logger.debug(f"Pushed sync batch {batch_id}: {result.get('status')}")
+        return result
+
+    def sync(self):
+        self.collect()
+        return self.flush()
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.stop_event.clear()
+            self.sync_thread = threading.Thread(target=self._run_sync, daemon=True)
+            self.sync_thread.start()
+
+    def stop(self):
+        self.running = False
+        self.stop_event.set()
+        if self.sync_thread:
+            self.sync_thread.join(timeout=self.timeout)
+            self.sync_thread = None
+
+    def _run_sync(self):
+        while self.running:
+            try:
+                self.sync()
+            except Exception as e:
+                self.logger.error(f"Error in sync loop: {e}")
+            self.stop_event.wait(self.interval)
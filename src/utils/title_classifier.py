@@ -0,0 +1,80 @@
+import functools
+import json
+import logging
+import os
+import re
+
+UNCATEGORIZED = '未分類'
+
+# 区切り文字。アプリ名とウィンドウ名を1つの文字列にまとめてから照合する
+SEPARATOR = '\x1f'
+
+DEFAULT_RULES = {
+    'rules': [
+        {'category': '開発', 'app': 'Code|pycharm64|idea64|devenv|WindowsTerminal|cmd|powershell'},
+        {'category': '開発', 'title': 'GitHub|Stack Overflow|localhost'},
+        {'category': '動画', 'title': 'YouTube|Netflix|ニコニコ'},
+        {'category': 'SNS', 'title': r'Twitter|\bX\b|Facebook|Instagram'},
+        {'category': 'コミュニケーション', 'app': 'slack|Teams|Zoom|OUTLOOK|Discord'},
+        {'category': 'ドキュメント', 'app': 'WINWORD|EXCEL|POWERPNT|Notepad|notepad'},
+    ]
+}
+
+
+class TitleClassifier:
+    # ルールを1つの正規表現にまとめ、アプリ名・ウィンドウ名ごとの分類結果をLRUでキャッシュする
+    def __init__(self, rules_file='classification_rules.json', cache_size=4096):
+        self.rules_file = os.path.join(os.path.dirname(__file__), '..', '..', 'data', rules_file)
+        self.cache_size = cache_size
+        self.logger = logging.getLogger(__name__)
+        self.reload()
+
+    def load_rules(self):
+        if not os.path.exists(self.rules_file):
+            os.makedirs(os.path.dirname(self.rules_file), exist_ok=True)
+            with open(self.rules_file, 'w', encoding='utf-8') as f:
+                json.dump(DEFAULT_RULES, f, indent=4, ensure_ascii=False)
+            return DEFAULT_RULES['rules']
+        try:
+            with open(self.rules_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get('rules', [])
+        except json.JSONDecodeError as e:
+            self.logger.error(f"Failed to parse classification rules: {e}")
+            return []
+
+    def reload(self):
+        self.rules = []
+        alternatives = []
+        for rule in self.load_rules():
+            app_pattern = rule.get('app', f'[^{SEPARATOR}]*')
+            title_pattern = rule.get('title', '')
+            alternative = f"(?:{app_pattern}){SEPARATOR}.*?(?:{title_pattern})"
+            try:
+                re.compile(alternative)
+            except re.error as e:
+                self.logger.error(f"Skipping invalid classification rule {rule}: {e}")
+                continue
+            alternatives.append(f"(?P<r{len(self.rules)}>{alternative})")
+            self.rules.append(rule)
+        # ルールは先頭から優先される（先にマッチした選択肢が採用される）
+        self.matchers = []
+        if alternatives:
+            try:
+                self.matchers = [re.compile(f"^(?:{'|'.join(alternatives)})", re.IGNORECASE)]
+            except re.error as e:
+                # 個別には正しいルールでも、同じ名前付きグループを使うルール同士はまとめられない。
+                # その場合はルールごとの正規表現を順に試す
+                self.logger.warning(f"Could not combine classification rules, matching them one by one: {e}")
+                self.matchers = [re.compile(f"^(?:{alternative})", re.IGNORECASE) for alternative in alternatives]
+        self.classify = functools.lru_cache(maxsize=self.cache_size)(self._classify)
+
+    def _classify(self, app_name, window_name):
+        text = f"{app_name}{SEPARATOR}{window_name}"
+        for matcher in self.matchers:
+            match = matcher.match(text)
+            if match is not None:
+                return self.rules[int(match.lastgroup[1:])]['category']
+        return UNCATEGORIZED
+
+    def categories(self):
+        return sorted({rule['category'] for rule in self.rules}) + [UNCATEGORIZED]
@@ -0,0 +1,124 @@
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+HOURS_PER_WEEK = 7 * 24
+EPOCH = date(1970, 1, 1)
+
+
+def day_ms(day):
+    return (day - EPOCH).days * DAY_MS
+
+
+def unpack_timelines(timelines):
+    # DatabaseManager.get_session_timelines の結果を、条件に合う行の開始ミリ秒と長さミリ秒の配列にする。
+    # 行の開始時刻は started_at。それがない古い行は、セッションの開始時刻 + 同じセッションでそれより前の行の合計時間
+    import numpy as np
+
+    timelines = [(start_ms, packed) for start_ms, packed in timelines if packed]
+    if not timelines:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    counts = np.fromiter(((packed.count(',') + 1) // 2 for _, packed in timelines), dtype=np.int64, count=len(timelines))
+    session_starts = np.fromiter((start_ms for start_ms, _ in timelines), dtype=np.int64, count=len(timelines))
+    values = np.fromstring(','.join(packed for _, packed in timelines), dtype=np.int64, sep=',').reshape(-1, 2)
+    started_at = values[:, 0]
+    durations = values[:, 1] >> 1
+    matched = (values[:, 1] & 1).astype(bool)
+
+    owner = np.repeat(np.arange(len(timelines)), counts)
+    elapsed = np.cumsum(durations) - durations
+    first_rows = np.cumsum(counts) - counts
+    starts = np.where(started_at >= 0, started_at, session_starts[owner] + elapsed - elapsed[first_rows][owner])
+    return starts[matched], durations[matched]
+
+
+def bin_weekly(starts, durations, first_monday, week_count, clip_start_ms=None, clip_end_ms=None):
+    # 開始ミリ秒・長さミリ秒の区間を、first_monday から week_count 週分の (週, 曜日, 時) の分数に振り分ける。
+    # 時の境目をまたぐ区間は時ごとの断片に分け、行ごとの Python ループを使わず NumPy でまとめて集計する
+    import numpy as np
+
+    week_start = day_ms(first_monday)
+    lower = week_start if clip_start_ms is None else max(week_start, clip_start_ms)
+    upper = week_start + week_count * 7 * DAY_MS
+    if clip_end_ms is not None:
+        upper = min(upper, clip_end_ms)
+
+    ends = np.minimum(starts + durations, upper)
+    starts = np.maximum(starts, lower)
+    keep = ends > starts
+    starts = starts[keep]
+    ends = ends[keep]
+
+    first_hour = starts // HOUR_MS
+    pieces = (ends - 1) // HOUR_MS - first_hour + 1
+    owner = np.repeat(np.arange(len(starts)), pieces)
+    # 各断片が区間の何番目の時か (0, 1, 2, ...)
+    offset = np.arange(len(owner)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    hour = first_hour[owner] + offset
+    minutes = (np.minimum(ends[owner], (hour + 1) * HOUR_MS) - np.maximum(starts[owner], hour * HOUR_MS)) / 60000
+    # first_monday の0時からの経過時間が、そのまま (週, 曜日, 時) の通し番号になる
+    cells = hour - week_start // HOUR_MS
+    totals = np.bincount(cells, weights=minutes, minlength=week_count * HOURS_PER_WEEK)
+    return totals.reshape(week_count, 7, 24)
+
+
+class UsageHeatmap:
+    # 曜日 × 時間帯 (7×24) の作業時間（分）。終わった ISO 週の行列はアプリ・分類の条件ごとにキャッシュし、
+    # 足りない週だけを1回のクエリでまとめて集計する（今週と、期間の端で一部だけ含まれる週はキャッシュしない）
+    def __init__(self, db_manager, cache_size=1024):
+        self.db_manager = db_manager
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+    def matrix(self, start_date, end_date, app_name=None, category=None, today=None, conn=None):
+        import numpy as np
+
+        today = today or datetime.now().date()
+        current_monday = today - timedelta(days=today.weekday())
+        first_monday = start_date - timedelta(days=start_date.weekday())
+        weeks = [first_monday + timedelta(weeks=i) for i in range((end_date - first_monday).days // 7 + 1)]
+        cacheable = [start_date <= week and week + timedelta(days=6) <= end_date and week < current_monday
+                     for week in weeks]
+
+        result = np.zeros((7, 24))
+        missing = []
+        with self.lock:
+            for i, week in enumerate(weeks):
+                key = (week, app_name, category)
+                if cacheable[i] and key in self.cache:
+                    self.cache.move_to_end(key)
+                    result += self.cache[key]
+                else:
+                    missing.append(i)
+        if not missing:
+            return result
+
+        # 足りない週は連続する範囲ごとにまとめて読む（期間の両端の週だけが足りない場合に1年分を読み直さない）
+        runs = []
+        for i in missing:
+            if runs and runs[-1][1] == i - 1:
+                runs[-1][1] = i
+            else:
+                runs.append([i, i])
+        for first, last in runs:
+            # 前の日に始まって日をまたいだセッションの分も入るよう、1日前に始まったセッションから読む
+            timelines = self.db_manager.get_session_timelines(weeks[first] - timedelta(days=1), weeks[last] + timedelta(days=6),
+                                                              app_name, category, conn=conn)
+            starts, durations = unpack_timelines(timelines)
+            matrices = bin_weekly(starts, durations, weeks[first], last - first + 1,
+                                  day_ms(start_date), day_ms(end_date + timedelta(days=1)))
+            result += matrices.sum(axis=0)
+            with self.lock:
+                for i in range(first, last + 1):
+                    if cacheable[i]:
+                        self.cache[(weeks[i], app_name, category)] = matrices[i - first]
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return result
@@ -1,10 +1,13 @@
 import ctypes
 import ctypes.wintypes
 import time
+import threading
 import logging
+from datetime import datetime, timedelta
+from utils.live_aggregator import LiveAggregator
 
 class WindowTracker:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, poll_interval=0.25):
         self.user32 = ctypes.windll.user32
         self.kernel32 = ctypes.windll.kernel32
         self.psapi = ctypes.windll.psapi
@@ -13,6 +16,15 @@ class WindowTracker:
         self.logger = logging.getLogger(__name__)
         self.current_session_id = None
         self.current_pomodoro_id = None
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        # 計測中のウィンドウ（flush と監視ループの両方から触るためロックで守る）
+        self.state_lock = threading.Lock()
+        self.tracking_session_id = None
+        self.last_window_info = None
+        self.window_started_at = None
+        # 計測中のセッションのアプリ別・ウィンドウ別合計（GUI は DB を読まずにここから表示する）
+        self.aggregator = LiveAggregator()
 
     def get_active_window_info(self):
         hwnd = self.user32.GetForegroundWindow()
@@ -42,30 +54,91 @@ class WindowTracker:
         self.current_pomodoro_id = pomodoro_id
         self.logger.debug(f"Started tracking for session {self.current_session_id}, pomodoro {self.current_pomodoro_id}")
         self.running = True
-        last_window_info = None
-        start_time = time.time()
+        self.stop_event.clear()
+        with self.state_lock:
+            self.tracking_session_id = session_id
+            self.last_window_info = None
+            self.window_started_at = time.monotonic()
+            self.aggregator.open(session_id)
 
         while self.running:
             window_info = self.get_active_window_info()
             
-            if window_info != last_window_info:
-                if last_window_info:
-                    duration = int(time.time() - start_time)
-                    if self.current_session_id:  # セッションIDがNoneでないことを確認
-                        self.db_manager.record_activity(self.current_session_id, last_window_info['app_name'], last_window_info['window_name'], duration)
-                        self.logger.debug(f"Recorded activity: {last_window_info['app_name']}, {last_window_info['window_name']}, {duration}s for session {self.current_session_id}")
-                    else:
-                        self.logger.warning("Attempted to record activity but session_id is None")
-                
-                last_window_info = window_info
-                start_time = time.time()
+            with self.state_lock:
+                if window_info != self.last_window_info:
+                    now = time.monotonic()
+                    # close_session の後は、次のセッションで start_tracking し直すまで記録しない
+                    if self.last_window_info and self.tracking_session_id:
+                        self._record(self.last_window_info, now - self.window_started_at)
+                    self.last_window_info = window_info
+                    self.window_started_at = now
             
-            time.sleep(1)  # 1秒ごとにチェック
+            self.stop_event.wait(self.poll_interval)
 
-        self.logger.debug(f"Stopped tracking for session {self.current_session_id}")
+        # 停止時に、計測中だったウィンドウの時間も記録する
+        self.flush()
+        with self.state_lock:
+            self.last_window_info = None
+        self.logger.debug(f"Stopped tracking for session {session_id}")
+
+    def flush(self):
+        # 計測中のウィンドウの経過時間をここまでの分として記録し、計測を続ける
+        with self.state_lock:
+            if self.last_window_info and self.tracking_session_id:
+                now = time.monotonic()
+                self._record(self.last_window_info, now - self.window_started_at)
+                self.window_started_at = now
+
+    def close_session(self, session_id):
+        # セッション終了時に記録先を外し、(計測中だったウィンドウの記録, メモリ上の合計) を返す。
+        # 計測中のウィンドウはメモリ上の合計には足すが、DB への記録は呼び出し側（タイマーのスレッドの外）で行う。
+        # ロックの中で行うので、監視ループが終了後のセッションに書き込むことはない
+        with self.state_lock:
+            pending = None
+            if self.tracking_session_id == session_id:
+                if self.last_window_info:
+                    duration = time.monotonic() - self.window_started_at
+                    pending = (session_id, self.last_window_info['app_name'], self.last_window_info['window_name'],
+                               duration, datetime.now() - timedelta(seconds=duration))
+                    self.aggregator.add(session_id, self.last_window_info['app_name'],
+                                        self.last_window_info['window_name'], int(round(duration * 1000)))
+                self.tracking_session_id = None
+                self.last_window_info = None
+            return pending, self.aggregator.close(session_id)
+
+    def open_session(self, session_id):
+        # 監視ループを止めずに、記録先を次のセッションに切り替える（start_tracking の開始時と同じ状態にする）
+        with self.state_lock:
+            self.current_session_id = session_id
+            self.tracking_session_id = session_id
+            self.last_window_info = None
+            self.window_started_at = time.monotonic()
+            self.aggregator.open(session_id)
+        self.logger.debug(f"Switched tracking to session {session_id}")
+
+    def live_snapshot(self):
+        # 記録済みの合計に、計測中のウィンドウのここまでの時間を足した状態を返す
+        with self.state_lock:
+            pending = None
+            if self.last_window_info and self.tracking_session_id:
+                pending = (self.last_window_info['app_name'], self.last_window_info['window_name'],
+                           int(round((time.monotonic() - self.window_started_at) * 1000)))
+            return self.aggregator.snapshot(pending)
+
+    def _record(self, window_info, duration):
+        if self.tracking_session_id:  # セッションIDがNoneでないことを確認
+            # 区間は今終わったところなので、開始時刻は今から duration 前（一時停止をまたいでも実際の時刻になる）
+            self.db_manager.record_activity(self.tracking_session_id, window_info['app_name'], window_info['window_name'],
+                                            duration, datetime.now() - timedelta(seconds=duration))
+            self.aggregator.add(self.tracking_session_id, window_info['app_name'], window_info['window_name'],
+                                int(round(duration * 1000)))
+            self.logger.debug(f"Recorded activity: {window_info['app_name']}, {window_info['window_name']}, {duration:.3f}s for session {self.tracking_session_id}")
+        else:
+            self.logger.warning("Attempted to record activity but session_id is None")
 
     def stop_tracking(self):
         self.running = False
+        self.stop_event.set()
         self.logger.debug("Received stop tracking signal")
         self.current_session_id = None
         self.current_pomodoro_id = None